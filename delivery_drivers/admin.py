@@ -1,6 +1,8 @@
 from django.contrib import admin
 from unfold.admin import ModelAdmin as UnflodModelAdmin
-from .models import DeliveryDriver, DeliveryOrder
+from .models import DeliveryDriver, DeliveryOrder, DeliveryOrderRemoval, DriverLocation
 
 admin.site.register(DeliveryDriver, UnflodModelAdmin)
 admin.site.register(DeliveryOrder, UnflodModelAdmin)
+admin.site.register(DeliveryOrderRemoval, UnflodModelAdmin)
+admin.site.register(DriverLocation, UnflodModelAdmin)
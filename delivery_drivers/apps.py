@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class DeliveryDriversConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'delivery_drivers'
+
+    def ready(self):
+        # Registers the receivers that keep driver loads and the dispatch
+        # index current, and the deployment check for a shared cache
+        from delivery_drivers import checks, dispatch  # noqa: F401
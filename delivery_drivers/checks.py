@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Backends whose contents are private to each worker process
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@register(deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if settings.CACHES["default"]["BACKEND"] in PROCESS_LOCAL_CACHES:
+        return [
+            Warning(
+                "The default cache is not shared between worker processes.",
+                hint=(
+                    "Live driver locations and the dispatch index are kept in the "
+                    "cache; with more than one worker set CACHE_BACKEND and "
+                    "CACHE_LOCATION to a shared cache such as Redis."
+                ),
+                id="delivery_drivers.W001",
+            )
+        ]
+    return []
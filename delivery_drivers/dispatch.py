@@ -0,0 +1,225 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from restaurant_app.models import Order
+from .models import DeliveryDriver, DeliveryOrder, DeliveryOrderRemoval
+
+# Orders that keep a driver busy. Each driver's count is kept in
+# DeliveryDriver.active_orders by single UPDATE statements, so status
+# changes no longer need existence queries. Assigned orders the driver has
+# not accepted yet are counted in pending_orders the same way.
+ACTIVE_STATUSES = ("accepted", "in_progress")
+
+INDEX_KEY = "delivery_drivers:dispatch_index"
+
+
+def load_index():
+    """
+    Available drivers as dicts of id, active_orders, pending_orders and
+    last_dispatched_at.
+    """
+    drivers = cache.get(INDEX_KEY)
+    if drivers is None:
+        drivers = list(
+            DeliveryDriver.objects.filter(is_active=True, is_available=True)
+            .order_by("id")
+            .values("id", "active_orders", "pending_orders", "last_dispatched_at")
+        )
+        cache.set(INDEX_KEY, drivers, settings.DELIVERY_DISPATCH_INDEX_TIMEOUT)
+    return drivers
+
+
+def invalidate_index():
+    cache.delete(INDEX_KEY)
+
+
+def _dispatch_order(driver):
+    # Drivers never dispatched to come first
+    last = driver["last_dispatched_at"]
+    return (last is not None, last or 0, driver["id"])
+
+
+def least_loaded(drivers):
+    """
+    Fewest active and pending orders first; ties go to the driver idle the
+    longest.
+    """
+    return sorted(
+        drivers,
+        key=lambda driver: (
+            driver["active_orders"] + driver["pending_orders"],
+            _dispatch_order(driver),
+        ),
+    )
+
+
+def round_robin(drivers):
+    """Take turns in the order drivers were last dispatched to."""
+    return sorted(drivers, key=_dispatch_order)
+
+
+POLICIES = {
+    "least_loaded": least_loaded,
+    "round_robin": round_robin,
+}
+
+
+def get_policy():
+    """
+    The configured policy, or None when orders are assigned by hand. A
+    policy takes the index entries and returns them in preference order.
+    """
+    name = settings.DELIVERY_DISPATCH_POLICY
+    if not name or name == "manual":
+        return None
+    if name in POLICIES:
+        return POLICIES[name]
+    return import_string(name)
+
+
+def dispatch(delivery_order):
+    """
+    Assign ``delivery_order`` to the first driver the policy picks who is
+    still available, and return the order's driver id (None if nobody is).
+
+    Candidates come from the cached index; each one is claimed with a
+    conditional UPDATE, so concurrent workers working from the same index
+    can never hand an order to a driver who has gone off duty meanwhile.
+    The order itself is claimed the same way, so it is assigned only once
+    however many workers dispatch it.
+    """
+    policy = get_policy()
+    if policy is None or delivery_order.driver_id is not None:
+        return delivery_order.driver_id
+    # Drivers with a full queue of pending orders are skipped like ones who
+    # went off duty, and come back once the index is reloaded
+    capacity = {}
+    if settings.DELIVERY_DISPATCH_MAX_PENDING:
+        capacity["pending_orders__lt"] = settings.DELIVERY_DISPATCH_MAX_PENDING
+    drivers = load_index()
+    stale = set()
+    assigned = None
+    for driver in policy(drivers):
+        now = timezone.now()
+        claimed = DeliveryDriver.objects.filter(
+            pk=driver["id"], is_active=True, is_available=True, **capacity
+        ).update(last_dispatched_at=now)
+        if not claimed:
+            stale.add(driver["id"])
+            continue
+        driver["last_dispatched_at"] = now
+        assigned = driver
+        break
+
+    def save_index():
+        cache.set(
+            INDEX_KEY,
+            [driver for driver in drivers if driver["id"] not in stale],
+            settings.DELIVERY_DISPATCH_INDEX_TIMEOUT,
+        )
+
+    if assigned is None:
+        save_index()
+        return None
+
+    if not DeliveryOrder.objects.filter(pk=delivery_order.pk, driver__isnull=True).update(
+        driver_id=assigned["id"], updated_at=timezone.now()
+    ):
+        # Another worker assigned the order first
+        save_index()
+        delivery_order.refresh_from_db(fields=["driver", "status", "updated_at"])
+        return delivery_order.driver_id
+
+    delivery_order.driver_id = assigned["id"]
+    field = load_field(assigned["id"], delivery_order.status)
+    shift_load((None, delivery_order.status), (assigned["id"], delivery_order.status), invalidate=False)
+    # The cached index is kept and given the new load instead
+    if field:
+        assigned[field] += 1
+    save_index()
+    Order.objects.filter(pk=delivery_order.order_id).update(delivery_driver_id=assigned["id"])
+    return assigned["id"]
+
+
+def load_field(driver_id, status):
+    """The driver counter an order in ``status`` adds to, if any."""
+    if driver_id is None:
+        return None
+    if status in ACTIVE_STATUSES:
+        return "active_orders"
+    if status == "pending":
+        return "pending_orders"
+    return None
+
+
+def shift_load(previous, current, invalidate=True):
+    """Move one unit of load between drivers for a (driver id, status) change."""
+    before, after = load_field(*previous), load_field(*current)
+    if (previous[0], before) == (current[0], after):
+        return
+    if before:
+        DeliveryDriver.objects.filter(pk=previous[0], **{f"{before}__gt": 0}).update(
+            **{before: F(before) - 1}
+        )
+    if after:
+        DeliveryDriver.objects.filter(pk=current[0]).update(**{after: F(after) + 1})
+    if (before or after) and invalidate:
+        invalidate_index()
+
+
+def rebuild_loads():
+    """Recount every driver's active and pending orders from the delivery orders."""
+    drivers = {
+        pk: DeliveryDriver(pk=pk, active_orders=0, pending_orders=0)
+        for pk in DeliveryDriver.objects.values_list("id", flat=True)
+    }
+    for driver_id, status in DeliveryOrder.objects.filter(
+        driver__isnull=False, status__in=(*ACTIVE_STATUSES, "pending")
+    ).values_list("driver_id", "status"):
+        field = load_field(driver_id, status)
+        setattr(drivers[driver_id], field, getattr(drivers[driver_id], field) + 1)
+    DeliveryDriver.objects.bulk_update(
+        drivers.values(), ["active_orders", "pending_orders"], batch_size=500
+    )
+    invalidate_index()
+    return len(drivers)
+
+
+def stored_assignment(delivery_order):
+    return (
+        DeliveryOrder.objects.filter(pk=delivery_order.pk).values_list("driver_id", "status").first()
+    )
+
+
+@receiver(pre_save, sender=DeliveryOrder)
+@receiver(pre_delete, sender=DeliveryOrder)
+def remember_assignment(sender, instance, **kwargs):
+    # Read from the row, as the instance may be older than what is stored
+    instance._stored_assignment = stored_assignment(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=DeliveryOrder)
+def apply_assignment(sender, instance, **kwargs):
+    previous = getattr(instance, "_stored_assignment", None) or (None, None)
+    shift_load(previous, (instance.driver_id, instance.status))
+    if previous[0] is not None and previous[0] != instance.driver_id:
+        # Gone from the previous driver's list
+        DeliveryOrderRemoval.objects.create(delivery_order_id=instance.pk, driver_id=previous[0])
+
+
+@receiver(post_delete, sender=DeliveryOrder)
+def release_assignment(sender, instance, **kwargs):
+    stored = getattr(instance, "_stored_assignment", None)
+    if stored is not None:
+        shift_load(stored, (None, None))
+        DeliveryOrderRemoval.objects.create(delivery_order_id=instance.pk, driver_id=stored[0])
+
+
+@receiver(post_save, sender=DeliveryDriver)
+@receiver(post_delete, sender=DeliveryDriver)
+def driver_changed(sender, **kwargs):
+    invalidate_index()
@@ -0,0 +1,137 @@
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from .models import DeliveryDriver, DriverLocation
+
+logger = logging.getLogger(__name__)
+
+# Pings are never saved one at a time: the latest position per driver goes
+# to the cache, where every worker can read it, and the history waits in a
+# bounded in-process ring buffer until the flusher thread writes it out with
+# one bulk_create. The history is best effort: a worker that is killed loses
+# the pings it had not written yet, and a full buffer drops the oldest.
+
+LOCATION_KEY = "delivery_drivers:location:{}"
+
+_buffer = None
+_lock = threading.Lock()
+_wake = threading.Event()
+_flusher = None
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = deque(maxlen=settings.DRIVER_LOCATION_BUFFER_SIZE)
+    return _buffer
+
+
+def record_pings(driver_id, pings):
+    """
+    Buffer validated pings (latitude, longitude, recorded_at and optional
+    accuracy) for one driver and publish the newest as their position.
+    """
+    if not pings:
+        return
+    rows = [DriverLocation(driver_id=driver_id, **ping) for ping in pings]
+    latest = max(pings, key=lambda ping: ping["recorded_at"])
+    current = cache.get(LOCATION_KEY.format(driver_id))
+    if current is None or current["recorded_at"] <= latest["recorded_at"]:
+        cache.set(
+            LOCATION_KEY.format(driver_id),
+            {"driver": driver_id, **latest},
+            settings.DRIVER_LOCATION_TTL,
+        )
+
+    buffer = get_buffer()
+    with _lock:
+        dropped = max(0, len(buffer) + len(rows) - buffer.maxlen)
+        buffer.extend(rows)
+        pending = len(buffer)
+    if dropped:
+        logger.warning("Driver location buffer full, dropped %s pings", dropped)
+    start_flusher()
+    if pending >= settings.DRIVER_LOCATION_FLUSH_SIZE:
+        _wake.set()
+
+
+def latest_positions(driver_ids):
+    """Latest cached position of each driver that reported within the TTL."""
+    keys = {LOCATION_KEY.format(driver_id): driver_id for driver_id in driver_ids}
+    found = cache.get_many(keys)
+    return [found[key] for key in keys if key in found]
+
+
+def flush():
+    """Write every buffered ping to the database; returns how many."""
+    buffer = get_buffer()
+    with _lock:
+        rows = list(buffer)
+        buffer.clear()
+    if not rows:
+        return 0
+    try:
+        DriverLocation.objects.bulk_create(rows, batch_size=settings.DRIVER_LOCATION_FLUSH_SIZE)
+    except Exception:
+        # Never let one bad batch stop the flusher; keep the rows for the next
+        # flush unless their driver is gone, which would fail every retry
+        logger.exception("Could not write %s driver locations", len(rows))
+        requeue(rows)
+        return 0
+    return len(rows)
+
+
+def requeue(rows):
+    """Put unwritten rows back ahead of the pings buffered since."""
+    try:
+        drivers = set(
+            DeliveryDriver.objects.filter(
+                pk__in={row.driver_id for row in rows}
+            ).values_list("pk", flat=True)
+        )
+        rows = [row for row in rows if row.driver_id in drivers]
+    except Exception:
+        logger.exception("Could not check drivers of unwritten locations")
+    buffer = get_buffer()
+    with _lock:
+        pending = rows + list(buffer)
+        buffer.clear()
+        buffer.extend(pending)
+        dropped = len(pending) - len(buffer)
+    if dropped:
+        logger.warning("Driver location buffer full, dropped %s pings", dropped)
+
+
+def run_flusher():
+    while True:
+        _wake.wait(settings.DRIVER_LOCATION_FLUSH_INTERVAL)
+        _wake.clear()
+        started = time.monotonic()
+        try:
+            written = flush()
+        finally:
+            # The flusher opens its own connection; release it between batches
+            connection.close()
+        if written:
+            logger.debug(
+                "Wrote %s driver locations in %.3fs", written, time.monotonic() - started
+            )
+
+
+def start_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(
+                target=run_flusher, name="driver-locations", daemon=True
+            )
+            _flusher.start()
+            # Write out what is still buffered when the worker shuts down
+            atexit.register(flush)
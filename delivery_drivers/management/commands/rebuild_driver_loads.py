@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from delivery_drivers.dispatch import rebuild_loads
+
+
+class Command(BaseCommand):
+    help = "Recount each delivery driver's active and pending orders from the delivery orders."
+
+    def handle(self, *args, **options):
+        count = rebuild_loads()
+        self.stdout.write(self.style.SUCCESS(f"Active and pending orders recounted for {count} drivers."))
@@ -1,8 +1,9 @@
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from django.contrib.auth import get_user_model
-from restaurant_app.models import Order
+from restaurant_app.models import Order, OrderItem
 
 User = get_user_model()
 
@@ -13,10 +14,26 @@ class DeliveryDriver(models.Model):
     )
     is_active = models.BooleanField(default=False)
     is_available = models.BooleanField(default=False)
+    # Maintained by delivery_drivers.dispatch with UPDATE statements
+    active_orders = models.PositiveIntegerField(default=0)
+    pending_orders = models.PositiveIntegerField(default=0)
+    last_dispatched_at = models.DateTimeField(null=True, blank=True)
+
+    DISPATCH_FIELDS = ("active_orders", "pending_orders", "last_dispatched_at")
 
     class Meta:
         ordering = ("-is_active",)
 
+    def save(self, *args, **kwargs):
+        # Never write back a stale copy of the dispatch counters
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DISPATCH_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user.username} - {'Active' if self.is_active else 'Inactive'}"
 
@@ -47,6 +64,38 @@ class DeliveryOrder(models.Model):
         return f"Order {self.id} - {self.status}"
 
 
+class DeliveryOrderRemoval(models.Model):
+    # A delivery order taken from a driver, by reassignment or deletion, so
+    # updated_since polls can tell clients to drop it. driver is empty for
+    # orders deleted while unassigned.
+    delivery_order_id = models.PositiveIntegerField()
+    driver = models.ForeignKey(
+        DeliveryDriver, on_delete=models.CASCADE, null=True, related_name="removed_orders"
+    )
+    removed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Order {self.delivery_order_id} - {self.driver_id} - {self.removed_at}"
+
+
+class DriverLocation(models.Model):
+    # Written in batches by delivery_drivers.locations
+    driver = models.ForeignKey(
+        DeliveryDriver, on_delete=models.CASCADE, related_name="locations"
+    )
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    accuracy = models.FloatField(null=True, blank=True)
+    recorded_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ("-recorded_at",)
+        indexes = [models.Index(fields=["driver", "recorded_at"])]
+
+    def __str__(self):
+        return f"{self.driver_id} @ {self.latitude},{self.longitude} - {self.recorded_at}"
+
+
 @receiver(post_save, sender=Order)
 def create_delivery_order(sender, instance, created, **kwargs):
     if created and instance.is_delivery_order():
@@ -55,4 +104,19 @@ def create_delivery_order(sender, instance, created, **kwargs):
             driver = DeliveryDriver.objects.filter(
                 id=instance.delivery_driver_id
             ).first()
-        DeliveryOrder.objects.create(order=instance, driver=driver)
+        delivery_order = DeliveryOrder.objects.create(order=instance, driver=driver)
+        if driver is None:
+            from delivery_drivers.dispatch import dispatch
+
+            dispatch(delivery_order)
+    elif instance.is_delivery_order():
+        # Order edits count as changes for updated_since polls
+        DeliveryOrder.objects.filter(order=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def touch_delivery_order(sender, instance, **kwargs):
+    # Item edits change the order a driver carries even when the Order
+    # itself is not saved; bulk_create paths save the Order afterwards
+    DeliveryOrder.objects.filter(order_id=instance.order_id).update(updated_at=timezone.now())
@@ -1,3 +1,4 @@
+from django.utils import timezone
 from rest_framework import serializers
 from .models import DeliveryDriver, DeliveryOrder
 from restaurant_app.serializers import OrderSerializer
@@ -9,7 +10,23 @@ class DeliveryDriverSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = DeliveryDriver
-        fields = ["id", "username", "email", "mobile_number", "is_active", "is_available"]
+        fields = [
+            "id", "username", "email", "mobile_number", "is_active", "is_available",
+            "active_orders", "pending_orders",
+        ]
+        read_only_fields = ["active_orders", "pending_orders"]
+
+
+class DriverLocationSerializer(serializers.Serializer):
+    driver = serializers.IntegerField(read_only=True)
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    accuracy = serializers.FloatField(required=False, allow_null=True)
+    recorded_at = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        data.setdefault("recorded_at", timezone.now())
+        return data
 
 
 class DeliveryOrderSerializer(serializers.ModelSerializer):
@@ -29,6 +46,40 @@ class DeliveryOrderSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["id", "created_at", "updated_at"]
 
+class DriverDeliveryOrderSerializer(serializers.ModelSerializer):
+    """Compact read-only payload for the driver app."""
+
+    invoice_number = serializers.CharField(source="order.invoice_number", read_only=True)
+    customer_name = serializers.CharField(source="order.customer_name", read_only=True)
+    customer_phone_number = serializers.CharField(source="order.customer_phone_number", read_only=True)
+    address = serializers.CharField(source="order.address", read_only=True)
+    total_amount = serializers.DecimalField(
+        source="order.total_amount", max_digits=8, decimal_places=2, read_only=True
+    )
+    payment_method = serializers.CharField(source="order.payment_method", read_only=True)
+    items = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DeliveryOrder
+        fields = [
+            "id",
+            "order_id",
+            "status",
+            "invoice_number",
+            "customer_name",
+            "customer_phone_number",
+            "address",
+            "total_amount",
+            "payment_method",
+            "items",
+            "updated_at",
+        ]
+        read_only_fields = fields
+
+    def get_items(self, obj):
+        return ", ".join(f"{item.quantity} x {item.dish.name}" for item in obj.order.items.all())
+
+
 class DeliveryOrderUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = DeliveryOrder
@@ -1,3 +1,264 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from delivery_drivers import locations
+from delivery_drivers.dispatch import ACTIVE_STATUSES, dispatch
+from delivery_drivers.models import DeliveryDriver, DeliveryOrder, DriverLocation
+from delivery_drivers.views import DeliveryDriverViewSet, DriverLocationRateThrottle
+from restaurant_app.models import Category, Dish, Order, OrderItem, User
 
-# Create your tests here.
+
+class DeliveryTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username="staff", email="staff@example.com", role="staff", passcode="111111"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.drivers = [self.create_driver(i) for i in range(3)]
+
+    def create_driver(self, number, **fields):
+        user = User.objects.create(
+            username=f"driver{number}", email=f"driver{number}@example.com",
+            role="driver", passcode=f"22222{number}",
+        )
+        fields.setdefault("is_active", True)
+        fields.setdefault("is_available", True)
+        return DeliveryDriver.objects.create(user=user, **fields)
+
+    def create_delivery(self, **fields):
+        order = Order.objects.create(
+            user=self.user, total_amount=Decimal("10.00"), order_type="delivery", **fields
+        )
+        return DeliveryOrder.objects.get(order=order)
+
+    def update_status(self, delivery_order, new_status):
+        response = self.client.patch(
+            f"/api/delivery-orders/{delivery_order.pk}/update_status/",
+            {"status": new_status},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+
+class DispatchTests(DeliveryTestCase):
+    def test_least_loaded_spreads_new_orders(self):
+        deliveries = [self.create_delivery() for _ in range(6)]
+        self.assertEqual(
+            [delivery.driver_id for delivery in deliveries], [driver.pk for driver in self.drivers] * 2
+        )
+        order = Order.objects.get(pk=deliveries[0].order_id)
+        self.assertEqual(order.delivery_driver_id, deliveries[0].driver_id)
+
+    def test_order_is_claimed_only_once(self):
+        delivery_order = self.create_delivery()
+        driver_id = delivery_order.driver_id
+        # A second worker holding a stale copy of the unassigned order
+        stale = DeliveryOrder.objects.get(pk=delivery_order.pk)
+        stale.driver_id = None
+        self.assertEqual(dispatch(stale), driver_id)
+        self.assertEqual(DeliveryOrder.objects.get(pk=delivery_order.pk).driver_id, driver_id)
+        self.assertEqual(dispatch(delivery_order), driver_id)
+
+    def test_manual_assignment_and_unavailable_drivers(self):
+        chosen = self.drivers[2]
+        self.assertEqual(self.create_delivery(delivery_driver_id=chosen.pk).driver_id, chosen.pk)
+
+        # Goes off duty without the cached index hearing about it
+        DeliveryDriver.objects.filter(pk=self.drivers[0].pk).update(is_available=False)
+        assigned = {self.create_delivery().driver_id for _ in range(4)}
+        self.assertNotIn(self.drivers[0].pk, assigned)
+
+        with override_settings(DELIVERY_DISPATCH_POLICY="manual"):
+            self.assertIsNone(self.create_delivery().driver_id)
+
+    def test_pending_orders_count_towards_the_load(self):
+        busy = self.drivers[0]
+        for _ in range(3):
+            self.create_delivery(delivery_driver_id=busy.pk)
+        self.assertEqual(DeliveryDriver.objects.get(pk=busy.pk).pending_orders, 3)
+
+        assigned = [self.create_delivery().driver_id for _ in range(6)]
+        self.assertEqual(assigned.count(busy.pk), 0)
+        assigned.append(self.create_delivery().driver_id)
+        self.assertEqual(assigned.count(busy.pk), 1)
+
+    @override_settings(DELIVERY_DISPATCH_MAX_PENDING=2)
+    def test_pending_orders_are_capped_per_driver(self):
+        DeliveryDriver.objects.filter(pk__in=[self.drivers[1].pk, self.drivers[2].pk]).update(
+            is_available=False
+        )
+        deliveries = [self.create_delivery() for _ in range(3)]
+        self.assertEqual(
+            [delivery.driver_id for delivery in deliveries], [self.drivers[0].pk] * 2 + [None]
+        )
+        # Accepting one frees a place in the queue
+        self.update_status(deliveries[0], "accepted")
+        DeliveryDriver.objects.filter(pk=self.drivers[0].pk).update(is_available=True)
+        self.assertEqual(self.create_delivery().driver_id, self.drivers[0].pk)
+
+    def test_active_orders_match_open_deliveries(self):
+        deliveries = [self.create_delivery() for _ in range(6)]
+        self.update_status(deliveries[0], "accepted")
+        self.update_status(deliveries[3], "in_progress")
+        self.update_status(deliveries[1], "accepted")
+        self.update_status(deliveries[1], "delivered")
+        deliveries[4].driver = self.drivers[0]
+        deliveries[4].status = "accepted"
+        deliveries[4].save()
+        deliveries[3].delete()
+        # Saving a copy loaded before a status change puts the old status back
+        stale = DeliveryOrder.objects.get(pk=deliveries[5].pk)
+        self.update_status(deliveries[5], "accepted")
+        stale.save()
+
+        for driver in DeliveryDriver.objects.all():
+            self.assertEqual(
+                driver.active_orders,
+                DeliveryOrder.objects.filter(driver=driver, status__in=ACTIVE_STATUSES).count(),
+            )
+            self.assertEqual(
+                driver.pending_orders,
+                DeliveryOrder.objects.filter(driver=driver, status="pending").count(),
+            )
+        driver = DeliveryDriver.objects.get(pk=self.drivers[0].pk)
+        self.assertEqual(driver.active_orders, 2)
+        self.assertFalse(driver.is_available)
+        response = self.client.patch(f"/api/delivery-drivers/{driver.pk}/toggle_available/")
+        self.assertEqual(response.status_code, 400)
+
+        self.update_status(deliveries[1], "cancelled")
+        self.assertTrue(DeliveryDriver.objects.get(pk=self.drivers[1].pk).is_available)
+
+
+class UpdatedSinceTests(DeliveryTestCase):
+    def poll(self, updated_since):
+        return self.client.get("/api/delivery-orders/", {"updated_since": updated_since})
+
+    def test_invalid_values_are_rejected(self):
+        for value in ("yesterday", "2026-13-01T10:00:00", "2026-01-01T10:00:00+25:00"):
+            response = self.poll(value)
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn("updated_since", str(response.data["error"]))
+
+    def test_offsets_and_utc_suffix(self):
+        delivery_order = self.create_delivery()
+        for value in ("2000-01-01T10:00:00Z", "2000-01-01T10:00:00+05:30", "2000-01-01T10:00:00 05:30"):
+            response = self.poll(value)
+            self.assertEqual(response.status_code, 200, value)
+            self.assertEqual([row["id"] for row in response.data["results"]], [delivery_order.pk])
+        self.assertEqual(self.poll("2999-01-01T10:00:00Z").data["results"], [])
+
+    def test_item_changes_count_as_updates(self):
+        delivery_order = self.create_delivery()
+        since = DeliveryOrder.objects.get(pk=delivery_order.pk).updated_at.isoformat()
+        self.assertEqual(self.poll(since).data["results"], [])
+
+        category = Category.objects.create(name="Mains")
+        dish = Dish.objects.create(name="Biryani", price=Decimal("10.00"), category=category)
+        item = OrderItem.objects.create(order_id=delivery_order.order_id, dish=dish, quantity=1)
+        self.assertEqual(len(self.poll(since).data["results"]), 1)
+
+        since = DeliveryOrder.objects.get(pk=delivery_order.pk).updated_at.isoformat()
+        item.delete()
+        self.assertEqual(len(self.poll(since).data["results"]), 1)
+
+    def test_orders_taken_from_a_driver_are_listed_as_removed(self):
+        driver, other = self.drivers[0], self.drivers[1]
+        kept, reassigned, deleted = [
+            self.create_delivery(delivery_driver_id=driver.pk) for _ in range(3)
+        ]
+        elsewhere = self.create_delivery(delivery_driver_id=other.pk)
+        since = timezone.now().isoformat()
+
+        response = self.client.patch(
+            f"/api/delivery-orders/{reassigned.order_id}/change_type/",
+            {
+                "order_type": "delivery", "customer_name": "Guest", "address": "Road 1",
+                "customer_phone_number": "999", "delivery_driver_id": other.pk,
+                "delivery_order": {"driver": other.pk},
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        Order.objects.get(pk=deleted.order_id).delete()
+        Order.objects.get(pk=elsewhere.order_id).delete()
+
+        driver_client = APIClient()
+        driver_client.force_authenticate(driver.user)
+        response = driver_client.get("/api/delivery-orders/", {"updated_since": since})
+        self.assertEqual(response.data["results"], [])
+        self.assertEqual(response.data["removed"], sorted([reassigned.pk, deleted.pk]))
+        self.assertNotIn(kept.pk, response.data["removed"])
+
+        response = self.poll(since)
+        self.assertEqual([row["id"] for row in response.data["results"]], [reassigned.pk])
+        self.assertEqual(response.data["removed"], sorted([deleted.pk, elsewhere.pk]))
+        # Plain listings are unchanged
+        self.assertNotIn("removed", self.client.get("/api/delivery-orders/").data)
+
+
+# Tests flush by hand instead of through the background thread
+@mock.patch("delivery_drivers.locations.start_flusher")
+class DriverLocationTests(DeliveryTestCase):
+    def setUp(self):
+        super().setUp()
+        locations.get_buffer().clear()
+        self.driver_client = APIClient()
+        self.driver_client.force_authenticate(self.drivers[0].user)
+
+    def report(self, data):
+        return self.driver_client.post("/api/delivery-drivers/locations/", data, format="json")
+
+    def test_pings_are_buffered_then_flushed(self, start_flusher):
+        self.assertEqual(self.report({"latitude": 11.25, "longitude": 75.78}).status_code, 202)
+        response = self.report([
+            {"latitude": 11.1, "longitude": 75.7, "recorded_at": "2026-01-01T10:00:00Z"},
+            {"latitude": 11.2, "longitude": 75.8, "recorded_at": "2026-01-01T10:00:05Z"},
+        ])
+        self.assertEqual(response.data, {"received": 2})
+        self.assertEqual(self.report({"latitude": 91, "longitude": 0}).status_code, 400)
+        self.assertEqual(
+            self.client.post("/api/delivery-drivers/locations/", {"latitude": 1, "longitude": 1}).status_code,
+            400,
+        )
+
+        # The older batch does not replace the live position
+        response = self.client.get("/api/delivery-drivers/locations/")
+        self.assertEqual(
+            [(row["driver"], row["latitude"]) for row in response.data], [(self.drivers[0].pk, 11.25)]
+        )
+        self.assertFalse(DriverLocation.objects.exists())
+        self.assertEqual(locations.flush(), 3)
+        self.assertEqual(DriverLocation.objects.filter(driver=self.drivers[0]).count(), 3)
+        self.assertEqual(locations.flush(), 0)
+
+    def test_failed_flush_keeps_the_pings(self, start_flusher):
+        self.report([{"latitude": 11.1, "longitude": 75.7}, {"latitude": 11.2, "longitude": 75.8}])
+        with mock.patch.object(DriverLocation.objects, "bulk_create", side_effect=RuntimeError), \
+                self.assertLogs("delivery_drivers.locations", "ERROR"):
+            self.assertEqual(locations.flush(), 0)
+        self.report({"latitude": 11.3, "longitude": 75.9})
+        self.assertEqual(locations.flush(), 3)
+        self.assertEqual(
+            list(DriverLocation.objects.order_by("id").values_list("latitude", flat=True)),
+            [11.1, 11.2, 11.3],
+        )
+
+    def test_pings_of_deleted_drivers_are_not_retried(self, start_flusher):
+        self.report({"latitude": 11.1, "longitude": 75.7})
+        self.drivers[0].delete()
+        with mock.patch.object(DriverLocation.objects, "bulk_create", side_effect=RuntimeError), \
+                self.assertLogs("delivery_drivers.locations", "ERROR"):
+            self.assertEqual(locations.flush(), 0)
+        self.assertEqual(len(locations.get_buffer()), 0)
+
+    def test_locations_have_their_own_throttle(self, start_flusher):
+        self.assertEqual(
+            DeliveryDriverViewSet.locations.kwargs["throttle_classes"], [DriverLocationRateThrottle]
+        )
+        self.assertEqual(DriverLocationRateThrottle.scope, "driver_locations")
@@ -1,11 +1,68 @@
+import re
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from .models import DeliveryDriver, DeliveryOrder
-from .serializers import DeliveryDriverSerializer, DeliveryOrderSerializer, DeliveryOrderUpdateSerializer
-from restaurant_app.models import Order
+from rest_framework.throttling import UserRateThrottle
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .dispatch import invalidate_index
+from .locations import latest_positions, record_pings
+from .models import DeliveryDriver, DeliveryOrder, DeliveryOrderRemoval
+from .serializers import (
+    DeliveryDriverSerializer,
+    DeliveryOrderSerializer,
+    DeliveryOrderUpdateSerializer,
+    DriverDeliveryOrderSerializer,
+    DriverLocationSerializer,
+)
+from restaurant_app.models import Order, OrderItem
 from restaurant_app.serializers import OrderTypeChangeSerializer
 
+MAX_PINGS_PER_REQUEST = 500
+
+# A time followed by a "+" offset that the query string decoded to a space
+DECODED_OFFSET = re.compile(r"(\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?) (\d{2}(?::?\d{2})?)$")
+
+DRIVER_SHAPE_FIELDS = [
+    "id",
+    "status",
+    "updated_at",
+    "driver_id",
+    "order__id",
+    "order__invoice_number",
+    "order__customer_name",
+    "order__customer_phone_number",
+    "order__address",
+    "order__total_amount",
+    "order__payment_method",
+]
+
+
+def parse_updated_since(value):
+    """
+    Parse an ISO 8601 updated_since value. Clients should percent-encode a
+    "+" offset (%2B) or use "Z"; an unencoded "+05:30" arrives as " 05:30"
+    and is put back here.
+    """
+    value = DECODED_OFFSET.sub(r"\1+\2", value.strip())
+    try:
+        updated_since = parse_datetime(value)
+    except ValueError:
+        # Well formed but out of range, e.g. month 13
+        updated_since = None
+    if updated_since is None:
+        raise ValidationError({"error": "updated_since must be an ISO 8601 date and time"})
+    if timezone.is_naive(updated_since):
+        updated_since = timezone.make_aware(updated_since)
+    return updated_since
+
+
+class DriverLocationRateThrottle(UserRateThrottle):
+    # Pings arrive every few seconds, far above the general daily rate
+    scope = "driver_locations"
+
 
 class DeliveryDriverViewSet(viewsets.ModelViewSet):
     queryset = DeliveryDriver.objects.all()
@@ -29,11 +86,7 @@ class DeliveryDriverViewSet(viewsets.ModelViewSet):
         driver = self.get_object()
 
         # Check if the driver has any active orders before allowing them to become available
-        active_orders = DeliveryOrder.objects.filter(
-            driver=driver, status__in=["accepted", "in_progress"]
-        )
-
-        if active_orders.exists() and not driver.is_available:
+        if driver.active_orders and not driver.is_available:
             return Response(
                 {"error": "Cannot set availability to True while having active orders"},
                 status=status.HTTP_400_BAD_REQUEST,
@@ -44,15 +97,104 @@ class DeliveryDriverViewSet(viewsets.ModelViewSet):
         return Response({"status": "availability status updated"})
 
 
+    @action(detail=False, methods=["get", "post"], throttle_classes=[DriverLocationRateThrottle])
+    def locations(self, request):
+        """
+        POST: a driver reports one ping, or a list of pings sent while
+        offline. GET: the latest known position of every active driver
+        (staff) or of the requesting driver, served from the buffer.
+        """
+        if request.method == "GET":
+            drivers = DeliveryDriver.objects.filter(is_active=True)
+            if not request.user.is_staff:
+                drivers = drivers.filter(user=request.user)
+            positions = latest_positions(drivers.values_list("id", flat=True))
+            return Response(DriverLocationSerializer(positions, many=True).data)
+
+        driver_id = (
+            DeliveryDriver.objects.filter(user=request.user).values_list("id", flat=True).first()
+        )
+        if driver_id is None:
+            return Response(
+                {"error": "Only delivery drivers can report locations"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        many = isinstance(request.data, list)
+        if many and len(request.data) > MAX_PINGS_PER_REQUEST:
+            return Response(
+                {"error": f"At most {MAX_PINGS_PER_REQUEST} pings per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        serializer = DriverLocationSerializer(data=request.data, many=many)
+        serializer.is_valid(raise_exception=True)
+        pings = serializer.validated_data if many else [serializer.validated_data]
+        record_pings(driver_id, pings)
+        return Response({"received": len(pings)}, status=status.HTTP_202_ACCEPTED)
+
+
 class DeliveryOrderViewSet(viewsets.ModelViewSet):
     queryset = DeliveryOrder.objects.all()
     serializer_class = DeliveryOrderSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def is_driver_shape(self):
+        return (
+            self.request.method in ("GET", "HEAD")
+            and self.request.query_params.get("shape") == "driver"
+        )
+
+    def get_serializer_class(self):
+        if self.is_driver_shape():
+            return DriverDeliveryOrderSerializer
+        return super().get_serializer_class()
+
     def get_queryset(self):
+        if self.is_driver_shape():
+            # One joined query for the orders and one for their item names
+            queryset = DeliveryOrder.objects.select_related("order").only(
+                *DRIVER_SHAPE_FIELDS
+            ).prefetch_related(
+                Prefetch(
+                    "order__items",
+                    queryset=OrderItem.objects.select_related("dish").only(
+                        "order_id", "quantity", "dish__name"
+                    ),
+                )
+            )
+        else:
+            queryset = DeliveryOrder.objects.select_related("driver__user").prefetch_related(
+                Prefetch("order", queryset=Order.objects.with_related())
+            )
+
+        updated_since = self.request.query_params.get("updated_since")
+        if updated_since:
+            queryset = queryset.filter(updated_at__gt=parse_updated_since(updated_since))
+
         if self.request.user.is_staff:
-            return DeliveryOrder.objects.all()
-        return DeliveryOrder.objects.filter(driver__user=self.request.user)
+            return queryset
+        return queryset.filter(driver__user=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        """
+        With updated_since, "removed" lists the ids of delivery orders that
+        left the caller's list since then: deleted ones, and for drivers
+        also ones reassigned to someone else.
+        """
+        response = super().list(request, *args, **kwargs)
+        updated_since = request.query_params.get("updated_since")
+        if updated_since:
+            response.data["removed"] = self.removed_since(parse_updated_since(updated_since))
+        return response
+
+    def removed_since(self, updated_since):
+        removals = DeliveryOrderRemoval.objects.filter(removed_at__gt=updated_since)
+        current = DeliveryOrder.objects.all()
+        if not self.request.user.is_staff:
+            removals = removals.filter(driver__user=self.request.user)
+            current = current.filter(driver__user=self.request.user)
+        # Orders assigned back since are in the results instead
+        removals = removals.exclude(delivery_order_id__in=current.values("pk"))
+        return sorted(set(removals.values_list("delivery_order_id", flat=True)))
 
     @action(detail=True, methods=["patch"])
     def update_status(self, request, pk=None):
@@ -114,11 +256,6 @@ class DeliveryOrderViewSet(viewsets.ModelViewSet):
 
     def check_and_update_driver_availability(self, driver):
         if driver:
-            # Check if the driver has any other active orders
-            active_orders = DeliveryOrder.objects.filter(
-                driver=driver, status__in=["accepted", "in_progress"]
-            ).exclude(id=self.get_object().id)
-
-            if not active_orders.exists():
-                driver.is_available = True
-                driver.save()
+            # The driver becomes available once no other active orders are left
+            if DeliveryDriver.objects.filter(pk=driver.pk, active_orders=0).update(is_available=True):
+                invalidate_index()
@@ -53,6 +53,11 @@ admin.site.register(User, CustomUserAdmin)
 admin.site.register(Category, UnflodModelAdmin)
 admin.site.register(Dish, UnflodModelAdmin)
 admin.site.register(Order, UnflodModelAdmin)
+admin.site.register(InvoiceSequence, UnflodModelAdmin)
+admin.site.register(CatalogVersion, UnflodModelAdmin)
+admin.site.register(HourlySalesRollup, UnflodModelAdmin)
+admin.site.register(DishSalesRollup, UnflodModelAdmin)
+admin.site.register(CategorySalesRollup, UnflodModelAdmin)
 admin.site.register(OrderItem, UnflodModelAdmin)
 admin.site.register(Bill, UnflodModelAdmin)
 admin.site.register(Notification, UnflodModelAdmin)
@@ -0,0 +1,86 @@
+from datetime import datetime, time, timedelta
+from django.db import models
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
+from restaurant_app.models import CreditTransaction, CreditUser
+
+# (key, age in days of the newest and oldest order in the bucket)
+BUCKETS = [
+    ("days_0_30", 0, 30),
+    ("days_31_60", 31, 60),
+    ("days_61_90", 61, 90),
+    ("days_over_90", 91, None),
+]
+
+MONEY = models.DecimalField(max_digits=12, decimal_places=2)
+
+
+def _money(value):
+    return Value(value, output_field=MONEY)
+
+
+def aging_rows(as_of):
+    """
+    Outstanding dues per credit user split by the age of the credit orders
+    they come from, computed in one grouped query.
+
+    Payments are taken to settle the oldest orders first, so a user's
+    outstanding balance is allocated to their newest orders and only what
+    is left over reaches the older buckets. Anything not covered by an
+    order, such as an opening balance, is reported as over 90 days.
+    """
+    end_of_day = timezone.make_aware(datetime.combine(as_of + timedelta(days=1), time.min))
+
+    charges = {}
+    for key, newest, oldest in BUCKETS:
+        in_bucket = Q(credit_orders__order__created_at__lt=end_of_day - timedelta(days=newest))
+        if oldest is not None:
+            in_bucket &= Q(
+                credit_orders__order__created_at__gte=end_of_day - timedelta(days=oldest + 1)
+            )
+        charges[f"{key}_charged"] = Coalesce(
+            Sum("credit_orders__order__total_amount", filter=in_bucket), _money(0)
+        )
+
+    buckets = {}
+    remaining = Greatest(F("total_due"), _money(0), output_field=MONEY)
+    for key, _, oldest in BUCKETS:
+        if oldest is None:
+            buckets[key] = remaining
+        else:
+            buckets[key] = Least(remaining, F(f"{key}_charged"), output_field=MONEY)
+            remaining = Greatest(remaining - F(f"{key}_charged"), _money(0), output_field=MONEY)
+
+    last_payment = (
+        CreditTransaction.objects.filter(credit_user=OuterRef("pk"))
+        .order_by("-date")
+        .values("date")[:1]
+    )
+    return (
+        CreditUser.objects.filter(total_due__gt=0)
+        .annotate(**charges)
+        .annotate(**buckets, last_payment_date=Subquery(last_payment))
+        .values(
+            "id",
+            "username",
+            "mobile_number",
+            "due_date",
+            "total_due",
+            "last_payment_date",
+            *buckets,
+        )
+        .order_by("-total_due", "id")
+    )
+
+
+def aging_report(as_of):
+    results = list(aging_rows(as_of))
+    totals = {key: sum(row[key] for row in results) for key, _, _ in BUCKETS}
+    totals["total_due"] = sum(row["total_due"] for row in results)
+    return {
+        "as_of": as_of,
+        "buckets": [key for key, _, _ in BUCKETS],
+        "results": results,
+        "totals": totals,
+    }
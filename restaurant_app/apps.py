@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class RestaurantAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'restaurant_app'
+
+    def ready(self):
+        # Registers the signal receivers that keep the sales rollups, menu sub
+        # totals, the catalog snapshot, the dish search index and image
+        # renditions current
+        from restaurant_app import catalog, menus, renditions, rollups, search  # noqa: F401
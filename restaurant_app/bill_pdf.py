@@ -0,0 +1,165 @@
+import logging
+import threading
+from io import BytesIO
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from restaurant_app.exports import StreamRenderer
+from restaurant_app.models import LogoInfo
+
+logger = logging.getLogger(__name__)
+
+
+# Receipt-sized pages: fixed width, height grows with the number of items
+PAGE_WIDTH = 80 * mm
+MARGIN = 4 * mm
+LINE_HEIGHT = 4.5 * mm
+HEADER_HEIGHT = 34 * mm
+LOGO_HEIGHT = 14 * mm
+FONT = "Helvetica"
+BOLD_FONT = "Helvetica-Bold"
+
+HEADER_FORM = "bill_header"
+
+
+class PDFRenderer(StreamRenderer):
+    media_type = "application/pdf"
+    format = "pdf"
+
+
+class BillTemplate:
+    """Static part of every bill: the LogoInfo header and its decoded logo."""
+
+    def __init__(self, logo_info):
+        self.company_name = logo_info.company_name if logo_info else ""
+        self.location = logo_info.location if logo_info else ""
+        self.phone_numbers = (
+            " / ".join(
+                number
+                for number in (logo_info.phone_number, logo_info.office_number)
+                if number
+            )
+            if logo_info
+            else ""
+        )
+        self.logo = None
+        if logo_info and logo_info.print_logo:
+            try:
+                with logo_info.print_logo.open("rb") as logo_file:
+                    self.logo = ImageReader(BytesIO(logo_file.read()))
+            except OSError:
+                logger.warning("Could not read print logo %s", logo_info.print_logo.name)
+
+    def draw_header(self, pdf):
+        y = HEADER_HEIGHT - MARGIN
+        if self.logo is not None:
+            logo_width, logo_height = self.logo.getSize()
+            width = LOGO_HEIGHT * logo_width / logo_height
+            y -= LOGO_HEIGHT
+            pdf.drawImage(
+                self.logo, (PAGE_WIDTH - width) / 2, y, width, LOGO_HEIGHT, mask="auto"
+            )
+        pdf.setFont(BOLD_FONT, 10)
+        y -= LINE_HEIGHT
+        pdf.drawCentredString(PAGE_WIDTH / 2, y, self.company_name)
+        pdf.setFont(FONT, 7)
+        for line in (self.location, self.phone_numbers):
+            if line:
+                y -= LINE_HEIGHT * 0.8
+                pdf.drawCentredString(PAGE_WIDTH / 2, y, line)
+        pdf.line(MARGIN, MARGIN / 2, PAGE_WIDTH - MARGIN, MARGIN / 2)
+
+
+def template_key(logo_info):
+    if logo_info is None:
+        return None
+    return (
+        logo_info.pk,
+        logo_info.company_name,
+        logo_info.location,
+        logo_info.phone_number,
+        logo_info.office_number,
+        logo_info.print_logo.name,
+    )
+
+
+_template_cache = {"key": None, "template": None}
+_template_lock = threading.Lock()
+
+
+def get_template():
+    """Return the bill template, rebuilding it only when LogoInfo changed."""
+    logo_info = LogoInfo.objects.first()
+    key = template_key(logo_info)
+    with _template_lock:
+        if _template_cache["template"] is None or _template_cache["key"] != key:
+            _template_cache["template"] = BillTemplate(logo_info)
+            _template_cache["key"] = key
+        return _template_cache["template"]
+
+
+def bill_lines(bill):
+    """Body lines of a bill as (left text, right text, bold) tuples."""
+    order = bill["order"]
+    lines = [
+        (f"Invoice: {order['invoice_number']}", f"Bill #{bill['id']}", True),
+        (order["created_at"][:16].replace("T", " "), order["order_type"].title(), False),
+    ]
+    if order["customer_name"]:
+        lines.append((order["customer_name"], order["customer_phone_number"], False))
+    lines.append(None)
+    for item in order["items"]:
+        lines.append((f"{item['quantity']} x {item['dish_name']}", f"{item['item_total']}", False))
+    lines.append(None)
+    lines.append(("Sub total", f"{order['sub_total']}", False))
+    if float(order["delivery_charge"] or 0):
+        lines.append(("Delivery charge", f"{order['delivery_charge']}", False))
+    lines.append(("Total", f"{bill['total_amount']}", True))
+    lines.append((f"Paid by {order['payment_method']}", "PAID" if bill["paid"] else "", False))
+    return lines
+
+
+def page_height(lines):
+    return HEADER_HEIGHT + (len(lines) + 2) * LINE_HEIGHT + MARGIN
+
+
+def draw_bill(pdf, lines, height):
+    pdf.saveState()
+    pdf.translate(0, height - HEADER_HEIGHT)
+    pdf.doForm(HEADER_FORM)
+    pdf.restoreState()
+
+    y = height - HEADER_HEIGHT - LINE_HEIGHT
+    for line in lines:
+        if line is None:
+            pdf.line(MARGIN, y + LINE_HEIGHT / 3, PAGE_WIDTH - MARGIN, y + LINE_HEIGHT / 3)
+        else:
+            left, right, bold = line
+            pdf.setFont(BOLD_FONT if bold else FONT, 8)
+            pdf.drawString(MARGIN, y, str(left)[:40])
+            pdf.drawRightString(PAGE_WIDTH - MARGIN, y, str(right))
+        y -= LINE_HEIGHT
+    pdf.setFont(FONT, 7)
+    pdf.drawCentredString(PAGE_WIDTH / 2, MARGIN, "Thank you!")
+
+
+def render_bills_pdf(bills):
+    """Render serialized bills (BillSerializer data) into one PDF, a page each."""
+    template = get_template()
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=(PAGE_WIDTH, HEADER_HEIGHT))
+
+    # The header is compiled once as a form and referenced from every page
+    pdf.beginForm(HEADER_FORM, 0, 0, PAGE_WIDTH, HEADER_HEIGHT)
+    template.draw_header(pdf)
+    pdf.endForm()
+
+    for bill in bills:
+        lines = bill_lines(bill)
+        height = page_height(lines)
+        pdf.setPageSize((PAGE_WIDTH, height))
+        draw_bill(pdf, lines, height)
+        pdf.showPage()
+
+    pdf.save()
+    return buffer.getvalue()
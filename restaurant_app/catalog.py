@@ -0,0 +1,65 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.renderers import JSONRenderer
+from restaurant_app.models import CatalogVersion, Category, Dish, DishVariant
+from restaurant_app.serializers import (
+    CategorySerializer,
+    DishSerializer,
+    DishVariantSerializer,
+)
+
+
+# Rendered catalog documents of this process, keyed by the base URL used for
+# image links and holding (version, body). Only the current version is kept.
+_snapshots = {}
+
+
+def current_version():
+    return (
+        CatalogVersion.objects.filter(pk=1).values_list("version", flat=True).first()
+        or 0
+    )
+
+
+def bump_version():
+    if not CatalogVersion.objects.filter(pk=1).update(version=F("version") + 1):
+        CatalogVersion.objects.get_or_create(pk=1, defaults={"version": 1})
+
+
+def catalog_etag(version):
+    return f'"catalog-{version}"'
+
+
+def build_catalog(version, request):
+    context = {"request": request}
+    document = {
+        "version": version,
+        "categories": CategorySerializer(Category.objects.all(), many=True).data,
+        "dishes": DishSerializer(
+            Dish.objects.all(), many=True, context=context
+        ).data,
+        "variants": DishVariantSerializer(
+            DishVariant.objects.order_by("id"), many=True
+        ).data,
+    }
+    return JSONRenderer().render(document)
+
+
+def get_catalog(version, request):
+    """Return the rendered catalog for ``version``, building it at most once."""
+    base_url = request.build_absolute_uri("/")
+    snapshot = _snapshots.get(base_url)
+    if snapshot is None or snapshot[0] != version:
+        snapshot = _snapshots[base_url] = (version, build_catalog(version, request))
+    return snapshot[1]
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+@receiver(post_save, sender=DishVariant)
+@receiver(post_delete, sender=DishVariant)
+def invalidate_catalog(sender, **kwargs):
+    bump_version()
@@ -0,0 +1,130 @@
+from collections import defaultdict
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Least
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+from restaurant_app.models import CreditTransaction, CreditUser
+
+# Balances change only through single UPDATE statements whose new value is
+# computed by the database from the current row, so concurrent postings
+# against the same credit user can never overwrite each other.
+
+BALANCE_FIELDS = ["total_due", "is_active", "due_date"]
+
+
+def _money(value):
+    return Value(value, output_field=models.DecimalField(max_digits=10, decimal_places=2))
+
+
+def _post(queryset, new_total, **fields):
+    return queryset.update(
+        total_due=new_total,
+        # Same rule as CreditUser.save: an account that owes money is put on hold
+        is_active=Case(
+            When(GreaterThan(new_total, 0), then=Value(False)),
+            default=F("is_active"),
+        ),
+        **fields,
+    )
+
+
+def post_charge(credit_user_id, amount, active_only=False):
+    """
+    Add ``amount`` to the user's dues. With ``active_only`` nothing is
+    charged to an account on hold; the return value tells whether it was.
+    """
+    credit_users = CreditUser.objects.filter(pk=credit_user_id)
+    if active_only:
+        credit_users = credit_users.filter(is_active=True)
+    return _post(credit_users, F("total_due") + _money(amount))
+
+
+def post_payment(credit_user_id, amount):
+    """Take a payment of at most the outstanding dues and restart the due date."""
+    return _post(
+        CreditUser.objects.filter(pk=credit_user_id),
+        F("total_due") - Least(_money(amount), F("total_due")),
+        due_date=timezone.now(),
+    )
+
+
+def post_receipts(amounts):
+    """Subtract received amounts, given as {credit user id: amount}, in one UPDATE."""
+    if not amounts:
+        return 0
+    received = Case(
+        *[When(pk=pk, then=_money(amount)) for pk, amount in amounts.items()],
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+    return _post(CreditUser.objects.filter(pk__in=amounts), F("total_due") - received)
+
+
+def lock_balances(credit_user_ids):
+    """Lock the users' rows for the rest of the transaction and return their dues."""
+    # A fixed lock order keeps concurrent batches from deadlocking
+    return dict(
+        CreditUser.objects.select_for_update()
+        .filter(pk__in=credit_user_ids)
+        .order_by("pk")
+        .values_list("pk", "total_due")
+    )
+
+
+def record_transaction(credit_transaction, save):
+    """
+    Save a CreditTransaction and apply its received amount to the user's
+    dues; ``save`` performs the actual model save. On an edit only the
+    change in received_amount is applied, unless the payment moved to
+    another user: then it is taken back from the old one in full.
+    """
+    with transaction.atomic():
+        credit_user_id = credit_transaction.credit_user_id
+        previous_user_id, previous_amount = None, 0
+        if not credit_transaction._state.adding:
+            # Locked, so two edits of one payment each see what the other stored
+            previous = (
+                CreditTransaction.objects.select_for_update()
+                .filter(pk=credit_transaction.pk)
+                .values_list("credit_user_id", "received_amount")
+                .first()
+            )
+            if previous:
+                previous_user_id, previous_amount = previous[0], previous[1] or 0
+        balances = lock_balances({pk for pk in (credit_user_id, previous_user_id) if pk})
+
+        amounts = defaultdict(int)
+        if previous_user_id in balances:
+            amounts[previous_user_id] -= previous_amount
+        if credit_user_id in balances:
+            amounts[credit_user_id] += credit_transaction.received_amount
+
+        # The status reflects whether the user owed money before this payment
+        balance = balances.get(credit_user_id)
+        credit_transaction.status = "due" if balance and balance > 0 else "completed"
+        save()
+        post_receipts({pk: amount for pk, amount in amounts.items() if amount})
+
+
+def settle(payments):
+    """
+    Record many credit payments at once. ``payments`` are validated
+    CreditTransaction attributes; every affected balance is updated in one
+    statement and everything commits together.
+    """
+    with transaction.atomic():
+        balances = lock_balances({payment["credit_user"].pk for payment in payments})
+        received = defaultdict(int)
+        credit_transactions = []
+        for payment in payments:
+            credit_user_id = payment["credit_user"].pk
+            balance = balances[credit_user_id]
+            credit_transactions.append(
+                CreditTransaction(**payment, status="due" if balance > 0 else "completed")
+            )
+            balances[credit_user_id] = balance - payment["received_amount"]
+            received[credit_user_id] += payment["received_amount"]
+
+        CreditTransaction.objects.bulk_create(credit_transactions)
+        post_receipts(received)
+    return credit_transactions
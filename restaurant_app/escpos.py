@@ -0,0 +1,172 @@
+import logging
+import threading
+from PIL import Image
+from django.utils import timezone
+from restaurant_app.bill_pdf import bill_lines
+from restaurant_app.exports import StreamRenderer
+from restaurant_app.models import LogoInfo
+
+logger = logging.getLogger(__name__)
+
+
+# 80 mm printers: 48 characters of font A, 576 dots per line
+LINE_WIDTH = 48
+LOGO_MAX_WIDTH_DOTS = 384
+ENCODING = "cp437"
+
+ESC = b"\x1b"
+GS = b"\x1d"
+INIT = ESC + b"@"
+ALIGN_LEFT = ESC + b"a\x00"
+ALIGN_CENTER = ESC + b"a\x01"
+BOLD_ON = ESC + b"E\x01"
+BOLD_OFF = ESC + b"E\x00"
+DOUBLE_SIZE = GS + b"!\x11"
+NORMAL_SIZE = GS + b"!\x00"
+FEED_AND_CUT = GS + b"V\x42\x03"
+
+
+class ESCPOSRenderer(StreamRenderer):
+    media_type = "application/octet-stream"
+    format = "escpos"
+
+
+def text(value):
+    return str(value).encode(ENCODING, errors="replace")
+
+
+def line(value=""):
+    return text(value) + b"\n"
+
+
+def columns(left, right):
+    right = str(right)
+    left = str(left)[: LINE_WIDTH - len(right) - 1]
+    return line(left + " " * (LINE_WIDTH - len(left) - len(right)) + right)
+
+
+def raster(image):
+    """Dither an image and encode it as a GS v 0 raster bit image."""
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    image = image.convert("L")
+
+    if image.width > LOGO_MAX_WIDTH_DOTS:
+        height = max(1, round(image.height * LOGO_MAX_WIDTH_DOTS / image.width))
+        image = image.resize((LOGO_MAX_WIDTH_DOTS, height), Image.Resampling.LANCZOS)
+
+    # Rows are sent in whole bytes, so pad the width to a multiple of 8
+    width = (image.width + 7) // 8 * 8
+    if width != image.width:
+        padded = Image.new("L", (width, image.height), 255)
+        padded.paste(image, (0, 0))
+        image = padded
+
+    # Mode "1" applies Floyd-Steinberg dithering; its set bits are white
+    # while the printer's are black, so invert every byte
+    bitmap = bytes(byte ^ 0xFF for byte in image.convert("1").tobytes())
+    width_bytes = width // 8
+    return (
+        GS
+        + b"v0\x00"
+        + bytes([width_bytes % 256, width_bytes // 256, image.height % 256, image.height // 256])
+        + bitmap
+    )
+
+
+_logo_cache = {"key": None, "raster": b""}
+_logo_lock = threading.Lock()
+
+
+def logo_raster():
+    """Return the print logo as a ready-to-send raster, encoded once per logo."""
+    logo_info = LogoInfo.objects.first()
+    key = (logo_info.pk, logo_info.print_logo.name) if logo_info else None
+    with _logo_lock:
+        if _logo_cache["key"] != key:
+            data = b""
+            if logo_info and logo_info.print_logo:
+                try:
+                    with logo_info.print_logo.open("rb") as logo_file:
+                        with Image.open(logo_file) as image:
+                            data = raster(image)
+                except OSError:
+                    logger.warning("Could not read print logo %s", logo_info.print_logo.name)
+            _logo_cache["key"] = key
+            _logo_cache["raster"] = data
+        return _logo_cache["raster"], logo_info
+
+
+def variant_names(variants):
+    names = []
+    for variant in variants or []:
+        if isinstance(variant, dict):
+            variant = variant.get("name") or ", ".join(str(value) for value in variant.values())
+        names.append(str(variant))
+    return names
+
+
+def kitchen_ticket(order, items, new_only=False):
+    """Kitchen ticket for ``order``; ``items`` must have their dish loaded."""
+    if new_only:
+        items = [item for item in items if item.is_newly_added]
+
+    created_at = timezone.localtime(order.created_at)
+    output = [
+        INIT,
+        ALIGN_CENTER,
+        DOUBLE_SIZE,
+        line("ADDED ITEMS" if new_only else "KITCHEN"),
+        line(f"#{order.invoice_number or order.id}"),
+        NORMAL_SIZE,
+        line(f"{order.get_order_type_display()} - {created_at:%d/%m/%Y %H:%M}"),
+        ALIGN_LEFT,
+        line("-" * LINE_WIDTH),
+    ]
+    for item in items:
+        output.append(BOLD_ON)
+        label = f"{item.quantity} x {item.dish.name}"
+        if item.is_newly_added and not new_only:
+            output.append(columns(label, "NEW"))
+        else:
+            output.append(line(label[:LINE_WIDTH]))
+        output.append(BOLD_OFF)
+        for name in variant_names(item.variants):
+            output.append(line(f"   + {name}"[:LINE_WIDTH]))
+    output.append(line("-" * LINE_WIDTH))
+
+    if order.kitchen_note:
+        output += [BOLD_ON, line("NOTE:"), DOUBLE_SIZE, line(order.kitchen_note), NORMAL_SIZE, BOLD_OFF]
+
+    output += [line(), FEED_AND_CUT]
+    return b"".join(output)
+
+
+def bill_receipt(bill):
+    """Customer receipt from BillSerializer data, headed by the cached logo."""
+    logo, logo_info = logo_raster()
+    output = [INIT, ALIGN_CENTER]
+    if logo:
+        output.append(logo)
+    if logo_info:
+        output += [BOLD_ON, line(logo_info.company_name), BOLD_OFF]
+        for value in (logo_info.location, logo_info.phone_number, logo_info.office_number):
+            if value:
+                output.append(line(value))
+    output += [ALIGN_LEFT, line("-" * LINE_WIDTH)]
+
+    for bill_line in bill_lines(bill):
+        if bill_line is None:
+            output.append(line("-" * LINE_WIDTH))
+            continue
+        left, right, bold = bill_line
+        if bold:
+            output.append(BOLD_ON)
+        output.append(columns(left, right or ""))
+        if bold:
+            output.append(BOLD_OFF)
+
+    output += [ALIGN_CENTER, line("Thank you!"), line(), FEED_AND_CUT]
+    return b"".join(output)
@@ -0,0 +1,113 @@
+import csv
+import json
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from restaurant_app.serializers import OrderSerializer
+
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_CHUNK_SIZE = 2000
+
+SALES_REPORT_COLUMNS = [
+    "id",
+    "invoice_number",
+    "created_at",
+    "order_type",
+    "status",
+    "payment_method",
+    "total_amount",
+    "cash_amount",
+    "bank_amount",
+    "delivery_charge",
+    "customer_name",
+    "customer_phone_number",
+    "address",
+    "user",
+    "delivery_driver",
+    "delivery_order_status",
+    "items_count",
+]
+
+
+class StreamRenderer(BaseRenderer):
+    """
+    Lets ``?format=csv``/``?format=ndjson`` pass content negotiation. The view
+    streams the export itself, so this only renders error responses.
+    """
+
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return json.dumps(data, cls=JSONEncoder).encode(self.charset)
+
+
+class CSVStreamRenderer(StreamRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+class NDJSONStreamRenderer(StreamRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+
+class Echo:
+    """File-like object that hands back what csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+def sales_report_row(order):
+    delivery_order = getattr(order, "delivery_order", None)
+    driver = delivery_order.driver if delivery_order else None
+    return [
+        order.id,
+        order.invoice_number,
+        order.created_at.isoformat(),
+        order.order_type,
+        order.status,
+        order.payment_method,
+        order.total_amount,
+        order.cash_amount,
+        order.bank_amount,
+        order.delivery_charge,
+        order.customer_name,
+        order.customer_phone_number,
+        order.address,
+        order.user.username,
+        driver.user.username if driver else "",
+        delivery_order.status if delivery_order else "",
+        len(order.items.all()),
+    ]
+
+
+def iter_sales_report_csv(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow(SALES_REPORT_COLUMNS)
+    for order in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield writer.writerow(sales_report_row(order))
+
+
+def iter_sales_report_ndjson(queryset, context):
+    encoder = JSONEncoder()
+    for order in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        data = OrderSerializer(order, context=context).data
+        yield encoder.encode(data) + "\n"
+
+
+def stream_sales_report(queryset, export_format, context):
+    if export_format == "csv":
+        content, content_type = iter_sales_report_csv(queryset), "text/csv"
+    else:
+        content = iter_sales_report_ndjson(queryset, context)
+        content_type = "application/x-ndjson"
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response["Content-Disposition"] = (
+        f'attachment; filename="sales_report.{export_format}"'
+    )
+    return response
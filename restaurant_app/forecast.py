@@ -0,0 +1,98 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.db.models import Count, Q
+from restaurant_app.models import Mess, MenuItem
+
+# Menu items without a meal type are served with every meal of the day
+UNASSIGNED_MEAL = "other"
+
+
+def weekday_name(day):
+    return day.strftime("%A").lower()
+
+
+def serves_meal(mess_type, meal):
+    # Mess type names list their meals, e.g. "breakfast_dinner"
+    return meal is None or meal in mess_type.split("_")
+
+
+def forecast(start, days):
+    """
+    Dish quantities per day and meal for the Mess subscriptions active in
+    the ``days`` days from ``start``.
+
+    Subscribers are first counted per (menu, mess type) and day in a single
+    aggregate query, so the work that follows depends on the size of the
+    menus rather than on the number of subscribers.
+    """
+    dates = [start + timedelta(days=i) for i in range(days)]
+    first, last = dates[0], dates[-1]
+
+    subscriber_counts = {}
+    menu_counts = {}
+    for i, day in enumerate(dates):
+        subscriber_counts[f"day_{i}"] = Count("id", filter=Q(start_date__lte=day, end_date__gte=day))
+        menu_counts[f"day_{i}"] = Count(
+            "id", filter=Q(mess__start_date__lte=day, mess__end_date__gte=day)
+        )
+
+    subscribers = Mess.objects.filter(start_date__lte=last, end_date__gte=first).aggregate(
+        **subscriber_counts
+    )
+    # (menu id, mess type name) -> subscribers per day
+    cohorts = defaultdict(list)
+    menu_days = {}
+    rows = (
+        Mess.menus.through.objects.filter(
+            mess__start_date__lte=last,
+            mess__end_date__gte=first,
+            menu__day_of_week__in={weekday_name(day) for day in dates},
+        )
+        .values("menu", "menu__day_of_week", "mess__mess_type__name")
+        .annotate(**menu_counts)
+        .order_by()
+    )
+    for row in rows:
+        menu_days[row["menu"]] = row["menu__day_of_week"]
+        cohorts[row["menu"]].append(
+            (row["mess__mess_type__name"], [row[f"day_{i}"] for i in range(days)])
+        )
+
+    # (day index, meal, dish id) -> portions
+    portions = defaultdict(int)
+    dish_names = {}
+    items = MenuItem.objects.filter(menu__in=menu_days).values(
+        "menu", "meal_type", "dish", "dish__name"
+    )
+    for item in items:
+        dish_names[item["dish"]] = item["dish__name"]
+        meal = item["meal_type"] or UNASSIGNED_MEAL
+        day_of_week = menu_days[item["menu"]]
+        for mess_type, counts in cohorts[item["menu"]]:
+            if not serves_meal(mess_type, item["meal_type"]):
+                continue
+            for i, day in enumerate(dates):
+                if counts[i] and weekday_name(day) == day_of_week:
+                    portions[i, meal, item["dish"]] += counts[i]
+
+    meal_order = [meal for meal, _ in MenuItem.MEAL_TYPE_CHOICES] + [UNASSIGNED_MEAL]
+    result = [
+        {
+            "date": day,
+            "day_of_week": weekday_name(day),
+            "subscribers": subscribers[f"day_{i}"],
+            "meals": {meal: [] for meal in meal_order},
+        }
+        for i, day in enumerate(dates)
+    ]
+    for (i, meal, dish_id), quantity in portions.items():
+        result[i]["meals"][meal].append(
+            {"dish_id": dish_id, "dish_name": dish_names[dish_id], "quantity": quantity}
+        )
+    for day_result in result:
+        day_result["meals"] = {
+            meal: sorted(dishes, key=lambda dish: dish["dish_name"])
+            for meal, dishes in day_result["meals"].items()
+            if dishes
+        }
+    return result
@@ -0,0 +1,78 @@
+import threading
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from restaurant_app.models import InvoiceSequence
+
+
+# Blocks of invoice numbers reserved by this process, keyed by (outlet,
+# business date). Each entry is [next_value, last_value]; unused numbers are
+# simply skipped when the worker restarts, so the numbering is gap tolerant.
+_blocks = {}
+_blocks_lock = threading.Lock()
+
+
+def sequence_key(business_date, outlet):
+    return f"{outlet}:{business_date:%Y%m%d}"
+
+
+def format_invoice_number(value, business_date, outlet):
+    return settings.INVOICE_NUMBER_FORMAT.format(
+        number=value, date=business_date, outlet=outlet
+    )
+
+
+def _reserve(key, count):
+    """Advance the counter row by ``count`` and return the first reserved value."""
+    sequence = InvoiceSequence.objects.filter(key=key)
+    with transaction.atomic():
+        if not sequence.update(last_value=F("last_value") + count):
+            # First invoice of the day for this outlet
+            InvoiceSequence.objects.get_or_create(key=key)
+            sequence.update(last_value=F("last_value") + count)
+        last_value = sequence.values_list("last_value", flat=True).get()
+    return last_value - count + 1
+
+
+def _take_from_blocks(business_date, outlet, count):
+    key = sequence_key(business_date, outlet)
+    values = []
+    with _blocks_lock:
+        # Blocks of previous business days can never be used again; other
+        # outlets' blocks for the day are still in use
+        for stale in [block_key for block_key in _blocks if block_key[1] < business_date]:
+            del _blocks[stale]
+
+        while len(values) < count:
+            block = _blocks.get((outlet, business_date))
+            if block is None or block[0] > block[1]:
+                size = max(settings.INVOICE_BLOCK_SIZE, count - len(values))
+                first = _reserve(key, size)
+                block = _blocks[outlet, business_date] = [first, first + size - 1]
+            taken = min(block[1] - block[0] + 1, count - len(values))
+            values.extend(range(block[0], block[0] + taken))
+            block[0] += taken
+    return values
+
+
+def allocate_invoice_numbers(count, outlet=None):
+    """Return ``count`` formatted invoice numbers for the current business day."""
+    outlet = outlet or settings.INVOICE_OUTLET
+    business_date = timezone.localdate()
+    key = sequence_key(business_date, outlet)
+
+    if connection.in_atomic_block:
+        # A block reserved inside the caller's transaction would be rolled
+        # back with it while this process still held on to it, so only take
+        # the numbers needed right now.
+        first = _reserve(key, count)
+        values = range(first, first + count)
+    else:
+        values = _take_from_blocks(business_date, outlet, count)
+
+    return [format_invoice_number(value, business_date, outlet) for value in values]
+
+
+def next_invoice_number(outlet=None):
+    return allocate_invoice_numbers(1, outlet)[0]
@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.core.management.base import BaseCommand
+from restaurant_app.models import Dish, OrderItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in unit_price and line_total on order items created before the "
+        "price snapshot columns existed. Unknown historical prices are taken "
+        "from the dish's current price."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        missing = OrderItem.objects.filter(
+            Q(unit_price__isnull=True) | Q(line_total__isnull=True)
+        ).order_by("pk")
+        dish_price = Dish.objects.filter(pk=OuterRef("dish_id")).values("price")[:1]
+
+        updated = 0
+        while True:
+            ids = list(missing.values_list("pk", flat=True)[:batch_size])
+            if not ids:
+                break
+            # Two set-based updates per batch keep each transaction short
+            with transaction.atomic():
+                OrderItem.objects.filter(pk__in=ids, unit_price__isnull=True).update(
+                    unit_price=Subquery(dish_price)
+                )
+                updated += OrderItem.objects.filter(pk__in=ids).update(
+                    line_total=F("unit_price") * F("quantity")
+                )
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled prices on {updated} order items."))
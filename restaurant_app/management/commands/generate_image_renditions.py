@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from restaurant_app.renditions import IMAGE_FIELDS, needs_renditions, run_in_worker
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnail and WebP renditions for dish images and logos."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.RENDITION_WORKERS,
+            help="Number of images rendered in parallel",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenerate renditions that already exist",
+        )
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model, fields in IMAGE_FIELDS.items():
+            renditions_fields = [f"{field}_renditions" for field in fields]
+            for instance in model.objects.only("pk", *fields, *renditions_fields).iterator():
+                for field in fields:
+                    if options["force"] or needs_renditions(instance, field):
+                        jobs.append((model, instance.pk, field))
+
+        with ThreadPoolExecutor(max_workers=max(options["workers"], 1)) as executor:
+            results = list(executor.map(lambda job: run_in_worker(*job), jobs))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated renditions for {sum(results)} of {len(jobs)} images."
+            )
+        )
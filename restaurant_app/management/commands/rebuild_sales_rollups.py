@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from restaurant_app.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the hourly, dish and category sales rollups from the order tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from-date", help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument("--to-date", help="Last day to rebuild (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        from_date = to_date = None
+        if options["from_date"]:
+            from_date = parse_date(options["from_date"])
+            if from_date is None:
+                raise CommandError("--from-date must be in YYYY-MM-DD format")
+        if options["to_date"]:
+            to_date = parse_date(options["to_date"])
+            if to_date is None:
+                raise CommandError("--to-date must be in YYYY-MM-DD format")
+
+        rebuild_rollups(from_date, to_date)
+        self.stdout.write(self.style.SUCCESS("Sales rollups rebuilt."))
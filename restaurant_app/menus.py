@@ -0,0 +1,52 @@
+import threading
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from restaurant_app.models import Menu, MenuItem
+
+
+# Menus whose items changed in the current thread. Each is recomputed once
+# when the surrounding transaction commits, however many items were written.
+_dirty = threading.local()
+
+
+def recalculate_sub_totals(menu_ids):
+    """Set each menu's sub_total to the sum of its dish prices in one UPDATE."""
+    totals = (
+        MenuItem.objects.filter(menu=OuterRef("pk"))
+        .order_by()
+        .values("menu")
+        .annotate(total=Sum("dish__price"))
+        .values("total")
+    )
+    Menu.objects.filter(pk__in=menu_ids).update(
+        sub_total=Coalesce(
+            Subquery(totals),
+            Value(0),
+            output_field=models.DecimalField(max_digits=6, decimal_places=2),
+        )
+    )
+
+
+def _recalculate_dirty_menus():
+    menu_ids = getattr(_dirty, "menu_ids", set())
+    _dirty.menu_ids = set()
+    if menu_ids:
+        recalculate_sub_totals(menu_ids)
+
+
+def mark_menu_dirty(menu_id):
+    if not hasattr(_dirty, "menu_ids"):
+        _dirty.menu_ids = set()
+    _dirty.menu_ids.add(menu_id)
+    # The first callback to run handles every pending menu and the rest
+    # find nothing left to do
+    transaction.on_commit(_recalculate_dirty_menus)
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def update_menu_sub_total(sender, instance, **kwargs):
+    mark_menu_dirty(instance.menu_id)
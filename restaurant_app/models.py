@@ -49,6 +49,9 @@ class LogoInfo(models.Model):
     office_number = models.CharField(max_length=20)
     main_logo = models.ImageField(upload_to='company_logos/')
     print_logo = models.ImageField(upload_to='company_logos/')
+    # Thumbnail/WebP paths generated in the background by restaurant_app/renditions.py
+    main_logo_renditions = models.JSONField(default=dict, blank=True)
+    print_logo_renditions = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return self.company_name        
@@ -72,6 +75,7 @@ class Dish(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to="images/", default="default_dish_image.jpg")
+    image_renditions = models.JSONField(default=dict, blank=True)
     price = models.DecimalField(max_digits=6, decimal_places=2)
     category = models.ForeignKey(
         Category, on_delete=models.CASCADE, related_name="dishes"
@@ -94,6 +98,33 @@ class DishVariant(models.Model):
         return f"{self.name} ({self.dish.name})"
 
 
+class CatalogVersion(models.Model):
+    # Single row bumped whenever a category, dish or variant changes
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Catalog version {self.version}"
+
+
+class InvoiceSequence(models.Model):
+    # One counter row per outlet and business day, e.g. "main:20240821"
+    key = models.CharField(max_length=50, unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} - {self.last_value}"
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_related(self):
+        """Eager-load everything OrderSerializer renders, in a fixed number of queries."""
+        return self.select_related(
+            "user__driver_profile",
+            "delivery_order__driver__user",
+        ).prefetch_related("items")
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ("pending", "Pending"),
@@ -141,20 +172,22 @@ class Order(models.Model):
     credit_user_id = models.IntegerField(null=True, blank=True)
     kitchen_note = models.TextField(blank=True)
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         ordering = ("-created_at",)
+        indexes = [models.Index(fields=["-created_at", "-id"])]
 
     def __str__(self):
         return f"{self.id} - {self.created_at} - {self.order_type}"
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-
+        # Allocate the invoice number up front so the order is written once
         if not self.invoice_number:
-            self.invoice_number = (
-                f"{self.id:04d}"  # Generates an invoice number with leading zeros
-            )
-            self.save(update_fields=["invoice_number"])
+            from restaurant_app.invoicing import next_invoice_number
+
+            self.invoice_number = next_invoice_number()
+        super().save(*args, **kwargs)
 
     def is_delivery_order(self):
         return self.order_type == "delivery"
@@ -166,10 +199,31 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     is_newly_added = models.BooleanField(default=False)
     variants = models.JSONField(default=list)
+    # Prices at order time, so bills and totals never change when a dish is
+    # repriced. Rows created before these columns existed are filled in by
+    # the backfill_order_item_prices command.
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    line_total = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
     def __str__(self):
         return f"{self.order.id} - {self.dish} - {self.quantity}"
 
+    def get_line_total(self):
+        # Rows written before the price columns existed are priced at the
+        # dish's current price until backfill_order_item_prices fills them in
+        if self.line_total is not None:
+            return self.line_total
+        return self.dish.price * self.quantity
+
+    def set_prices(self):
+        if self.unit_price is None:
+            self.unit_price = self.dish.price
+        self.line_total = self.unit_price * self.quantity
+
+    def save(self, *args, **kwargs):
+        self.set_prices()
+        super().save(*args, **kwargs)
+
 
 class Bill(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="bills")
@@ -180,6 +234,7 @@ class Bill(models.Model):
 
     class Meta:
         ordering = ("-billed_at",)
+        indexes = [models.Index(fields=["-billed_at", "-id"])]
 
     def __str__(self):
         return f"Bill for order {self.order.id}"
@@ -210,6 +265,7 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ("-created_at",)
+        indexes = [models.Index(fields=["-created_at", "-id"])]
 
     def __str__(self):
         return f"{self.message[:50]}..."
@@ -231,6 +287,51 @@ def create_notification_for_bills(sender, instance, created, **kwargs):
         )
 
 
+# Sales rollups read by the dashboard, maintained by restaurant_app/rollups.py
+class HourlySalesRollup(models.Model):
+    date = models.DateField()
+    hour = models.DateTimeField(unique=True)
+    order_count = models.PositiveIntegerField(default=0)
+    total_sales = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+
+    class Meta:
+        ordering = ("hour",)
+
+    def __str__(self):
+        return f"{self.hour} - {self.order_count} orders"
+
+
+class DishSalesRollup(models.Model):
+    date = models.DateField()
+    dish = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name="sales_rollups")
+    item_count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    sales = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+
+    class Meta:
+        ordering = ("date",)
+        unique_together = ("date", "dish")
+
+    def __str__(self):
+        return f"{self.date} - {self.dish_id} - {self.quantity}"
+
+
+class CategorySalesRollup(models.Model):
+    date = models.DateField()
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, related_name="sales_rollups"
+    )
+    quantity = models.PositiveIntegerField(default=0)
+    sales = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+
+    class Meta:
+        ordering = ("date",)
+        unique_together = ("date", "category")
+
+    def __str__(self):
+        return f"{self.date} - {self.category_id} - {self.sales}"
+
+
 class Floor(models.Model):
     name = models.CharField(max_length=100, unique=True)
 
@@ -338,9 +439,8 @@ class Menu(models.Model):
         return self.name
 
     def calculate_sub_total(self):
-        menu_items = self.menu_items.all()
-        total = sum(item.dish.price for item in menu_items) if menu_items else 0
-        self.sub_total = total
+        total = self.menu_items.aggregate(total=models.Sum("dish__price"))["total"]
+        self.sub_total = total or 0
         self.save()
 
 
@@ -361,13 +461,6 @@ class MenuItem(models.Model):
         return f"{self.dish.name}"
 
 
-# Signal handler to update Menu's sub_total
-@receiver(post_save, sender=MenuItem)
-def update_menu_sub_total(sender, instance, **kwargs):
-    menu = instance.menu
-    menu.calculate_sub_total()
-
-
 class Mess(models.Model):
     PAYMENT_METHOD_CHOICES = [
         ("cash", "Cash"),
@@ -507,16 +600,20 @@ class CreditUser(models.Model):
     def __str__(self):
         return self.username
 
+    # Balance changes go through restaurant_app.credit, which updates the row
+    # atomically in the database, and then reload the affected columns
+
     def add_to_total_due(self, amount):
-        self.total_due += amount
-        self.save()
+        from restaurant_app.credit import BALANCE_FIELDS, post_charge
+
+        post_charge(self.pk, amount)
+        self.refresh_from_db(fields=BALANCE_FIELDS)
 
     def make_payment(self, amount):
-        if amount > self.total_due:
-            amount = self.total_due
-        self.total_due -= amount
-        self.due_date = timezone.now()
-        self.save()
+        from restaurant_app.credit import BALANCE_FIELDS, post_payment
+
+        post_payment(self.pk, amount)
+        self.refresh_from_db(fields=BALANCE_FIELDS)
 
     def save(self, *args, **kwargs):
         if self.total_due > 0:
@@ -565,16 +662,11 @@ class CreditTransaction(models.Model):
         return f"Transaction on {self.date} - {self.status}"
 
     def save(self, *args, **kwargs):
-        if self.credit_user and self.credit_user.total_due > 0:
-            self.status = 'due'
-        else:
-            self.status = 'completed'
-
-        super().save(*args, **kwargs)
+        from restaurant_app.credit import BALANCE_FIELDS, record_transaction
 
-        if self.credit_user:
-            self.credit_user.total_due -= self.received_amount
-            self.credit_user.save()
+        record_transaction(self, lambda: super(CreditTransaction, self).save(*args, **kwargs))
+        if self.credit_user_id and CreditTransaction.credit_user.is_cached(self):
+            self.credit_user.refresh_from_db(fields=BALANCE_FIELDS)
 
     
 
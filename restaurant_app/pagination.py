@@ -0,0 +1,135 @@
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination on the view's ``keyset_ordering`` field with the primary
+    key as a tiebreaker, so every page is an indexed range scan with no
+    COUNT(*) or OFFSET.
+    """
+
+    cursor_query_param = "cursor"
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+
+        ordering = getattr(view, "keyset_ordering", "-pk")
+        self.descending = ordering.startswith("-")
+        self.field_name = ordering.lstrip("-")
+        self.model_field = queryset.model._meta.get_field(self.field_name)
+
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor["reverse"]
+
+        # Walk backwards through the keyset when following a "previous" link
+        descending = self.descending != reverse
+        prefix = "-" if descending else ""
+        queryset = queryset.order_by(f"{prefix}{self.field_name}", f"{prefix}pk")
+
+        if cursor is not None:
+            lookup = "lt" if descending else "gt"
+            queryset = queryset.filter(
+                Q(**{f"{self.field_name}__{lookup}": cursor["value"]})
+                | Q(**{self.field_name: cursor["value"], f"pk__{lookup}": cursor["pk"]})
+            )
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, obj, reverse):
+        value = getattr(obj, self.field_name)
+        payload = json.dumps([reverse, value.isoformat(), obj.pk])
+        encoded = b64encode(payload.encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            reverse, value, pk = json.loads(b64decode(encoded.encode("ascii")))
+            value = self.model_field.to_python(value)
+            pk = int(pk)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return {"reverse": bool(reverse), "value": value, "pk": pk}
+
+
+class PageNumberOrKeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination by default; clients opt in to keyset pagination
+    per request with ``?pagination=cursor`` and then follow the cursor links.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (
+            request.query_params.get("pagination") == "cursor"
+            or KeysetPagination.cursor_query_param in request.query_params
+        ):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
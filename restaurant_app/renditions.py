@@ -0,0 +1,134 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from restaurant_app.catalog import bump_version
+from restaurant_app.models import Dish, LogoInfo
+
+logger = logging.getLogger(__name__)
+
+
+# name -> (bounding box, format, crop to exactly the box)
+RENDITIONS = {
+    "thumbnail": ((200, 200), "JPEG", True),
+    "thumbnail_webp": ((200, 200), "WEBP", True),
+    "webp": ((1024, 1024), "WEBP", False),
+}
+
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+
+# Image fields with renditions; each stores them in "<field>_renditions"
+IMAGE_FIELDS = {
+    Dish: ["image"],
+    LogoInfo: ["main_logo", "print_logo"],
+}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.RENDITION_WORKERS, thread_name_prefix="renditions"
+        )
+    return _executor
+
+
+def rendition_name(source_name, rendition, image_format):
+    stem = os.path.splitext(source_name)[0]
+    return f"renditions/{stem}_{rendition}.{EXTENSIONS[image_format]}"
+
+
+def render(image, size, image_format, crop):
+    if crop:
+        image = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+    else:
+        image = image.copy()
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+
+    if image_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=80, optimize=True)
+    return buffer.getvalue()
+
+
+def generate_renditions(model, pk, field):
+    """Render every size of ``field`` for one row and record the paths on it."""
+    try:
+        instance = model.objects.filter(pk=pk).only(field).first()
+        source_name = getattr(instance, field).name if instance else None
+        if not source_name:
+            return False
+
+        renditions = {"source": source_name}
+        try:
+            with default_storage.open(source_name) as source_file:
+                with Image.open(source_file) as image:
+                    image = ImageOps.exif_transpose(image)
+                    for rendition, (size, image_format, crop) in RENDITIONS.items():
+                        name = rendition_name(source_name, rendition, image_format)
+                        content = render(image, size, image_format, crop)
+                        if default_storage.exists(name):
+                            default_storage.delete(name)
+                        renditions[rendition] = default_storage.save(
+                            name, ContentFile(content)
+                        )
+        except OSError:
+            # Missing or unreadable file: remember the source so it is not
+            # retried on every save, and keep serving the original
+            logger.warning("Could not read image %s for renditions", source_name)
+            renditions = {"source": source_name}
+
+        # Skip the write if the image was replaced while rendering
+        updated = model.objects.filter(pk=pk, **{field: source_name}).update(
+            **{f"{field}_renditions": renditions}
+        )
+        generated = bool(updated) and len(renditions) > 1
+        if generated and model is Dish:
+            # Dish payloads in the catalog snapshot and search index carry the URLs
+            bump_version()
+        return generated
+    except Exception:
+        logger.exception("Could not generate renditions for %s %s.%s", model.__name__, pk, field)
+        return False
+
+
+def run_in_worker(model, pk, field):
+    try:
+        return generate_renditions(model, pk, field)
+    finally:
+        # Pool threads open their own connection; release it between jobs
+        connection.close()
+
+
+def schedule_renditions(model, pk, field):
+    # Run after commit so the worker sees the saved row and uploaded file
+    transaction.on_commit(
+        lambda: get_executor().submit(run_in_worker, model, pk, field)
+    )
+
+
+def needs_renditions(instance, field):
+    source_name = getattr(instance, field).name
+    renditions = getattr(instance, f"{field}_renditions") or {}
+    return bool(source_name) and renditions.get("source") != source_name
+
+
+@receiver(post_save, sender=Dish)
+@receiver(post_save, sender=LogoInfo)
+def create_renditions_on_upload(sender, instance, **kwargs):
+    for field in IMAGE_FIELDS[sender]:
+        if needs_renditions(instance, field):
+            schedule_renditions(sender, instance.pk, field)
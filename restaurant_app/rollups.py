@@ -0,0 +1,352 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, When
+from django.db.models.functions import Coalesce, TruncDate, TruncHour
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from restaurant_app.models import (
+    CategorySalesRollup,
+    DishSalesRollup,
+    Dish,
+    HourlySalesRollup,
+    Order,
+    OrderItem,
+)
+
+# Every order and item write works out its own difference to the rollup rows
+# and adds it once its transaction commits, with a fixed number of F()
+# statements per table, so a day is never rescanned and order writers never
+# hold the shared hour and dish rows. rebuild_rollups recomputes a date range
+# from the raw rows.
+
+ORDER_FIELDS = ("created_at", "total_amount")
+ITEM_FIELDS = ("order_id", "dish_id", "quantity", "line_total")
+
+
+def rebuild_rollups(from_date=None, to_date=None):
+    """Recompute every rollup row for the given date range (inclusive)."""
+    orders = Order.objects.all()
+    items = OrderItem.objects.all()
+    hourly_rollups = HourlySalesRollup.objects.all()
+    dish_rollups = DishSalesRollup.objects.all()
+    category_rollups = CategorySalesRollup.objects.all()
+
+    if from_date:
+        orders = orders.filter(created_at__date__gte=from_date)
+        items = items.filter(order__created_at__date__gte=from_date)
+        hourly_rollups = hourly_rollups.filter(date__gte=from_date)
+        dish_rollups = dish_rollups.filter(date__gte=from_date)
+        category_rollups = category_rollups.filter(date__gte=from_date)
+    if to_date:
+        orders = orders.filter(created_at__date__lte=to_date)
+        items = items.filter(order__created_at__date__lte=to_date)
+        hourly_rollups = hourly_rollups.filter(date__lte=to_date)
+        dish_rollups = dish_rollups.filter(date__lte=to_date)
+        category_rollups = category_rollups.filter(date__lte=to_date)
+
+    hourly = (
+        orders.annotate(date=TruncDate("created_at"), hour=TruncHour("created_at"))
+        .values("date", "hour")
+        .annotate(order_count=Count("id"), total_sales=Sum("total_amount"))
+        .order_by()
+    )
+    # Rows not yet backfilled are counted at the dish's current price
+    items = items.annotate(
+        date=TruncDate("order__created_at"),
+        amount=Coalesce(
+            "line_total",
+            F("dish__price") * F("quantity"),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ),
+    )
+    dishes = (
+        items.values("date", "dish")
+        .annotate(
+            item_count=Count("id"),
+            total_quantity=Sum("quantity"),
+            total_sales=Sum("amount"),
+        )
+        .order_by()
+    )
+    categories = (
+        items.values("date", "dish__category")
+        .annotate(
+            total_quantity=Sum("quantity"),
+            total_sales=Sum("amount"),
+        )
+        .order_by()
+    )
+
+    with transaction.atomic():
+        hourly_rollups.delete()
+        dish_rollups.delete()
+        category_rollups.delete()
+
+        HourlySalesRollup.objects.bulk_create(
+            (HourlySalesRollup(**row) for row in hourly.iterator()), batch_size=1000
+        )
+        DishSalesRollup.objects.bulk_create(
+            (
+                DishSalesRollup(
+                    date=row["date"],
+                    dish_id=row["dish"],
+                    item_count=row["item_count"],
+                    quantity=row["total_quantity"],
+                    sales=row["total_sales"],
+                )
+                for row in dishes.iterator()
+            ),
+            batch_size=1000,
+        )
+        CategorySalesRollup.objects.bulk_create(
+            (
+                CategorySalesRollup(
+                    date=row["date"],
+                    category_id=row["dish__category"],
+                    quantity=row["total_quantity"],
+                    sales=row["total_sales"],
+                )
+                for row in categories.iterator()
+            ),
+            batch_size=1000,
+        )
+
+
+# Field that reaches zero once nothing is left in a rollup row
+COUNT_FIELDS = {
+    HourlySalesRollup: "order_count",
+    DishSalesRollup: "item_count",
+    CategorySalesRollup: "quantity",
+}
+
+# Fields identifying a rollup row, in the order of the keys passed around
+KEY_FIELDS = {
+    HourlySalesRollup: ("hour",),
+    DishSalesRollup: ("date", "dish_id"),
+    CategorySalesRollup: ("date", "category_id"),
+}
+
+
+def add_to_rollups(model, deltas, defaults=None):
+    """
+    Queue ``deltas``, a {key: {field: amount}} mapping keyed as in
+    KEY_FIELDS, to be added to the rollup rows once the writer commits.
+    """
+    deltas = {key: fields for key, fields in deltas.items() if any(fields.values())}
+    if deltas:
+        # Each write carries its own deltas, so a rolled back savepoint
+        # drops exactly the deltas written inside it
+        transaction.on_commit(
+            lambda: apply_rollup_deltas(model, deltas, defaults or {}), robust=True
+        )
+
+
+def apply_rollup_deltas(model, deltas, defaults):
+    """
+    Add ``deltas`` to the rollup rows with a fixed number of statements,
+    creating rows as needed and removing emptied ones as a rebuild would.
+    """
+    key_fields = KEY_FIELDS[model]
+    count_field = COUNT_FIELDS[model]
+
+    def rows(keys):
+        condition = Q()
+        for key in keys:
+            condition |= Q(**dict(zip(key_fields, key)))
+        return model.objects.filter(condition)
+
+    with transaction.atomic():
+        # Locked in primary key order so concurrent writers cannot deadlock
+        existing = set(
+            rows(deltas).select_for_update().order_by("pk").values_list(*key_fields)
+        )
+        # A missing row that is being reduced, e.g. one removed together
+        # with its dish, has nothing to take away from
+        missing = [
+            key for key in sorted(deltas)
+            if key not in existing and deltas[key][count_field] > 0
+        ]
+        if missing:
+            new_rows = [
+                model(**dict(zip(key_fields, key)), **defaults.get(key, {}), **deltas[key])
+                for key in missing
+            ]
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create(new_rows)
+            except IntegrityError:
+                # Another writer created some of them first; add to those instead
+                for row, key in zip(new_rows, missing):
+                    try:
+                        with transaction.atomic():
+                            row.save(force_insert=True)
+                    except IntegrityError:
+                        existing.add(key)
+
+        keys = [key for key in deltas if key in existing]
+        if not keys:
+            return
+        changes = {}
+        for field in {field for key in keys for field in deltas[key]}:
+            whens = [
+                When(Q(**dict(zip(key_fields, key))), then=F(field) + deltas[key][field])
+                for key in keys
+                if deltas[key].get(field)
+            ]
+            if whens:
+                changes[field] = Case(
+                    *whens, default=F(field), output_field=model._meta.get_field(field)
+                )
+        rows(keys).update(**changes)
+        if any(deltas[key][count_field] < 0 for key in keys):
+            rows(keys).filter(**{count_field: 0}).delete()
+
+
+def _money(value):
+    if value is None:
+        return Decimal(0)
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def apply_order_change(previous, current):
+    """Move an order's (created_at, total_amount) contribution between hours."""
+    if previous == current:
+        return
+    deltas = defaultdict(lambda: {"order_count": 0, "total_sales": Decimal(0)})
+    for state, sign in ((previous, -1), (current, 1)):
+        if state is None or state[0] is None:
+            continue
+        created_at, total_amount = state
+        hour = timezone.localtime(created_at).replace(minute=0, second=0, microsecond=0)
+        deltas[(hour,)]["order_count"] += sign
+        deltas[(hour,)]["total_sales"] += sign * _money(total_amount)
+    add_to_rollups(
+        HourlySalesRollup, deltas, defaults={key: {"date": key[0].date()} for key in deltas}
+    )
+
+
+def apply_item_changes(changes):
+    """
+    Apply item contributions given as (order id, dish id, quantity, line
+    total, sign) tuples, merged per dish and category and day.
+    """
+    changes = [change for change in changes if change[0] and change[1]]
+    if not changes:
+        return
+    days = {
+        pk: timezone.localdate(created_at)
+        for pk, created_at in Order.objects.filter(
+            pk__in={change[0] for change in changes}
+        ).values_list("pk", "created_at")
+    }
+    dish_rows = Dish.objects.filter(pk__in={change[1] for change in changes}).values_list(
+        "pk", "category_id", "price"
+    )
+    categories = {pk: category_id for pk, category_id, _ in dish_rows}
+    prices = {pk: price for pk, _, price in dish_rows}
+
+    dishes = defaultdict(lambda: [0, 0, Decimal(0)])
+    category_totals = defaultdict(lambda: [0, Decimal(0)])
+    for order_id, dish_id, quantity, line_total, sign in changes:
+        day = days.get(order_id)
+        if day is None or dish_id not in prices:
+            continue
+        if line_total is None:
+            # Not yet backfilled: counted at the dish's current price
+            line_total = prices[dish_id] * quantity
+        dish = dishes[day, dish_id]
+        dish[0] += sign
+        dish[1] += sign * quantity
+        dish[2] += sign * _money(line_total)
+        if dish_id in categories:
+            category = category_totals[day, categories[dish_id]]
+            category[0] += sign * quantity
+            category[1] += sign * _money(line_total)
+
+    add_to_rollups(
+        DishSalesRollup,
+        {
+            key: {"item_count": item_count, "quantity": quantity, "sales": sales}
+            for key, (item_count, quantity, sales) in dishes.items()
+        },
+    )
+    add_to_rollups(
+        CategorySalesRollup,
+        {
+            key: {"quantity": quantity, "sales": sales}
+            for key, (quantity, sales) in category_totals.items()
+        },
+    )
+
+
+def item_state(item):
+    return tuple(getattr(item, field) for field in ITEM_FIELDS)
+
+
+def record_items(items):
+    """Add items written with bulk_create, which sends no post_save."""
+    apply_item_changes([(*item_state(item), 1) for item in items])
+    for item in items:
+        item._rollup_state = item_state(item)
+
+
+def _snapshot(instance, fields):
+    deferred = instance.get_deferred_fields()
+    if any(field in deferred for field in fields):
+        return None
+    return tuple(getattr(instance, field) for field in fields)
+
+
+@receiver(post_init, sender=Order)
+def remember_order(sender, instance, **kwargs):
+    instance._rollup_state = _snapshot(instance, ORDER_FIELDS) if instance.pk else None
+
+
+@receiver(post_init, sender=OrderItem)
+def remember_order_item(sender, instance, **kwargs):
+    instance._rollup_state = _snapshot(instance, ITEM_FIELDS) if instance.pk else None
+
+
+@receiver(pre_save, sender=Order)
+@receiver(pre_save, sender=OrderItem)
+def load_previous_state(sender, instance, **kwargs):
+    # Only rows loaded with deferred fields need to look up what they replace
+    if instance._rollup_state is None and instance.pk:
+        fields = ORDER_FIELDS if sender is Order else ITEM_FIELDS
+        instance._rollup_state = (
+            sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+        )
+
+
+@receiver(post_save, sender=Order)
+def update_rollups_for_order(sender, instance, created, **kwargs):
+    current = _snapshot(instance, ORDER_FIELDS)
+    apply_order_change(None if created else instance._rollup_state, current)
+    instance._rollup_state = current
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_from_rollups(sender, instance, **kwargs):
+    apply_order_change((instance.created_at, instance.total_amount), None)
+
+
+@receiver(post_save, sender=OrderItem)
+def update_rollups_for_order_item(sender, instance, created, **kwargs):
+    current = item_state(instance)
+    previous = None if created else instance._rollup_state
+    if previous == current:
+        return
+    changes = [(*current, 1)]
+    if previous is not None:
+        changes.append((*previous, -1))
+    apply_item_changes(changes)
+    instance._rollup_state = current
+
+
+@receiver(post_delete, sender=OrderItem)
+def remove_order_item_from_rollups(sender, instance, **kwargs):
+    # Items deleted along with their order go before it, so the order's
+    # date can still be read
+    apply_item_changes([(*item_state(instance), -1)])
@@ -0,0 +1,148 @@
+import re
+import threading
+import time
+from collections import defaultdict
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from restaurant_app.catalog import current_version
+from restaurant_app.models import Category, Dish
+from restaurant_app.serializers import DishSerializer
+
+
+# How often a process checks the shared catalog version for changes made by
+# other workers. Changes made by this process mark the index stale at once.
+INDEX_REFRESH_SECONDS = 5
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+
+# A query token matches a dish token when at least this share of its
+# trigrams appear in it, which tolerates a typo or two in longer words.
+MIN_SIMILARITY = 0.5
+
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "description": 1.0}
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def trigrams(token):
+    # Only the start of the word is padded so that a partly typed word
+    # matches the beginning of longer words
+    padded = f"  {token}"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class DishSearchIndex:
+    def __init__(self, dishes):
+        self.documents = {}
+        self.names = {}
+        # token -> {dish id: best field weight}
+        self.postings = defaultdict(dict)
+        # trigram -> tokens containing it
+        self.trigram_tokens = defaultdict(set)
+
+        for dish, data in dishes:
+            self.documents[dish.id] = data
+            self.names[dish.id] = dish.name.lower()
+            fields = {
+                "name": dish.name,
+                "category": dish.category.name,
+                "description": dish.description,
+            }
+            for field, text in fields.items():
+                weight = FIELD_WEIGHTS[field]
+                for token in tokenize(text):
+                    postings = self.postings[token]
+                    postings[dish.id] = max(postings.get(dish.id, 0), weight)
+
+        for token in self.postings:
+            for trigram in trigrams(token):
+                self.trigram_tokens[trigram].add(token)
+
+    def match_token(self, query_token):
+        """Return {dish token: similarity} for tokens close to ``query_token``."""
+        query_trigrams = trigrams(query_token)
+        shared = defaultdict(int)
+        for trigram in query_trigrams:
+            for token in self.trigram_tokens.get(trigram, ()):
+                shared[token] += 1
+
+        matches = {}
+        for token, count in shared.items():
+            if token == query_token:
+                similarity = 1.5
+            elif token.startswith(query_token):
+                similarity = 1.0
+            else:
+                similarity = count / len(query_trigrams)
+            if similarity >= MIN_SIMILARITY:
+                matches[token] = similarity
+        return matches
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+
+        scores = None
+        for query_token in query_tokens:
+            token_scores = defaultdict(float)
+            for token, similarity in self.match_token(query_token).items():
+                for dish_id, weight in self.postings[token].items():
+                    token_scores[dish_id] = max(
+                        token_scores[dish_id], similarity * weight
+                    )
+
+            # Every word of the query has to match somewhere in the dish
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {
+                    dish_id: score + token_scores[dish_id]
+                    for dish_id, score in scores.items()
+                    if dish_id in token_scores
+                }
+            if not scores:
+                return []
+
+        ranked = sorted(scores, key=lambda dish_id: (-scores[dish_id], self.names[dish_id]))
+        return [self.documents[dish_id] for dish_id in ranked[:limit]]
+
+
+def build_index():
+    dishes = list(Dish.objects.select_related("category"))
+    data = DishSerializer(dishes, many=True).data
+    return DishSearchIndex(zip(dishes, data))
+
+
+_state = {"index": None, "version": None, "checked_at": 0.0}
+_build_lock = threading.Lock()
+
+
+def get_index():
+    """Return the current index, rebuilding it when the catalog has changed."""
+    now = time.monotonic()
+    if _state["index"] is not None and now - _state["checked_at"] < INDEX_REFRESH_SECONDS:
+        return _state["index"]
+
+    with _build_lock:
+        if _state["index"] is not None and now - _state["checked_at"] < INDEX_REFRESH_SECONDS:
+            return _state["index"]
+        version = current_version()
+        if _state["index"] is None or version != _state["version"]:
+            _state["index"] = build_index()
+            _state["version"] = version
+        _state["checked_at"] = time.monotonic()
+        return _state["index"]
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+def mark_index_stale(sender, **kwargs):
+    _state["checked_at"] = 0.0
@@ -1,11 +1,17 @@
+from decimal import Decimal
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import update_last_login
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
 from delivery_drivers.models import DeliveryDriver
 from restaurant_app.models import *
+from restaurant_app.invoicing import allocate_invoice_numbers, next_invoice_number
+from restaurant_app.menus import mark_menu_dirty
+from restaurant_app.rollups import record_items
 
 
 
@@ -82,12 +88,32 @@ class PasscodeLoginSerializer(serializers.Serializer):
             "access": str(refresh.access_token),
         }
 
+def rendition_urls(renditions, request=None):
+    """Map rendition names to URLs; empty until the background job has run."""
+    urls = {}
+    for name, path in (renditions or {}).items():
+        if name == "source":
+            continue
+        url = default_storage.url(path)
+        urls[name] = request.build_absolute_uri(url) if request else url
+    return urls
+
+
 # serializer to change the logo for the company
 
 class LogoInfoSerializer(serializers.ModelSerializer):
+    main_logo_renditions = serializers.SerializerMethodField()
+    print_logo_renditions = serializers.SerializerMethodField()
+
     class Meta:
         model = LogoInfo
         fields = '__all__'
+
+    def get_main_logo_renditions(self, obj):
+        return rendition_urls(obj.main_logo_renditions, self.context.get("request"))
+
+    def get_print_logo_renditions(self, obj):
+        return rendition_urls(obj.print_logo_renditions, self.context.get("request"))
         
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -97,6 +123,8 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 class DishSerializer(serializers.ModelSerializer):
+    image_renditions = serializers.SerializerMethodField()
+
     class Meta:
         model = Dish
         fields = [
@@ -105,21 +133,107 @@ class DishSerializer(serializers.ModelSerializer):
             "description",
             "price",
             "image",
+            "image_renditions",
             "category",
         ]
 
+    def get_image_renditions(self, obj):
+        return rendition_urls(obj.image_renditions, self.context.get("request"))
+
 
 class DishVariantSerializer(serializers.ModelSerializer):
     class Meta:
         model = DishVariant
         fields = ['id', 'name','dish']
 
+def _collect_dish_ids(items_data):
+    dish_ids = set()
+    for item in items_data if isinstance(items_data, list) else []:
+        if isinstance(item, dict):
+            try:
+                dish_ids.add(int(item.get("dish")))
+            except (TypeError, ValueError):
+                pass
+    return dish_ids
+
+
+class OrderItemDishField(serializers.PrimaryKeyRelatedField):
+    """Resolves dishes from the map preloaded by the list serializer, if any."""
+
+    def to_internal_value(self, data):
+        dish_cache = getattr(self.root, "_dish_cache", None)
+        if dish_cache is None:
+            return super().to_internal_value(data)
+        try:
+            return dish_cache[int(data)]
+        except KeyError:
+            self.fail("does_not_exist", pk_value=data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+
+class OrderItemListSerializer(serializers.ListSerializer):
+
+    def to_internal_value(self, data):
+        # Load every dish referenced by the order in one query instead of
+        # one lookup per line.
+        if getattr(self.root, "_dish_cache", None) is None:
+            self.root._dish_cache = Dish.objects.in_bulk(_collect_dish_ids(data))
+        return super().to_internal_value(data)
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
-    dish = serializers.PrimaryKeyRelatedField(queryset=Dish.objects.all())
+    dish = OrderItemDishField(queryset=Dish.objects.all())
 
     class Meta:
         model = OrderItem
         fields = ["dish", "quantity","is_newly_added","variants"]
+        list_serializer_class = OrderItemListSerializer
+
+
+def build_order_items(order, items_data, **extra):
+    """Return unsaved OrderItem rows for ``order`` and their combined price."""
+    order_items = []
+    items_total = 0
+    for item_data in items_data:
+        order_item = OrderItem(order=order, **{**item_data, **extra})
+        order_item.set_prices()
+        items_total += order_item.line_total
+        order_items.append(order_item)
+    return order_items, items_total
+
+
+class OrderListSerializer(serializers.ListSerializer):
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            dish_ids = set()
+            for order_data in data:
+                if isinstance(order_data, dict):
+                    dish_ids |= _collect_dish_ids(order_data.get("items"))
+            self._dish_cache = Dish.objects.in_bulk(dish_ids)
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        user = self.context["request"].user
+        orders = []
+        order_items = []
+
+        # Reserve invoice numbers before the transaction so the worker's
+        # block reservation is committed independently of the orders
+        unnumbered = [attrs for attrs in validated_data if not attrs.get("invoice_number")]
+        invoice_numbers = allocate_invoice_numbers(len(unnumbered)) if unnumbered else []
+        for attrs, invoice_number in zip(unnumbered, invoice_numbers):
+            attrs["invoice_number"] = invoice_number
+
+        with transaction.atomic():
+            for attrs in validated_data:
+                order, items = self.child.create_order(user, attrs)
+                orders.append(order)
+                order_items.extend(items)
+            OrderItem.objects.bulk_create(order_items)
+            record_items(order_items)
+        return orders
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -153,23 +267,30 @@ class OrderSerializer(serializers.ModelSerializer):
             "delivery_order_status",
             "kitchen_note"
         ]
+        list_serializer_class = OrderListSerializer
 
-    def create(self, validated_data):
+    def create_order(self, user, validated_data):
+        """Insert the order with its final total and return its unsaved items."""
         items_data = validated_data.pop("items")
-        user = self.context["request"].user
-        order = Order.objects.create(user=user, **validated_data)
-        total_amount = 0
+        order = Order(user=user, **validated_data)
+        order_items, total_amount = build_order_items(order, items_data)
 
-        for item_data in items_data:
-            order_item = OrderItem.objects.create(order=order, **item_data)
-            total_amount += order_item.quantity * order_item.dish.price
-        
         # Add delivery charge to total amount if it's not the default value
         if order.delivery_charge != 0:
             total_amount += order.delivery_charge
 
         order.total_amount = total_amount
         order.save()
+        return order, order_items
+
+    def create(self, validated_data):
+        user = self.context["request"].user
+        if not validated_data.get("invoice_number"):
+            validated_data["invoice_number"] = next_invoice_number()
+        with transaction.atomic():
+            order, order_items = self.create_order(user, validated_data)
+            OrderItem.objects.bulk_create(order_items)
+            record_items(order_items)
         return order
 
     def update(self, instance, validated_data):
@@ -181,15 +302,17 @@ class OrderSerializer(serializers.ModelSerializer):
         total_amount = 0
 
         # Sum existing items' total amount
-        for existing_item in instance.items.all():
-            total_amount += existing_item.quantity * existing_item.dish.price
+        for existing_item in instance.items.select_related("dish"):
+            total_amount += existing_item.get_line_total()
 
-        # Add new items' total amount
+        # Add new items' total amount, marking them as newly added
         if items_data:
-            for item_data in items_data:
-                item_data['is_newly_added'] = True  # Marking as newly added
-                order_item = OrderItem.objects.create(order=instance, **item_data)
-                total_amount += order_item.quantity * order_item.dish.price
+            new_items, new_items_total = build_order_items(
+                instance, items_data, is_newly_added=True
+            )
+            OrderItem.objects.bulk_create(new_items)
+            record_items(new_items)
+            total_amount += new_items_total
         
         # Add delivery charge to total amount if it's not the default value
         if instance.delivery_charge != 0:
@@ -311,7 +434,7 @@ class BillOrderItemSerializer(serializers.ModelSerializer):
         fields = ['dish_name', 'quantity', 'item_total']
 
     def get_item_total(self, obj):
-        return obj.dish.price * obj.quantity
+        return obj.get_line_total()
     
 
 class BillOrderSerializer(serializers.ModelSerializer):
@@ -326,7 +449,7 @@ class BillOrderSerializer(serializers.ModelSerializer):
                   'delivery_charge', 'sub_total']
 
     def get_sub_total(self, obj):
-        return sum(item.dish.price * item.quantity for item in obj.items.all())
+        return sum(item.get_line_total() for item in obj.items.all())
     
 
 class BillSerializer(serializers.ModelSerializer):
@@ -391,6 +514,19 @@ class MessTypeSerializer(serializers.ModelSerializer):
         fields = ["id", "name"]
 
 
+class MenuItemListSerializer(serializers.ListSerializer):
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            menu_items = MenuItem.objects.bulk_create(
+                MenuItem(**attrs) for attrs in validated_data
+            )
+            # bulk_create sends no post_save, so queue the recompute here
+            for menu_id in {menu_item.menu_id for menu_item in menu_items}:
+                mark_menu_dirty(menu_id)
+        return menu_items
+
+
 class MenuItemSerializer(serializers.ModelSerializer):
     dish = DishSerializer(read_only=True)
     dish_id = serializers.PrimaryKeyRelatedField(
@@ -400,6 +536,7 @@ class MenuItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = MenuItem
         fields = ["id", "menu", "dish", "dish_id", "meal_type"]
+        list_serializer_class = MenuItemListSerializer
 
 
 class MenuSerializer(serializers.ModelSerializer):
@@ -508,3 +645,12 @@ class CreditTransactionSerializer(serializers.ModelSerializer):
         model = CreditTransaction
         fields = '__all__'
         read_only_fields = ['status']
+
+
+class CreditSettlementSerializer(serializers.ModelSerializer):
+    credit_user = serializers.PrimaryKeyRelatedField(queryset=CreditUser.objects.all())
+    received_amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal("0.01"))
+
+    class Meta:
+        model = CreditTransaction
+        fields = ['credit_user', 'received_amount', 'payment_method', 'cash_amount', 'bank_amount']
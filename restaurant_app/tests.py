@@ -1,3 +1,551 @@
-from django.test import TestCase
+import csv
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from restaurant_app import invoicing
+from restaurant_app.credit import post_charge, settle
+from restaurant_app.exports import SALES_REPORT_COLUMNS
+from restaurant_app.invoicing import allocate_invoice_numbers, sequence_key
+from restaurant_app.models import (
+    Bill,
+    Category,
+    CategorySalesRollup,
+    CreditOrder,
+    CreditTransaction,
+    CreditUser,
+    Dish,
+    DishSalesRollup,
+    HourlySalesRollup,
+    InvoiceSequence,
+    Order,
+    OrderItem,
+    User,
+)
+from restaurant_app.rollups import rebuild_rollups
 
-# Create your tests here.
+
+class StaffAPITestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username="staff", email="staff@example.com", role="staff", passcode="111111"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Main")
+        self.dishes = [
+            Dish.objects.create(
+                name=f"Dish {i}", description="Dish", price=Decimal("10.50") + i, category=category
+            )
+            for i in range(3)
+        ]
+
+    def create_order(self, *items, **fields):
+        response = self.client.post(
+            "/api/orders/",
+            {
+                "items": [{"dish": dish.pk, "quantity": quantity} for dish, quantity in items],
+                "total_amount": 0,
+                **fields,
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return Order.objects.get(pk=response.data["id"])
+
+    def rollups(self):
+        return (
+            set(HourlySalesRollup.objects.values_list("hour", "date", "order_count", "total_sales")),
+            set(DishSalesRollup.objects.values_list("date", "dish", "item_count", "quantity", "sales")),
+            set(CategorySalesRollup.objects.values_list("date", "category", "quantity", "sales")),
+        )
+
+    def assertMatchesRebuild(self):
+        maintained = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(maintained, self.rollups())
+
+
+class SalesRollupTests(StaffAPITestCase):
+    """Rollups maintained write by write must match a rebuild from the raw rows."""
+
+    def test_rollups_follow_order_writes(self):
+        # Rollups are applied once each write commits
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.create_order((self.dishes[0], 2), (self.dishes[1], 1))
+            second = self.create_order((self.dishes[0], 1))
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/orders/{first.pk}/",
+                {"items": [{"dish": self.dishes[2].pk, "quantity": 3}]},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 200, response.data)
+            item = first.items.get(dish=self.dishes[0])
+            item.quantity = 5
+            item.save()
+            first.items.get(dish=self.dishes[1]).delete()
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertMatchesRebuild()
+        self.assertEqual(
+            HourlySalesRollup.objects.get().order_count, Order.objects.count()
+        )
+
+    def flush_queries(self, *items):
+        before = self.rollups()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.create_order(*items)
+        # Nothing is written to the rollups until the order commits
+        self.assertEqual(self.rollups(), before)
+        with CaptureQueriesContext(connection) as queries:
+            for callback in callbacks:
+                callback()
+        return len(queries)
+
+    def test_rollups_are_written_after_commit(self):
+        all_dishes = [(dish, 1) for dish in self.dishes]
+        self.flush_queries(*all_dishes)
+        self.assertEqual(HourlySalesRollup.objects.get().order_count, 1)
+        # However many dishes an order has, each table costs the same statements
+        self.assertEqual(self.flush_queries((self.dishes[0], 1)), self.flush_queries(*all_dishes))
+        self.assertEqual(HourlySalesRollup.objects.get().order_count, 3)
+        self.assertMatchesRebuild()
+
+        # Writes rolled back with a savepoint leave the rollups alone
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.create_order((self.dishes[0], 4))
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        self.assertMatchesRebuild()
+
+
+class LegacyOrderItemTests(StaffAPITestCase):
+    """Items from before the price columns existed, not yet backfilled."""
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order = self.create_order((self.dishes[0], 2))
+        OrderItem.objects.update(unit_price=None, line_total=None)
+
+    def test_order_edit_prices_legacy_items_at_dish_price(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/orders/{self.order.pk}/",
+                {"items": [{"dish": self.dishes[1].pk, "quantity": 1}]},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, self.dishes[0].price * 2 + self.dishes[1].price)
+        self.assertMatchesRebuild()
+
+    def test_bill_lists_legacy_items(self):
+        bill = Bill.objects.create(
+            order=self.order, user=self.user, total_amount=self.order.total_amount, paid=True
+        )
+        response = self.client.get(f"/api/bills/{bill.pk}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            Decimal(str(response.data["order"]["sub_total"])), self.dishes[0].price * 2
+        )
+
+
+@override_settings(INVOICE_OUTLET="main", INVOICE_NUMBER_FORMAT="{outlet}-{number:04d}")
+class BulkOrderTests(StaffAPITestCase):
+    def post_bulk(self, orders):
+        return self.client.post(
+            "/api/orders/bulk/",
+            [
+                {
+                    "items": [{"dish": dish, "quantity": quantity} for dish, quantity in items],
+                    "total_amount": 0,
+                    **fields,
+                }
+                for items, fields in orders
+            ],
+            format="json",
+        )
+
+    def test_bulk_orders_are_priced_and_numbered(self):
+        first, second, third = self.dishes
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_bulk(
+                [
+                    ([(first.pk, 2), (second.pk, 1)], {}),
+                    # A submitted total is ignored; the delivery charge is added
+                    ([(third.pk, 3)], {"total_amount": "999.00", "delivery_charge": "5.00"}),
+                    ([(first.pk, 1)], {"invoice_number": "MANUAL-1"}),
+                    ([(second.pk, 4)], {}),
+                ]
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        orders = [Order.objects.get(pk=row["id"]) for row in response.data]
+        self.assertEqual(
+            [order.total_amount for order in orders],
+            [Decimal("32.50"), Decimal("42.50"), Decimal("10.50"), Decimal("46.00")],
+        )
+        self.assertEqual(
+            [Decimal(row["total_amount"]) for row in response.data],
+            [order.total_amount for order in orders],
+        )
+        # Numbers are handed out in request order, skipping the numbered order
+        self.assertEqual(
+            [order.invoice_number for order in orders],
+            ["main-0001", "main-0002", "MANUAL-1", "main-0003"],
+        )
+        self.assertEqual(
+            sorted(
+                OrderItem.objects.filter(order=orders[0]).values_list("dish", "quantity", "unit_price", "line_total")
+            ),
+            sorted(
+                [
+                    (first.pk, 2, first.price, first.price * 2),
+                    (second.pk, 1, second.price, second.price),
+                ]
+            ),
+        )
+        self.assertMatchesRebuild()
+
+        # A single order continues the same sequence
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self.create_order((third, 1))
+        self.assertEqual(order.invoice_number, "main-0004")
+        self.assertEqual(order.total_amount, third.price)
+
+    def test_one_invalid_order_rejects_the_batch(self):
+        response = self.post_bulk(
+            [([(self.dishes[0].pk, 1)], {}), ([(self.dishes[1].pk, 1), (9999, 1)], {})]
+        )
+        self.assertEqual(response.status_code, 400)
+        # Only the unknown dish of the second order is reported
+        self.assertNotIn(0, response.data)
+        self.assertIn("dish", response.data[1]["items"][1])
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertFalse(InvoiceSequence.objects.exists())
+
+
+class SalesReportExportTests(StaffAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.orders = [
+            self.create_order((self.dishes[0], 2), (self.dishes[1], 1), customer_name='Lee, "Sam"'),
+            self.create_order((self.dishes[2], 1), order_type="takeaway"),
+            self.create_order((self.dishes[1], 3), address="12 Road\nBlock B"),
+        ]
+
+    def export(self, export_format, **params):
+        response = self.client.get(
+            "/api/orders/sales_report/", {"format": export_format, "order_type": "dining", **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            response["Content-Disposition"], f'attachment; filename="sales_report.{export_format}"'
+        )
+        return response, b"".join(response.streaming_content).decode()
+
+    @mock.patch("restaurant_app.exports.EXPORT_CHUNK_SIZE", 1)
+    def test_csv_export(self):
+        response, content = self.export("csv")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(list(rows[0]), SALES_REPORT_COLUMNS)
+        dining = [self.orders[0], self.orders[2]]
+        self.assertCountEqual([int(row["id"]) for row in rows], [order.pk for order in dining])
+        by_id = {int(row["id"]): row for row in rows}
+        for order, items_count in zip(dining, [2, 1]):
+            row = by_id[order.pk]
+            self.assertEqual(Decimal(row["total_amount"]), order.total_amount)
+            self.assertEqual(row["invoice_number"], order.invoice_number)
+            self.assertEqual(row["user"], "staff")
+            self.assertEqual(row["delivery_driver"], "")
+            self.assertEqual(int(row["items_count"]), items_count)
+        # Quotes, commas and line breaks survive the round trip
+        self.assertEqual(by_id[self.orders[0].pk]["customer_name"], 'Lee, "Sam"')
+        self.assertEqual(by_id[self.orders[2].pk]["address"], "12 Road\nBlock B")
+
+    @mock.patch("restaurant_app.exports.EXPORT_CHUNK_SIZE", 1)
+    def test_ndjson_export_matches_the_json_report(self):
+        response, content = self.export("ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertTrue(content.endswith("\n"))
+        documents = [json.loads(line) for line in content.splitlines()]
+
+        report = self.client.get(
+            "/api/orders/sales_report/", {"order_type": "dining"}, HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(documents, json.loads(report.content))
+        self.assertEqual(len(documents), 2)
+
+    def test_export_applies_the_report_filters(self):
+        _, content = self.export("csv", order_type="takeaway")
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([int(row["id"]) for row in rows], [self.orders[1].pk])
+
+        _, content = self.export("ndjson", from_date="2000-01-01", to_date="2000-01-31")
+        self.assertEqual(content, "")
+
+
+class CreditLedgerTests(StaffAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.credit_user = CreditUser.objects.create(username="Counter", mobile_number="9999999999")
+
+    def deliver_on_credit(self, order):
+        return self.client.patch(
+            f"/api/order-status/{order.pk}/",
+            {"status": "delivered", "payment_method": "credit", "credit_user_id": self.credit_user.pk},
+            format="json",
+        )
+
+    def test_delivered_credit_order_is_charged_once(self):
+        order = self.create_order((self.dishes[0], 2))
+        response = self.deliver_on_credit(order)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.credit_user.refresh_from_db()
+        self.assertEqual(self.credit_user.total_due, order.total_amount)
+        self.assertFalse(self.credit_user.is_active)
+
+        # Even with the account reopened, repeating the update charges nothing more
+        CreditUser.objects.filter(pk=self.credit_user.pk).update(is_active=True)
+        response = self.deliver_on_credit(order)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.credit_user.refresh_from_db()
+        self.assertEqual(self.credit_user.total_due, order.total_amount)
+        self.assertEqual(CreditOrder.objects.filter(order=order).count(), 1)
+
+    def test_bulk_settle(self):
+        other = CreditUser.objects.create(username="Other", mobile_number="8888888888")
+        post_charge(self.credit_user.pk, Decimal("50.00"))
+        post_charge(other.pk, Decimal("20.00"))
+        response = self.client.post(
+            "/api/credit-transactions/bulk-settle/",
+            [
+                {"credit_user": self.credit_user.pk, "received_amount": "15.00", "payment_method": "cash", "cash_amount": "15.00"},
+                {"credit_user": self.credit_user.pk, "received_amount": "5.00", "payment_method": "bank", "bank_amount": "5.00"},
+                {"credit_user": other.pk, "received_amount": "20.00", "payment_method": "cash", "cash_amount": "20.00"},
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.credit_user.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.credit_user.total_due, Decimal("30.00"))
+        self.assertEqual(other.total_due, Decimal("0.00"))
+        self.assertEqual([row["status"] for row in response.data], ["due", "due", "due"])
+
+        response = self.client.post(
+            "/api/credit-transactions/bulk-settle/",
+            [{"credit_user": self.credit_user.pk, "received_amount": "0"}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(CreditTransaction.objects.count(), 3)
+
+    def test_editing_a_payment_applies_only_the_difference(self):
+        post_charge(self.credit_user.pk, Decimal("100.00"))
+        payment = CreditTransaction.objects.create(
+            credit_user=self.credit_user, received_amount=Decimal("40.00"), payment_method="cash"
+        )
+        self.credit_user.refresh_from_db()
+        self.assertEqual(self.credit_user.total_due, Decimal("60.00"))
+
+        payment.received_amount = Decimal("55.00")
+        payment.save()
+        self.credit_user.refresh_from_db()
+        self.assertEqual(self.credit_user.total_due, Decimal("45.00"))
+
+        payment.save()
+        self.credit_user.refresh_from_db()
+        self.assertEqual(self.credit_user.total_due, Decimal("45.00"))
+
+    def test_moving_a_payment_to_another_user(self):
+        other = CreditUser.objects.create(username="Other", mobile_number="8888888888")
+        post_charge(self.credit_user.pk, Decimal("100.00"))
+        post_charge(other.pk, Decimal("80.00"))
+        payment = CreditTransaction.objects.create(
+            credit_user=self.credit_user, received_amount=Decimal("40.00"), payment_method="cash"
+        )
+
+        payment.credit_user = other
+        payment.received_amount = Decimal("50.00")
+        payment.save()
+        self.credit_user.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.credit_user.total_due, Decimal("100.00"))
+        self.assertEqual(other.total_due, Decimal("30.00"))
+
+
+class CreditAgingTests(StaffAPITestCase):
+    as_of = timezone.make_aware(datetime(2026, 10, 17, 12))
+
+    def credit_user(self, name, mobile_number, total_due, *orders):
+        credit_user = CreditUser.objects.create(username=name, mobile_number=mobile_number)
+        for days_old, amount in orders:
+            order = Order.objects.create(user=self.user, total_amount=Decimal(amount))
+            Order.objects.filter(pk=order.pk).update(created_at=self.as_of - timedelta(days=days_old))
+            CreditOrder.objects.create(order=order, credit_user=credit_user)
+        CreditUser.objects.filter(pk=credit_user.pk).update(total_due=Decimal(total_due))
+        return credit_user
+
+    def aging(self, **params):
+        response = self.client.get("/api/credit-users/aging/", params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_dues_are_allocated_to_the_newest_orders_first(self):
+        regular = self.credit_user(
+            "Regular", "9999999999", "200.00", (10, "100.00"), (45, "50.00"), (75, "30.00"), (120, "20.00")
+        )
+        # Dues not covered by any order are reported as over 90 days
+        carried = self.credit_user("Carried", "8888888888", "70.00", (5, "40.00"))
+        # An order 30 days old is still in the first bucket
+        boundary = self.credit_user("Boundary", "7777777777", "50.00", (30, "30.00"), (31, "20.00"))
+        self.credit_user("Settled", "6666666666", "0.00", (3, "25.00"))
+        # 160 outstanding out of 200 charged: the payment settles the oldest 40
+        payment = CreditTransaction.objects.create(
+            credit_user=regular, received_amount=Decimal("40.00"), status="completed"
+        )
+        CreditTransaction.objects.filter(pk=payment.pk).update(date=date(2026, 10, 1))
+
+        data = self.aging(as_of="2026-10-17")
+        buckets = {
+            row["username"]: tuple(row[key] for key in data["buckets"]) for row in data["results"]
+        }
+        self.assertEqual(
+            buckets,
+            {
+                "Regular": (Decimal("100.00"), Decimal("50.00"), Decimal("10.00"), Decimal("0.00")),
+                "Carried": (Decimal("40.00"), Decimal("0.00"), Decimal("0.00"), Decimal("30.00")),
+                "Boundary": (Decimal("30.00"), Decimal("20.00"), Decimal("0.00"), Decimal("0.00")),
+            },
+        )
+        self.assertEqual([row["id"] for row in data["results"]], [regular.pk, carried.pk, boundary.pk])
+        self.assertEqual(data["results"][0]["last_payment_date"], date(2026, 10, 1))
+        self.assertIsNone(data["results"][1]["last_payment_date"])
+        self.assertEqual(
+            data["totals"],
+            {
+                "days_0_30": Decimal("170.00"),
+                "days_31_60": Decimal("70.00"),
+                "days_61_90": Decimal("10.00"),
+                "days_over_90": Decimal("30.00"),
+                "total_due": Decimal("280.00"),
+            },
+        )
+
+        # Sixty days later everything has moved to the older buckets
+        data = self.aging(as_of="2026-12-16")
+        row = next(row for row in data["results"] if row["id"] == regular.pk)
+        self.assertEqual(
+            [row[key] for key in data["buckets"]],
+            [Decimal("0.00"), Decimal("0.00"), Decimal("100.00"), Decimal("60.00")],
+        )
+
+    def test_invalid_as_of_is_rejected(self):
+        response = self.client.get("/api/credit-users/aging/", {"as_of": "17-10-2026"})
+        self.assertEqual(response.status_code, 400)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class CreditLedgerConcurrencyTests(TransactionTestCase):
+    """Concurrent postings against one account must not lose updates."""
+
+    THREADS = 8
+    POSTINGS_PER_THREAD = 25
+
+    def setUp(self):
+        self.credit_user = CreditUser.objects.create(
+            username="Counter", mobile_number="9999999999"
+        )
+
+    def run_concurrently(self, posting):
+        def worker():
+            try:
+                for _ in range(self.POSTINGS_PER_THREAD):
+                    posting()
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            futures = [executor.submit(worker) for _ in range(self.THREADS)]
+        for future in futures:
+            future.result()
+
+    def test_concurrent_charges(self):
+        self.run_concurrently(lambda: post_charge(self.credit_user.pk, Decimal("10.00")))
+
+        self.credit_user.refresh_from_db()
+        self.assertEqual(
+            self.credit_user.total_due,
+            Decimal("10.00") * self.THREADS * self.POSTINGS_PER_THREAD,
+        )
+        self.assertFalse(self.credit_user.is_active)
+
+    def test_concurrent_charges_and_settlements(self):
+        def charge_and_settle():
+            post_charge(self.credit_user.pk, Decimal("15.00"))
+            settle(
+                [
+                    {
+                        "credit_user": self.credit_user,
+                        "received_amount": Decimal("5.00"),
+                        "payment_method": "cash",
+                        "cash_amount": Decimal("5.00"),
+                    }
+                ]
+            )
+
+        self.run_concurrently(charge_and_settle)
+
+        postings = self.THREADS * self.POSTINGS_PER_THREAD
+        self.credit_user.refresh_from_db()
+        self.assertEqual(self.credit_user.total_due, Decimal("10.00") * postings)
+        self.assertEqual(
+            CreditTransaction.objects.filter(credit_user=self.credit_user).count(), postings
+        )
+
+
+@override_settings(INVOICE_BLOCK_SIZE=10, INVOICE_NUMBER_FORMAT="{outlet}-{date:%Y%m%d}-{number:04d}")
+class InvoiceBlockTests(TransactionTestCase):
+    """Blocks are only taken outside a transaction, so these run in autocommit."""
+
+    def setUp(self):
+        invoicing._blocks.clear()
+
+    def numbers(self, outlet, count=1):
+        return [int(number.rsplit("-", 1)[1]) for number in allocate_invoice_numbers(count, outlet)]
+
+    def test_outlets_keep_their_own_blocks(self):
+        taken = [self.numbers("north"), self.numbers("south"), self.numbers("north"), self.numbers("south")]
+        self.assertEqual(taken, [[1], [1], [2], [2]])
+        # One block reserved per outlet, none discarded
+        self.assertEqual(
+            set(InvoiceSequence.objects.values_list("key", "last_value")),
+            {(sequence_key(timezone.localdate(), outlet), 10) for outlet in ("north", "south")},
+        )
+
+    def test_blocks_of_past_days_are_dropped(self):
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+        with mock.patch("restaurant_app.invoicing.timezone.localdate", return_value=yesterday):
+            self.assertEqual(self.numbers("north", 3), [1, 2, 3])
+        self.assertEqual(self.numbers("north"), [1])
+        self.assertEqual(list(invoicing._blocks), [("north", today)])
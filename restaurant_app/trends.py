@@ -0,0 +1,45 @@
+from django.db.models import Count, Q, Sum
+
+
+def period_windows(end, length, periods):
+    """Consecutive [start, end) windows of ``length``, newest first."""
+    return [(end - length * (i + 1), end - length * i) for i in range(periods)]
+
+
+def aggregate_periods(queryset, windows):
+    """
+    Income, order count and average order value for every window, computed in
+    a single conditional-aggregation query over one created_at range scan.
+    """
+    aggregates = {}
+    for i, (start, end) in enumerate(windows):
+        in_window = Q(created_at__gte=start, created_at__lt=end)
+        aggregates[f"income_{i}"] = Sum("total_amount", filter=in_window)
+        aggregates[f"orders_{i}"] = Count("id", filter=in_window)
+
+    earliest = min(start for start, _ in windows)
+    latest = max(end for _, end in windows)
+    totals = queryset.filter(created_at__gte=earliest, created_at__lt=latest).aggregate(
+        **aggregates
+    )
+
+    stats = []
+    for i, (start, end) in enumerate(windows):
+        total_income = totals[f"income_{i}"] or 0
+        total_orders = totals[f"orders_{i}"] or 0
+        stats.append(
+            {
+                "start": start,
+                "end": end,
+                "total_income": total_income,
+                "total_orders": total_orders,
+                "avg_order_value": total_income / total_orders if total_orders else 0,
+            }
+        )
+    return stats
+
+
+def calculate_trend(current, previous):
+    if previous and previous != 0:
+        return ((current - previous) / previous) * 100
+    return 0
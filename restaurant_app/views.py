@@ -1,4 +1,4 @@
-from datetime import timedelta
+from datetime import datetime, time, timedelta
 from decimal import Decimal
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, filters, permissions, status
@@ -10,6 +10,7 @@ from rest_framework_simplejwt.tokens import TokenError, RefreshToken
 from rest_framework_simplejwt.exceptions import InvalidToken
 from django.utils import timezone
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.db.models import Sum, Count, Avg, F
 from django.utils.dateparse import parse_date
 from django.db.models import Q
@@ -18,11 +19,30 @@ from delivery_drivers.models import DeliveryOrder
 from delivery_drivers.serializers import DeliveryOrderSerializer
 from restaurant_app.models import *
 from restaurant_app.serializers import *
+from restaurant_app.pagination import PageNumberOrKeysetPagination
+from restaurant_app.exports import CSVStreamRenderer, NDJSONStreamRenderer, stream_sales_report
+from restaurant_app.trends import aggregate_periods, calculate_trend, period_windows
+from restaurant_app.catalog import catalog_etag, current_version, get_catalog
+from restaurant_app import search
+from restaurant_app.bill_pdf import PDFRenderer, render_bills_pdf
+from restaurant_app.escpos import ESCPOSRenderer, bill_receipt, kitchen_ticket
+from restaurant_app.forecast import forecast
+from restaurant_app.credit import post_charge, settle
+from restaurant_app.aging import aging_report
 from rest_framework.decorators import api_view
+from rest_framework.settings import api_settings
+from django.http import HttpResponse, HttpResponseNotModified
 
 
 User = get_user_model()
 
+# Upper bound for ?periods= on sales_trends
+MAX_TREND_PERIODS = 52
+
+# Upper bound for bills rendered by one batch-pdf request
+MAX_BATCH_PDF_BILLS = 2000
+MAX_FORECAST_DAYS = 31
+
 
 class LoginViewSet(viewsets.ModelViewSet, TokenObtainPairView):
     serializer_class = LoginSerializer
@@ -121,6 +141,8 @@ class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PageNumberOrKeysetPagination
+    keyset_ordering = "-created_at"
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -128,7 +150,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         return context
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().with_related()
         order_type = self.request.query_params.get("order_type", None)
         if order_type:
             queryset = queryset.filter(order_type=order_type)
@@ -151,7 +173,31 @@ class OrderViewSet(viewsets.ModelViewSet):
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
-    def get_queryset_by_time_range(self, time_range):
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path="kitchen-ticket",
+        renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, ESCPOSRenderer],
+    )
+    def kitchen_ticket(self, request, pk=None):
+        # Raw ESC/POS bytes for the print relay; ?new_only=true prints only added items
+        order = self.get_object()
+        new_only = request.query_params.get("new_only", "").lower() == "true"
+        items = order.items.select_related("dish")
+        return HttpResponse(
+            kitchen_ticket(order, items, new_only=new_only),
+            content_type="application/octet-stream",
+        )
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        # Accepts a list of orders; all of them are created in one transaction
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def get_time_range(self, time_range):
         end_date = timezone.now()
         if time_range == "day":
             start_date = end_date - timedelta(days=1)
@@ -164,7 +210,10 @@ class OrderViewSet(viewsets.ModelViewSet):
         else:
             start_date = end_date - timedelta(days=30)
 
-        return self.queryset.filter(created_at__range=(start_date, end_date))
+        return start_date, end_date
+
+    def get_queryset_by_time_range(self, time_range):
+        return self.queryset.filter(created_at__range=self.get_time_range(time_range))
     
     @action(detail=False, methods=["get"])
     def user_order_history(self, request):
@@ -184,7 +233,15 @@ class OrderViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
-    @action(detail=False, methods=["get"])  # Update on 21-08-2024
+    @action(
+        detail=False,
+        methods=["get"],
+        renderer_classes=[
+            *api_settings.DEFAULT_RENDERER_CLASSES,
+            CSVStreamRenderer,
+            NDJSONStreamRenderer,
+        ],
+    )  # Update on 21-08-2024
     def sales_report(self, request):
         from_date = request.query_params.get("from_date")
         to_date = request.query_params.get("to_date")
@@ -215,54 +272,62 @@ class OrderViewSet(viewsets.ModelViewSet):
         if status:
             queryset = queryset.filter(status=status)
 
+        # ?format=csv / ?format=ndjson stream the rows instead of building one list
+        export_format = request.accepted_renderer.format
+        if export_format in ("csv", "ndjson"):
+            return stream_sales_report(
+                queryset, export_format, self.get_serializer_context()
+            )
+
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=["get"])
     def dashboard_data(self, request):
+        # Reads only the sales rollups: hourly totals from the start of the
+        # hour and dish/category totals from the start of the day.
         time_range = request.query_params.get("time_range", "month")
-        queryset = self.get_queryset_by_time_range(time_range)
+        start_date, end_date = self.get_time_range(time_range)
+        start_hour = start_date.replace(minute=0, second=0, microsecond=0)
+
+        hourly = HourlySalesRollup.objects.filter(hour__gte=start_hour, hour__lte=end_date)
+        dish_rollups = DishSalesRollup.objects.filter(
+            date__gte=timezone.localdate(start_date), date__lte=timezone.localdate(end_date)
+        )
+        category_rollups = CategorySalesRollup.objects.filter(
+            date__gte=timezone.localdate(start_date), date__lte=timezone.localdate(end_date)
+        )
 
         daily_sales = (
-            queryset.annotate(date=TruncDate("created_at"))
-            .values("date")
-            .annotate(total_sales=Sum("total_amount"), order_count=Count("id"))
+            hourly.values("date")
+            .annotate(total_sales=Sum("total_sales"), order_count=Sum("order_count"))
             .order_by("date")
         )
 
-        total_income = (
-            queryset.aggregate(total_income=Sum("total_amount"))["total_income"] or 0
+        totals = hourly.aggregate(
+            total_income=Sum("total_sales"), total_orders=Sum("order_count")
         )
+        total_income = totals["total_income"] or 0
+        total_orders = totals["total_orders"] or 0
 
-        popular_time_slots = (
-            queryset.annotate(hour=TruncHour("created_at"))
-            .values("hour")
-            .annotate(order_count=Count("id"))
-            .order_by("-order_count")[:5]
-        )
+        popular_time_slots = hourly.values("hour", "order_count").order_by(
+            "-order_count"
+        )[:5]
 
         top_dishes = (
-            OrderItem.objects.filter(order__in=queryset)
-            .values(
-                "dish__name",
-                "dish__image",
-            )
-            .annotate(orders=Count("id"))
+            dish_rollups.values("dish__name", "dish__image")
+            .annotate(orders=Sum("item_count"))
             .order_by("-orders")[:5]
         )
 
-        category_sales = (
-            OrderItem.objects.filter(order__in=queryset)
-            .values("dish__category__name")
-            .annotate(value=Sum(F("quantity") * F("dish__price")))
+        category_sales = [
+            {"dish__category__name": row["category__name"], "value": row["value"]}
+            for row in category_rollups.values("category__name")
+            .annotate(value=Sum("sales"))
             .order_by("-value")
-        )
+        ]
 
-        total_orders = queryset.count()
-
-        avg_order_value = (
-            queryset.aggregate(avg_value=Avg("total_amount"))["avg_value"] or 0
-        )
+        avg_order_value = total_income / total_orders if total_orders else 0
 
         return Response(
             {
@@ -278,55 +343,52 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=["get"])
     def sales_trends(self, request):
-        time_range = request.query_params.get("time_range", "month")
-        current_queryset = self.get_queryset_by_time_range(time_range)
-
-        end_date = timezone.now() - timedelta(days=1)
-        if time_range == "day":
-            start_date = end_date - timedelta(days=1)
-            prev_start_date = start_date - timedelta(days=1)
-        elif time_range == "week":
-            start_date = end_date - timedelta(weeks=1)
-            prev_start_date = start_date - timedelta(weeks=1)
-        elif time_range == "month":
-            start_date = end_date - timedelta(days=30)
-            prev_start_date = start_date - timedelta(days=30)
-        elif time_range == "year":
-            start_date = end_date - timedelta(days=365)
-            prev_start_date = start_date - timedelta(days=365)
-
-        prev_queryset = self.queryset.filter(
-            created_at__range=(prev_start_date, start_date)
-        )
+        # The window is either ?from_date=&to_date= or the last time_range;
+        # ?periods=N compares it with the N - 1 windows of equal length before it.
+        from_date = request.query_params.get("from_date")
+        to_date = request.query_params.get("to_date")
 
-        current_stats = current_queryset.aggregate(
-            total_income=Sum("total_amount"),
-            total_orders=Count("id"),
-            avg_order_value=Avg("total_amount"),
-        )
+        if from_date or to_date:
+            from_date = parse_date(from_date) if from_date else None
+            to_date = parse_date(to_date) if to_date else None
+            if not from_date or not to_date or from_date > to_date:
+                return Response(
+                    {"error": "Both from_date and to_date are required (YYYY-MM-DD) and from_date must not be after to_date."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            start_date = timezone.make_aware(datetime.combine(from_date, time.min))
+            end_date = timezone.make_aware(
+                datetime.combine(to_date + timedelta(days=1), time.min)
+            )
+        else:
+            time_range = request.query_params.get("time_range", "month")
+            start_date, end_date = self.get_time_range(time_range)
 
-        prev_stats = prev_queryset.aggregate(
-            total_income=Sum("total_amount"),
-            total_orders=Count("id"),
-            avg_order_value=Avg("total_amount"),
-        )
+        try:
+            periods = int(request.query_params.get("periods", 2))
+        except ValueError:
+            periods = 0
+        if not 2 <= periods <= MAX_TREND_PERIODS:
+            return Response(
+                {"error": f"periods must be a number between 2 and {MAX_TREND_PERIODS}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        def calculate_trend(current, previous):
-            if previous and previous != 0:
-                return ((current - previous) / previous) * 100
-            return 0
+        windows = period_windows(end_date, end_date - start_date, periods)
+        stats = aggregate_periods(self.queryset, windows)
+        current_stats, prev_stats = stats[0], stats[1]
 
         trends = {
             "total_income_trend": calculate_trend(
-                current_stats["total_income"] or 0, prev_stats["total_income"] or 0
+                current_stats["total_income"], prev_stats["total_income"]
             ),
             "total_orders_trend": calculate_trend(
-                current_stats["total_orders"] or 0, prev_stats["total_orders"] or 0
+                current_stats["total_orders"], prev_stats["total_orders"]
             ),
             "avg_order_value_trend": calculate_trend(
-                current_stats["avg_order_value"] or 0,
-                prev_stats["avg_order_value"] or 0,
+                current_stats["avg_order_value"], prev_stats["avg_order_value"]
             ),
+            "periods": stats,
         }
 
         return Response(trends)
@@ -344,28 +406,26 @@ class OrderStatusUpdateViewSet(viewsets.GenericViewSet):
 
         serializer = self.get_serializer(order, data=request.data, partial=True)
         if serializer.is_valid():
-            updated_order = serializer.save()
-
-            # Check if the payment method is credit
-            if updated_order.payment_method == "credit":
-                credit_user_id = updated_order.credit_user_id
-                try:
-                    credit_user = CreditUser.objects.get(pk=credit_user_id)
-                except CreditUser.DoesNotExist:
-                    return Response(
-                        {"error": "Invalid credit user"},
-                        status=status.HTTP_400_BAD_REQUEST,
+            with transaction.atomic():
+                updated_order = serializer.save()
+
+                # Check if the payment method is credit
+                if updated_order.payment_method == "credit":
+                    credit_user_id = updated_order.credit_user_id
+                    # The serializer has already looked the account up; the
+                    # charge re-checks that it is active in the same UPDATE, and
+                    # an order is only charged to the account once
+                    _, created = CreditOrder.objects.get_or_create(
+                        order=updated_order, defaults={"credit_user_id": credit_user_id}
                     )
-
-                if not credit_user.is_active:
-                    return Response(
-                        {"error": "Credit user account is inactive due to overdue payment"},
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                # Create the credit order if it doesn't exist
-                CreditOrder.objects.get_or_create(order=updated_order, credit_user=credit_user)
-                credit_user.add_to_total_due(updated_order.total_amount)
+                    if created and not post_charge(
+                        credit_user_id, updated_order.total_amount, active_only=True
+                    ):
+                        transaction.set_rollback(True)
+                        return Response(
+                            {"error": "Credit user account is inactive due to overdue payment"},
+                            status=status.HTTP_400_BAD_REQUEST,
+                        )
 
             return Response({"detail": "Order updated successfully."}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -409,14 +469,75 @@ class BillViewSet(viewsets.ModelViewSet):
     queryset = Bill.objects.all()
     serializer_class = BillSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PageNumberOrKeysetPagination
+    keyset_ordering = "-billed_at"
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related(
+            "order", "user__driver_profile"
+        ).prefetch_related("order__items__dish")
         status_param = self.request.query_params.get('status')  # Get the status from query params
         if status_param:
             queryset = queryset.filter(order__status=status_param)  # Filter based on order status
         return queryset
 
+    @action(detail=True, methods=["get"], renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, PDFRenderer])
+    def pdf(self, request, pk=None):
+        bill = self.get_object()
+        content = render_bills_pdf([self.get_serializer(bill).data])
+        response = HttpResponse(content, content_type="application/pdf")
+        response["Content-Disposition"] = f'inline; filename="bill_{bill.id}.pdf"'
+        return response
+
+    @action(
+        detail=True,
+        methods=["get"],
+        renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, ESCPOSRenderer],
+    )
+    def escpos(self, request, pk=None):
+        # Raw ESC/POS receipt for the counter printer's print relay
+        bill = self.get_object()
+        return HttpResponse(
+            bill_receipt(self.get_serializer(bill).data),
+            content_type="application/octet-stream",
+        )
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="batch-pdf",
+        renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, PDFRenderer],
+    )
+    def batch_pdf(self, request):
+        # End-of-day reprints: ?date=YYYY-MM-DD and/or ?ids=1,2,3, one page per bill
+        queryset = self.get_queryset().order_by("billed_at", "id")
+        bill_date = request.query_params.get("date")
+        ids = request.query_params.get("ids")
+
+        if not bill_date and not ids:
+            return Response({"error": "date or ids is required."}, status=status.HTTP_400_BAD_REQUEST)
+        if bill_date:
+            bill_date = parse_date(bill_date)
+            if bill_date is None:
+                return Response({"error": "date must be in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = queryset.filter(billed_at__date=bill_date)
+        if ids:
+            try:
+                queryset = queryset.filter(id__in=[int(bill_id) for bill_id in ids.split(",")])
+            except ValueError:
+                return Response({"error": "ids must be a comma separated list of numbers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        bills = list(queryset[: MAX_BATCH_PDF_BILLS + 1])
+        if not bills:
+            return Response({"detail": "No bills found."}, status=status.HTTP_404_NOT_FOUND)
+        if len(bills) > MAX_BATCH_PDF_BILLS:
+            return Response({"error": f"At most {MAX_BATCH_PDF_BILLS} bills can be printed at once."}, status=status.HTTP_400_BAD_REQUEST)
+
+        content = render_bills_pdf(self.get_serializer(bills, many=True).data)
+        response = HttpResponse(content, content_type="application/pdf")
+        response["Content-Disposition"] = 'inline; filename="bills.pdf"'
+        return response
+
 
 
 class CancelOrderByBillView(APIView):
@@ -454,6 +575,8 @@ class NotificationViewSet(viewsets.ModelViewSet):
     queryset = Notification.objects.all().order_by("-created_at")
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PageNumberOrKeysetPagination
+    keyset_ordering = "-created_at"
 
     @action(detail=True, methods=["post"])
     def mark_as_read(self, request, pk=None):
@@ -587,6 +710,15 @@ class MenuItemViewSet(viewsets.ModelViewSet):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
 
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        # Accepts a list of menu items; each affected menu's sub_total is
+        # recomputed once when the batch commits
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 
 class MessViewSet(viewsets.ModelViewSet):
     queryset = Mess.objects.all()
@@ -644,16 +776,61 @@ class MessViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+class KitchenForecastAPIView(APIView):
+    """Dish quantities per day and meal from the active Mess subscriptions."""
+
+    def get(self, request):
+        date = request.query_params.get("date")
+        start = parse_date(date) if date else timezone.localdate()
+        if start is None:
+            return Response(
+                {"error": "date must be in YYYY-MM-DD format."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            days = int(request.query_params.get("days", 7))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= MAX_FORECAST_DAYS:
+            return Response(
+                {"error": f"days must be a number between 1 and {MAX_FORECAST_DAYS}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response({"date": start, "days": days, "forecast": forecast(start, days)})
+
+
 class SearchDishesAPIView(APIView):
     def get(self, request):
         query = request.GET.get("search", "")
-        if query:
-            dishes = Dish.objects.filter(name__icontains=query)
-            serializer = DishSerializer(dishes, many=True)
-            return Response({"results": serializer.data}, status=status.HTTP_200_OK)
+        try:
+            limit = min(int(request.GET.get("limit", search.DEFAULT_LIMIT)), search.MAX_LIMIT)
+        except ValueError:
+            limit = search.DEFAULT_LIMIT
+        if query and limit > 0:
+            # Served from the in-process index, ranked by relevance
+            results = search.get_index().search(query, limit)
+            return Response({"results": results}, status=status.HTTP_200_OK)
         return Response({"results": []}, status=status.HTTP_200_OK)
 
 
+class CatalogAPIView(APIView):
+    """Categories, dishes and variants in one document for POS start-up."""
+
+    def get(self, request):
+        version = current_version()
+        etag = catalog_etag(version)
+
+        if etag in request.headers.get("If-None-Match", ""):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                get_catalog(version, request), content_type="application/json"
+            )
+        response["ETag"] = etag
+        return response
+
+
 class CreditUserViewSet(viewsets.ModelViewSet):
     queryset = CreditUser.objects.all()
     serializer_class = CreditUserSerializer
@@ -665,6 +842,18 @@ class CreditUserViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(active_users, many=True)
         return Response({"data": serializer.data}, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=["get"])
+    def aging(self, request):
+        # Outstanding dues bucketed by order age as of ?as_of= (default today)
+        as_of = request.query_params.get("as_of")
+        as_of = parse_date(as_of) if as_of else timezone.localdate()
+        if as_of is None:
+            return Response(
+                {"error": "as_of must be in YYYY-MM-DD format."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(aging_report(as_of))
+
     @action(detail=True, methods=["post"])
     def make_payment(self, request, pk=None):
         credit_user = self.get_object()
@@ -703,4 +892,16 @@ class CreditTransactionViewSet(viewsets.ModelViewSet):
         credit_user_id = self.request.query_params.get('credit_user', None)
         if credit_user_id is not None:
             queryset = queryset.filter(credit_user_id=credit_user_id)
-        return queryset
\ No newline at end of file
+        return queryset
+
+    @action(detail=False, methods=["post"], url_path="bulk-settle")
+    def bulk_settle(self, request):
+        # Accepts a list of payments; they are recorded together and each
+        # credit user's balance is updated atomically
+        serializer = CreditSettlementSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        credit_transactions = settle(serializer.validated_data)
+        return Response(
+            self.get_serializer(credit_transactions, many=True).data,
+            status=status.HTTP_201_CREATED,
+        )
\ No newline at end of file
@@ -46,6 +46,8 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_THROTTLE_RATES": {
         "user": "1000/day",
+        # Drivers report their position every few seconds while on duty
+        "driver_locations": env.str("DRIVER_LOCATION_THROTTLE_RATE", "30/minute"),
     },
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
@@ -143,10 +145,63 @@ STATICFILES_DIRS = [
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Background threads generating thumbnail/WebP renditions of uploaded images
+RENDITION_WORKERS = env.int("RENDITION_WORKERS", 2)
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "restaurant_app.User"
 
+# Invoice numbers restart every business day per outlet. Each worker reserves
+# INVOICE_BLOCK_SIZE numbers at a time from the shared counter row.
+INVOICE_NUMBER_FORMAT = env.str("INVOICE_NUMBER_FORMAT", "{date:%Y%m%d}{number:04d}")
+INVOICE_OUTLET = env.str("INVOICE_OUTLET", "main")
+INVOICE_BLOCK_SIZE = env.int("INVOICE_BLOCK_SIZE", 20)
+
+# Ledgers (by name) that the post_sales_journal command posts the daily
+# sales and receipts to
+SALES_JOURNAL_LEDGERS = {
+    "cash": env.str("SALES_JOURNAL_CASH_LEDGER", "Cash"),
+    "bank": env.str("SALES_JOURNAL_BANK_LEDGER", "Bank"),
+    "debtors": env.str("SALES_JOURNAL_DEBTORS_LEDGER", "Sundry Debtors"),
+    "sales": env.str("SALES_JOURNAL_SALES_LEDGER", "Sales"),
+    "mess_sales": env.str("SALES_JOURNAL_MESS_SALES_LEDGER", "Mess Sales"),
+}
+
+# The dispatch index and the live driver positions live in this cache, so
+# with more than one worker it must be shared by all of them, e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache (with the redis
+# package) and CACHE_LOCATION=redis://..., or
+# django.core.cache.backends.db.DatabaseCache after createcachetable.
+CACHES = {
+    "default": {
+        "BACKEND": env.str("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": env.str("CACHE_LOCATION", ""),
+    }
+}
+
+# How new delivery orders without a driver are assigned: "least_loaded",
+# "round_robin", a dotted path to a policy function, or "manual" to leave
+# them unassigned. The available-driver index is cached for
+# DELIVERY_DISPATCH_INDEX_TIMEOUT seconds. A driver is given no more new
+# orders while DELIVERY_DISPATCH_MAX_PENDING assigned ones are still pending
+# (0 for no limit).
+DELIVERY_DISPATCH_POLICY = env.str("DELIVERY_DISPATCH_POLICY", "least_loaded")
+DELIVERY_DISPATCH_INDEX_TIMEOUT = env.int("DELIVERY_DISPATCH_INDEX_TIMEOUT", 30)
+DELIVERY_DISPATCH_MAX_PENDING = env.int("DELIVERY_DISPATCH_MAX_PENDING", 5)
+
+# Driver GPS pings are buffered in memory and written to the database in
+# batches every DRIVER_LOCATION_FLUSH_INTERVAL seconds, or sooner once
+# DRIVER_LOCATION_FLUSH_SIZE are waiting; a failed write is retried with the
+# next batch. The history is best effort: beyond DRIVER_LOCATION_BUFFER_SIZE
+# unwritten pings the oldest are dropped, and a worker that is killed loses
+# what it had not written yet. The latest position per driver is kept in the
+# cache for DRIVER_LOCATION_TTL seconds.
+DRIVER_LOCATION_BUFFER_SIZE = env.int("DRIVER_LOCATION_BUFFER_SIZE", 20000)
+DRIVER_LOCATION_FLUSH_SIZE = env.int("DRIVER_LOCATION_FLUSH_SIZE", 500)
+DRIVER_LOCATION_FLUSH_INTERVAL = env.int("DRIVER_LOCATION_FLUSH_INTERVAL", 15)
+DRIVER_LOCATION_TTL = env.int("DRIVER_LOCATION_TTL", 300)
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(hours=24),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=3),
@@ -24,6 +24,8 @@ from restaurant_app.views import (
     MessViewSet,
     MessTypeViewSet,
     SearchDishesAPIView,
+    CatalogAPIView,
+    KitchenForecastAPIView,
     CreditUserViewSet,
     CreditOrderViewSet,
     MessTransactionViewSet,
@@ -94,6 +96,8 @@ urlpatterns = [
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("api/logout/", LogoutView.as_view({"post": "logout"}), name="logout"),
     path("api/search-dishes/", SearchDishesAPIView.as_view(), name="search_dishes"),  # Include the search API endpoint
+    path("api/catalog/", CatalogAPIView.as_view(), name="catalog"),  # Whole menu in one request for POS terminals
+    path("api/kitchen/forecast/", KitchenForecastAPIView.as_view(), name="kitchen_forecast"),
 
     path("api/bills/<int:bill_id>/cancel_order/", CancelOrderByBillView.as_view(), name="cancel-order-by-bill"),
 
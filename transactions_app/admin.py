@@ -7,5 +7,9 @@ admin.site.register(NatureGroup,UnflodModelAdmin)
 admin.site.register(MainGroup,UnflodModelAdmin)
 admin.site.register(Ledger,UnflodModelAdmin)
 admin.site.register(Transaction,UnflodModelAdmin)
+admin.site.register(VoucherSequence,UnflodModelAdmin)
+admin.site.register(LedgerDailyBalance,UnflodModelAdmin)
+admin.site.register(PostingWatermark,UnflodModelAdmin)
+admin.site.register(SalesPosting,UnflodModelAdmin)
 admin.site.register(IncomeStatement,UnflodModelAdmin)
 admin.site.register(BalanceSheet,UnflodModelAdmin)
\ No newline at end of file
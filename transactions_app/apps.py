@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class TransactionsAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'transactions_app'
+
+    def ready(self):
+        # Registers the receivers that keep the daily ledger balances current
+        # and that mark orders and receipts for the sales journal to re-check
+        from transactions_app import balances, sales_journal  # noqa: F401
@@ -0,0 +1,178 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .models import Ledger, LedgerDailyBalance, Transaction
+
+# Daily balance rows are kept current by applying each posting's amounts to
+# its own day and shifting the cumulative balance of every later day, all
+# with F() updates, so history is never re-summed on the write path.
+
+BALANCE_FIELDS = ["ledger_id", "date", "debit_amount", "credit_amount"]
+
+
+def to_decimal(value):
+    # Unsaved instances may still hold the fields' float defaults
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def signed_opening_balance(ledger):
+    # Balances are kept debit-positive
+    opening_balance = to_decimal(ledger.opening_balance)
+    return -opening_balance if ledger.debit_credit == "CREDIT" else opening_balance
+
+
+def apply_delta(ledger_id, date, debit, credit):
+    """Add ``debit`` and ``credit`` to the ledger's balance on ``date``."""
+    debit, credit = to_decimal(debit), to_decimal(credit)
+    amount = debit - credit
+    balances = LedgerDailyBalance.objects.filter(ledger_id=ledger_id)
+    with transaction.atomic():
+        # Postings to one ledger queue on its row: a day inserted below must
+        # be visible to the shift of every later posting, and its opening
+        # cumulative balance must include every earlier one
+        list(Ledger.objects.select_for_update().filter(pk=ledger_id).values_list("pk"))
+        updated = balances.filter(date=date).update(
+            debit_amount=F("debit_amount") + debit,
+            credit_amount=F("credit_amount") + credit,
+            cumulative_balance=F("cumulative_balance") + amount,
+        )
+        # Nothing to take amounts away from, e.g. the ledger's rows went first
+        # in a cascade; never insert a day that only holds negative amounts
+        if not updated and (debit > 0 or credit > 0):
+            previous = (
+                balances.filter(date__lt=date)
+                .order_by("-date")
+                .values_list("cumulative_balance", flat=True)
+                .first()
+            )
+            try:
+                with transaction.atomic():
+                    LedgerDailyBalance.objects.create(
+                        ledger_id=ledger_id,
+                        date=date,
+                        debit_amount=debit,
+                        credit_amount=credit,
+                        cumulative_balance=(previous or 0) + amount,
+                    )
+            except IntegrityError:
+                # Another posting created the day first; add to it instead
+                balances.filter(date=date).update(
+                    debit_amount=F("debit_amount") + debit,
+                    credit_amount=F("credit_amount") + credit,
+                    cumulative_balance=F("cumulative_balance") + amount,
+                )
+        if amount:
+            balances.filter(date__gt=date).update(
+                cumulative_balance=F("cumulative_balance") + amount
+            )
+
+
+def record_postings(postings):
+    """Apply many transactions at once, one update per ledger and day."""
+    deltas = defaultdict(lambda: [0, 0])
+    for posting in postings:
+        delta = deltas[posting.ledger_id, posting.date]
+        delta[0] += to_decimal(posting.debit_amount)
+        delta[1] += to_decimal(posting.credit_amount)
+    # In ledger order, so concurrent batches lock the ledgers in the same order
+    for (ledger_id, date), (debit, credit) in sorted(deltas.items()):
+        apply_delta(ledger_id, date, debit, credit)
+
+
+def balance_as_of(ledger, date):
+    """The ledger's balance at the end of ``date`` from a single snapshot row."""
+    cumulative = (
+        LedgerDailyBalance.objects.filter(ledger=ledger, date__lte=date)
+        .order_by("-date")
+        .values_list("cumulative_balance", flat=True)
+        .first()
+    )
+    return signed_opening_balance(ledger) + (cumulative or 0)
+
+
+def with_balances_as_of(ledgers, date):
+    """Annotate ``cumulative_balance`` as of ``date`` on a Ledger queryset."""
+    latest = (
+        LedgerDailyBalance.objects.filter(ledger=OuterRef("pk"), date__lte=date)
+        .order_by("-date")
+        .values("cumulative_balance")[:1]
+    )
+    return ledgers.annotate(
+        cumulative_balance=Subquery(
+            latest, output_field=models.DecimalField(max_digits=14, decimal_places=2)
+        )
+    )
+
+
+def rebuild_balances(ledger_ids=None):
+    """Recompute the daily balance rows from the transactions."""
+    transactions = Transaction.objects.all()
+    balances = LedgerDailyBalance.objects.all()
+    if ledger_ids:
+        transactions = transactions.filter(ledger_id__in=ledger_ids)
+        balances = balances.filter(ledger_id__in=ledger_ids)
+
+    days = (
+        transactions.values("ledger", "date")
+        .annotate(total_debit=Sum("debit_amount"), total_credit=Sum("credit_amount"))
+        .order_by("ledger", "date")
+    )
+
+    def rows():
+        ledger_id, cumulative = None, 0
+        for day in days.iterator():
+            if day["ledger"] != ledger_id:
+                ledger_id, cumulative = day["ledger"], 0
+            cumulative += day["total_debit"] - day["total_credit"]
+            yield LedgerDailyBalance(
+                ledger_id=ledger_id,
+                date=day["date"],
+                debit_amount=day["total_debit"],
+                credit_amount=day["total_credit"],
+                cumulative_balance=cumulative,
+            )
+
+    with transaction.atomic():
+        balances.delete()
+        LedgerDailyBalance.objects.bulk_create(rows(), batch_size=1000)
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_previous_posting(sender, instance, **kwargs):
+    instance._previous_posting = None
+    if instance.pk:
+        instance._previous_posting = (
+            Transaction.objects.filter(pk=instance.pk).values(*BALANCE_FIELDS).first()
+        )
+
+
+@receiver(post_save, sender=Transaction)
+def update_balances_on_save(sender, instance, **kwargs):
+    previous = getattr(instance, "_previous_posting", None)
+    if previous:
+        apply_delta(
+            previous["ledger_id"],
+            previous["date"],
+            -previous["debit_amount"],
+            -previous["credit_amount"],
+        )
+    apply_delta(instance.ledger_id, instance.date, instance.debit_amount, instance.credit_amount)
+
+
+@receiver(pre_delete, sender=Ledger)
+def mark_deleted_ledger(sender, instance, origin=None, **kwargs):
+    # Kept on the object or queryset being deleted, so the mark lasts for
+    # exactly one delete() call
+    if origin is not None:
+        origin.__dict__.setdefault("_deleted_ledger_ids", set()).add(instance.pk)
+
+
+@receiver(post_delete, sender=Transaction)
+def update_balances_on_delete(sender, instance, origin=None, **kwargs):
+    # The ledger's daily balances go with it
+    if instance.ledger_id in getattr(origin, "_deleted_ledger_ids", ()):
+        return
+    apply_delta(instance.ledger_id, instance.date, -instance.debit_amount, -instance.credit_amount)
@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models import F, Max
+from .balances import record_postings
+from .models import Transaction, VoucherSequence
+
+SEQUENCE_KEY = "journal"
+
+
+def allocate_voucher_numbers(count):
+    """
+    Reserve ``count`` consecutive voucher numbers with a single atomic
+    increment of the counter row.
+
+    Called outside a transaction the reservation commits at once, so
+    concurrent posters only ever wait for that one UPDATE. Numbers of a
+    batch that later fails are skipped rather than reused.
+    """
+    sequence = VoucherSequence.objects.filter(key=SEQUENCE_KEY)
+    with transaction.atomic():
+        if not sequence.update(last_value=F("last_value") + count):
+            # First use: carry on from the vouchers posted before the sequence
+            last_voucher_no = Transaction.objects.aggregate(last=Max("voucher_no"))["last"]
+            VoucherSequence.objects.get_or_create(
+                key=SEQUENCE_KEY, defaults={"last_value": last_voucher_no or 0}
+            )
+            sequence.update(last_value=F("last_value") + count)
+        last_value = sequence.values_list("last_value", flat=True).get()
+    return list(range(last_value - count + 1, last_value + 1))
+
+
+def counter_ledger(leg, legs):
+    # The "particulars" of a leg is the biggest leg on the other side
+    side = "credit_amount" if leg["debit_amount"] else "debit_amount"
+    return max(legs, key=lambda other: other[side])["ledger_id"]
+
+
+def build_legs(voucher, voucher_no):
+    legs = voucher["legs"]
+    return [
+        Transaction(
+            ledger_id=leg["ledger_id"],
+            particulars_id=leg.get("particulars_id") or counter_ledger(leg, legs),
+            date=voucher["date"],
+            debit_amount=leg["debit_amount"],
+            credit_amount=leg["credit_amount"],
+            balance_amount=leg["balance_amount"],
+            remarks=leg.get("remarks") or voucher.get("remarks"),
+            voucher_no=voucher_no,
+            ref_no=voucher.get("ref_no"),
+            debit_credit=Transaction.DEBIT if leg["debit_amount"] else Transaction.CREDIT,
+        )
+        for leg in legs
+    ]
+
+
+def post_vouchers(vouchers):
+    """
+    Post validated, balanced vouchers. Every leg is inserted with
+    bulk_create in one transaction; returns (voucher_no, legs) pairs.
+    """
+    voucher_numbers = allocate_voucher_numbers(len(vouchers))
+    posted = [
+        (voucher_no, build_legs(voucher, voucher_no))
+        for voucher_no, voucher in zip(voucher_numbers, vouchers)
+    ]
+    legs = [leg for _, legs in posted for leg in legs]
+    with transaction.atomic():
+        Transaction.objects.bulk_create(legs, batch_size=1000)
+        # bulk_create sends no signals, so update the daily balances here
+        record_postings(legs)
+    return posted
@@ -0,0 +1,49 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from transactions_app.sales_journal import LedgerNotConfigured, post_sales_journal
+
+
+class Command(BaseCommand):
+    help = (
+        "Post the sales, mess receipts and credit receipts not yet in the journal, "
+        "and any changes to ones already posted. Meant to be scheduled once a day."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--through", help="Last day to post (YYYY-MM-DD), default yesterday")
+        parser.add_argument(
+            "--from-date", help="First day the journal covers, used on the very first run (YYYY-MM-DD)"
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Compare every order and receipt from the first day, not only the recent and changed ones",
+        )
+
+    def handle(self, *args, **options):
+        through = timezone.localdate() - timedelta(days=1)
+        if options["through"]:
+            through = parse_date(options["through"])
+            if through is None:
+                raise CommandError("--through must be in YYYY-MM-DD format")
+        from_date = None
+        if options["from_date"]:
+            from_date = parse_date(options["from_date"])
+            if from_date is None:
+                raise CommandError("--from-date must be in YYYY-MM-DD format")
+
+        try:
+            vouchers, rows = post_sales_journal(through, from_date, full=options["full"])
+        except LedgerNotConfigured as exc:
+            raise CommandError(f"{exc}. Create them or set SALES_JOURNAL_LEDGERS.")
+
+        if not vouchers and not rows:
+            self.stdout.write(f"Sales journal is already posted through {through}.")
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Posted {vouchers} vouchers for {rows} orders and receipts through {through}."
+                )
+            )
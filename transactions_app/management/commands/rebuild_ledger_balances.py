@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from transactions_app.balances import rebuild_balances
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily ledger balance snapshots from the transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ledger", type=int, action="append", dest="ledgers",
+            help="Only rebuild this ledger (may be given more than once)",
+        )
+
+    def handle(self, *args, **options):
+        rebuild_balances(options["ledgers"])
+        self.stdout.write(self.style.SUCCESS("Ledger balances rebuilt."))
@@ -44,17 +44,93 @@ class Transaction(models.Model):
     credit_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     balance_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     remarks = models.TextField(blank=True, null=True)
-    voucher_no = models.PositiveIntegerField()  
+    voucher_no = models.PositiveIntegerField(db_index=True)
     ref_no = models.CharField(max_length=15, blank=True, null=True)
     debit_credit = models.CharField(
         max_length=10,
         choices=DEBIT_CREDIT_CHOICES
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["-date", "-id"]),
+            models.Index(fields=["ledger", "date", "id"]),
+        ]
+
     def __str__(self):
         return f"{self.ledger.name} - {self.date} - Voucher No: {self.voucher_no}"
 
 
+class LedgerDailyBalance(models.Model):
+    # Debit and credit posted to a ledger on one day, and the net
+    # (debit-positive) activity of all days up to and including it. The
+    # ledger's own opening balance is not included.
+    ledger = models.ForeignKey(Ledger, on_delete=models.CASCADE, related_name='daily_balances')
+    date = models.DateField()
+    debit_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    credit_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    cumulative_balance = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+
+    class Meta:
+        unique_together = ("ledger", "date")
+
+    def __str__(self):
+        return f"{self.ledger.name} - {self.date} - {self.cumulative_balance}"
+
+
+class VoucherSequence(models.Model):
+    # Counter row handing out voucher numbers, e.g. key "journal"
+    key = models.CharField(max_length=50, unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} - {self.last_value}"
+
+
+class PostingWatermark(models.Model):
+    # Progress of an automatic posting job, e.g. key "sales_journal": it
+    # covers rows from start_date up to posted_through. The row is also the
+    # lock that keeps two runs of the job from overlapping.
+    key = models.CharField(max_length=50, unique=True)
+    start_date = models.DateField()
+    posted_through = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.key} - {self.posted_through}"
+
+
+class SalesPosting(models.Model):
+    # What the sales journal has posted for one order or receipt, so each is
+    # posted once and later changes are posted as the difference
+    source = models.CharField(max_length=20)
+    object_id = models.PositiveIntegerField()
+    date = models.DateField()
+    cash_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    bank_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    credit_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    posted_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("source", "object_id")
+
+    def __str__(self):
+        return f"{self.source} {self.object_id} - {self.date}"
+
+
+class SalesJournalChange(models.Model):
+    # An order or receipt edited or deleted after it could have been posted;
+    # the next sales journal run re-checks it and removes the row
+    source = models.CharField(max_length=20)
+    object_id = models.PositiveIntegerField()
+    date = models.DateField()
+
+    class Meta:
+        unique_together = ("source", "object_id")
+
+    def __str__(self):
+        return f"{self.source} {self.object_id} - {self.date}"
+
+
 class IncomeStatement(models.Model):
     SALES = 'Sales'
     INDIRECT_INCOME = 'Indirect Income'
@@ -0,0 +1,183 @@
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from django.core import signing
+from django.db.models import DecimalField, F, Q, Sum, Value, Window
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .balances import balance_as_of, signed_opening_balance
+from .models import Ledger, Transaction
+
+LEDGER_REPORT_PAGE_SIZE = 100
+MAX_LEDGER_REPORT_PAGE_SIZE = 1000
+
+CURSOR_SALT = "transactions_app.ledger_report"
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+ROW_FIELDS = [
+    "id",
+    "date",
+    "voucher_no",
+    "ref_no",
+    "remarks",
+    "debit_credit",
+    "debit_amount",
+    "credit_amount",
+    "particulars_id",
+]
+
+
+def signed_amount():
+    # Balances are kept debit-positive
+    return F("debit_amount") - F("credit_amount")
+
+
+def opening_balance(ledger, from_date):
+    """The ledger's balance at the end of the day before ``from_date``."""
+    if not from_date:
+        return signed_opening_balance(ledger)
+    return balance_as_of(ledger, from_date - timedelta(days=1))
+
+
+class LedgerReport:
+    """
+    One page of a ledger statement with a running balance per row.
+
+    The balance is computed by the database with a window function. The
+    cursor carries the balance at the page boundary, so each page only
+    scans its own rows however long the ledger is. Cursors are signed so
+    the balance they carry cannot be altered by the client.
+    """
+
+    def __init__(self, request, ledger, from_date=None, to_date=None):
+        self.request = request
+        self.ledger = ledger
+        self.from_date = from_date
+        self.to_date = to_date
+        self.base_url = request.build_absolute_uri()
+        try:
+            page_size = int(request.query_params.get("page_size", LEDGER_REPORT_PAGE_SIZE))
+        except ValueError:
+            page_size = LEDGER_REPORT_PAGE_SIZE
+        self.page_size = max(1, min(page_size, MAX_LEDGER_REPORT_PAGE_SIZE))
+
+    def decode_cursor(self):
+        encoded = self.request.query_params.get("cursor")
+        if not encoded:
+            return None
+        try:
+            ledger_id, reverse, date, pk, balance, opening = signing.loads(encoded, salt=CURSOR_SALT)
+            cursor = {
+                "reverse": bool(reverse),
+                "date": parse_date(date),
+                "pk": int(pk),
+                "balance": Decimal(balance),
+                "opening_balance": Decimal(opening),
+            }
+        except (signing.BadSignature, TypeError, ValueError, InvalidOperation):
+            raise NotFound("Invalid cursor")
+        if ledger_id != self.ledger.pk or cursor["date"] is None:
+            raise NotFound("Invalid cursor")
+        return cursor
+
+    def encode_cursor(self, row, reverse, balance):
+        payload = [
+            self.ledger.pk,
+            reverse,
+            row["date"].isoformat(),
+            row["id"],
+            str(balance),
+            str(self.opening_balance),
+        ]
+        encoded = signing.dumps(payload, salt=CURSOR_SALT)
+        return replace_query_param(self.base_url, "cursor", encoded)
+
+    def get_queryset(self):
+        queryset = Transaction.objects.filter(ledger=self.ledger)
+        if self.from_date:
+            queryset = queryset.filter(date__gte=self.from_date)
+        if self.to_date:
+            queryset = queryset.filter(date__lte=self.to_date)
+        return queryset
+
+    def rows(self, queryset, start_balance, descending):
+        prefix = "-" if descending else ""
+        ordering = [f"{prefix}date", f"{prefix}id"]
+        running = Window(
+            Sum(signed_amount(), output_field=MONEY),
+            order_by=[F("date").desc(), F("id").desc()] if descending else [F("date").asc(), F("id").asc()],
+        )
+        if descending:
+            # Walking backwards from the balance before the cursor row: a row's
+            # balance is that minus every later row up to the cursor
+            balance = Value(start_balance, output_field=MONEY) - running + signed_amount()
+        else:
+            balance = Value(start_balance, output_field=MONEY) + running
+        return list(
+            queryset.annotate(balance=balance, particulars_name=F("particulars__name"))
+            .order_by(*ordering)
+            .values(*ROW_FIELDS, "particulars_name", "balance")[: self.page_size + 1]
+        )
+
+    def get_page(self):
+        cursor = self.decode_cursor()
+        queryset = self.get_queryset()
+
+        if cursor is None:
+            self.opening_balance = opening_balance(self.ledger, self.from_date)
+            rows = self.rows(queryset, self.opening_balance, descending=False)
+            has_more = len(rows) > self.page_size
+            self.has_next, self.has_previous = has_more, False
+        else:
+            self.opening_balance = cursor["opening_balance"]
+            date, pk = cursor["date"], cursor["pk"]
+            if cursor["reverse"]:
+                queryset = queryset.filter(Q(date__lt=date) | Q(date=date, id__lt=pk))
+                rows = self.rows(queryset, cursor["balance"], descending=True)
+                has_more = len(rows) > self.page_size
+                rows = rows[: self.page_size]
+                rows.reverse()
+                self.has_next, self.has_previous = True, has_more
+            else:
+                queryset = queryset.filter(Q(date__gt=date) | Q(date=date, id__gt=pk))
+                rows = self.rows(queryset, cursor["balance"], descending=False)
+                has_more = len(rows) > self.page_size
+                self.has_next, self.has_previous = has_more, True
+
+        self.page = rows[: self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        last = self.page[-1]
+        return self.encode_cursor(last, reverse=False, balance=last["balance"])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, "cursor")
+        first = self.page[0]
+        balance_before = first["balance"] - (first["debit_amount"] - first["credit_amount"])
+        return self.encode_cursor(first, reverse=True, balance=balance_before)
+
+    def get_data(self):
+        results = self.get_page()
+        return {
+            "ledger": {"id": self.ledger.pk, "name": self.ledger.name},
+            "from_date": self.from_date,
+            "to_date": self.to_date,
+            "opening_balance": self.opening_balance,
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": results,
+        }
+
+
+def ledger_report(request, ledger_id, from_date=None, to_date=None):
+    ledger = Ledger.objects.filter(pk=ledger_id).first()
+    if ledger is None:
+        raise NotFound("Ledger not found.")
+    return LedgerReport(request, ledger, from_date, to_date).get_data()
@@ -0,0 +1,313 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from restaurant_app.models import CreditTransaction, MessTransaction, Order
+from .journal import post_vouchers
+from .models import Ledger, PostingWatermark, SalesJournalChange, SalesPosting
+
+# Every order and receipt that has been posted has a SalesPosting row with
+# the amounts posted for it. A run compares those with the current rows in
+# one query per source and posts only the differences: new deliveries,
+# orders delivered or edited after their day was posted, cancellations and
+# deletions. Whatever happens to a row, and whenever, it is accounted for
+# exactly once.
+#
+# A run only compares the rows dated from the last posted day on, and the
+# older ones marked with a SalesJournalChange since they were saved or
+# deleted, so its cost follows the days being posted rather than the whole
+# history. A full run, for changes made without signals such as
+# queryset.update(), compares every row from the start date.
+
+WATERMARK_KEY = "sales_journal"
+
+MONEY = models.DecimalField(max_digits=10, decimal_places=2)
+
+CHANNELS = ("cash", "bank", "credit")
+
+CHANNEL_LEDGERS = {"cash": "cash", "bank": "bank", "credit": "debtors"}
+
+
+class LedgerNotConfigured(Exception):
+    pass
+
+
+def resolve_ledgers():
+    """Map each posting role to its ledger id using SALES_JOURNAL_LEDGERS."""
+    names = settings.SALES_JOURNAL_LEDGERS
+    found = dict(Ledger.objects.filter(name__in=names.values()).values_list("name", "id"))
+    missing = sorted(name for name in names.values() if name not in found)
+    if missing:
+        raise LedgerNotConfigured(f"Missing ledgers: {', '.join(missing)}")
+    return {role: found[name] for role, name in names.items()}
+
+
+def _amount(*whens):
+    return Case(*whens, default=Value(Decimal(0)), output_field=MONEY)
+
+
+def order_amounts():
+    """What a delivered order brought in through each channel; nothing otherwise."""
+    delivered = Q(status="delivered")
+    return {
+        "cash": _amount(
+            When(delivered & Q(payment_method="cash"), then="total_amount"),
+            When(delivered & Q(payment_method="cash-bank"), then="cash_amount"),
+        ),
+        "bank": _amount(
+            When(delivered & Q(payment_method="bank"), then="total_amount"),
+            When(delivered & Q(payment_method="cash-bank"), then="bank_amount"),
+        ),
+        "credit": _amount(When(delivered & Q(payment_method="credit"), then="total_amount")),
+    }
+
+
+def receipt_amounts():
+    return {
+        "cash": _amount(
+            When(payment_method="cash", then="received_amount"),
+            When(payment_method="cash-bank", then="cash_amount"),
+        ),
+        "bank": _amount(
+            When(payment_method="bank", then="received_amount"),
+            When(payment_method="cash-bank", then="bank_amount"),
+        ),
+        "credit": Value(Decimal(0), output_field=MONEY),
+    }
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+# source: (model, day the row belongs to, its amounts, range filter,
+#          income ledger role, voucher ref, remarks label)
+SOURCES = {
+    "order": (
+        Order,
+        TruncDate("created_at"),
+        order_amounts,
+        lambda start, end: Q(created_at__gte=_start_of(start), created_at__lt=_start_of(end + timedelta(days=1))),
+        "sales",
+        "SALES",
+        "sales",
+    ),
+    "mess_receipt": (
+        MessTransaction,
+        F("date"),
+        receipt_amounts,
+        lambda start, end: Q(date__range=(start, end)),
+        "mess_sales",
+        "MESS",
+        "mess receipts",
+    ),
+    "credit_receipt": (
+        CreditTransaction,
+        F("date"),
+        receipt_amounts,
+        lambda start, end: Q(date__range=(start, end)),
+        "debtors",
+        "CRRCPT",
+        "credit receipts",
+    ),
+}
+
+
+def pending_rows(source, start, through, since=None):
+    """
+    Rows of ``source`` whose current amounts differ from what was posted.
+    With ``since`` only rows dated from it on, or marked as changed, are
+    compared.
+    """
+    model, day, amounts, in_range, *_ = SOURCES[source]
+    postings = SalesPosting.objects.filter(source=source, object_id=OuterRef("pk"))
+    posted = {
+        f"posted_{channel}": Coalesce(
+            Subquery(postings.values(f"{channel}_amount")[:1]),
+            Value(Decimal(0)),
+            output_field=MONEY,
+        )
+        for channel in CHANNELS
+    }
+    changed = Q()
+    for channel in CHANNELS:
+        changed |= ~Q(**{channel: F(f"posted_{channel}")})
+    rows = model.objects.filter(in_range(start, through))
+    if since is not None:
+        rows = rows.filter(
+            in_range(since, through)
+            | Exists(SalesJournalChange.objects.filter(source=source, object_id=OuterRef("pk")))
+        )
+    return (
+        rows.annotate(day=day, **amounts(), **posted, posting_id=Subquery(postings.values("pk")[:1]))
+        .filter(changed)
+        .values("pk", "day", "posting_id", *CHANNELS, *posted)
+        .order_by("pk")
+    )
+
+
+def removed_postings(source, marked_only=False):
+    """Postings whose order or receipt has been deleted since."""
+    model = SOURCES[source][0]
+    postings = SalesPosting.objects.filter(source=source)
+    if marked_only:
+        postings = postings.filter(
+            Exists(SalesJournalChange.objects.filter(source=source, object_id=OuterRef("object_id")))
+        )
+    return postings.exclude(Exists(model.objects.filter(pk=OuterRef("object_id"))))
+
+
+def voucher(day, ref, remarks, debit_ledger, credit_ledger, amount):
+    return {
+        "date": day,
+        "ref_no": f"{ref}-{day:%Y%m%d}",
+        "remarks": remarks,
+        "legs": [
+            {"ledger_id": debit_ledger, "debit_amount": amount, "credit_amount": 0, "balance_amount": 0},
+            {"ledger_id": credit_ledger, "debit_amount": 0, "credit_amount": amount, "balance_amount": 0},
+        ],
+    }
+
+
+def build_vouchers(changes, ledgers):
+    """
+    One two-leg voucher per day, source and channel from the summed
+    differences; a net decrease is posted as a reversal.
+    """
+    vouchers = []
+    for (day, source, channel), (amount, count) in sorted(changes.items()):
+        if not amount:
+            continue
+        _, _, _, _, income, ref, label = SOURCES[source]
+        channel_ledger, income_ledger = ledgers[CHANNEL_LEDGERS[channel]], ledgers[income]
+        remarks = f"{channel.title()} {label} on {day:%d/%m/%Y} ({count} entries)"
+        if amount > 0:
+            vouchers.append(voucher(day, ref, remarks, channel_ledger, income_ledger, amount))
+        else:
+            vouchers.append(
+                voucher(day, ref, f"Reversal of {remarks.lower()}", income_ledger, channel_ledger, -amount)
+            )
+    return vouchers
+
+
+def collect_changes(start, through, since=None):
+    """Sum the differences per (day, source, channel) and the postings to write."""
+    changes = defaultdict(lambda: [Decimal(0), 0])
+    new_postings, updated_postings, deleted_postings = [], [], []
+
+    for source in SOURCES:
+        for row in pending_rows(source, start, through, since).iterator():
+            for channel in CHANNELS:
+                difference = row[channel] - row[f"posted_{channel}"]
+                if difference:
+                    change = changes[row["day"], source, channel]
+                    change[0] += difference
+                    change[1] += 1
+            posting = SalesPosting(
+                pk=row["posting_id"],
+                source=source,
+                object_id=row["pk"],
+                date=row["day"],
+                **{f"{channel}_amount": row[channel] for channel in CHANNELS},
+            )
+            (new_postings if posting.pk is None else updated_postings).append(posting)
+
+        for posting in removed_postings(source, marked_only=since is not None):
+            for channel in CHANNELS:
+                amount = getattr(posting, f"{channel}_amount")
+                if amount:
+                    change = changes[posting.date, source, channel]
+                    change[0] -= amount
+                    change[1] += 1
+            deleted_postings.append(posting.pk)
+
+    return changes, new_postings, updated_postings, deleted_postings
+
+
+def save_postings(new_postings, updated_postings, deleted_postings):
+    now = timezone.now()
+    for posting in new_postings + updated_postings:
+        posting.posted_at = now
+    SalesPosting.objects.bulk_create(new_postings, batch_size=1000)
+    SalesPosting.objects.bulk_update(
+        updated_postings,
+        [f"{channel}_amount" for channel in CHANNELS] + ["posted_at"],
+        batch_size=1000,
+    )
+    SalesPosting.objects.filter(pk__in=deleted_postings).delete()
+
+
+def post_sales_journal(through, from_date=None, full=False):
+    """
+    Post every unposted or changed order and receipt from the job's start
+    date up to ``through``. The first run starts at ``from_date``, or at
+    ``through``; later ones compare the days from the last one posted on
+    and the rows marked as changed, or everything when ``full``. Runs queue
+    on the watermark row, so they never overlap.
+
+    Returns (vouchers posted, orders and receipts posted).
+    """
+    ledgers = resolve_ledgers()
+    # Created before locking it so that even two first runs have a row to queue on
+    PostingWatermark.objects.get_or_create(
+        key=WATERMARK_KEY, defaults={"start_date": from_date or through}
+    )
+    with transaction.atomic():
+        watermark = PostingWatermark.objects.select_for_update().get(key=WATERMARK_KEY)
+        # Locked, so a row changed again meanwhile is marked anew once this
+        # run commits instead of losing its mark
+        marks = list(
+            SalesJournalChange.objects.select_for_update()
+            .filter(date__lte=through)
+            .values_list("pk", flat=True)
+        )
+        # The last posted day is compared again, for rows written without
+        # signals (e.g. bulk settled receipts) after it was posted
+        since = None if full else watermark.posted_through
+        changes, new_postings, updated_postings, deleted_postings = collect_changes(
+            watermark.start_date, through, since
+        )
+        vouchers = build_vouchers(changes, ledgers)
+        if vouchers:
+            post_vouchers(vouchers)
+        save_postings(new_postings, updated_postings, deleted_postings)
+        for start in range(0, len(marks), 1000):
+            SalesJournalChange.objects.filter(pk__in=marks[start:start + 1000]).delete()
+
+        if watermark.posted_through is None or watermark.posted_through < through:
+            watermark.posted_through = through
+            watermark.save(update_fields=["posted_through"])
+    return len(vouchers), len(new_postings) + len(updated_postings) + len(deleted_postings)
+
+
+def row_date(instance):
+    if isinstance(instance, Order):
+        return timezone.localdate(instance.created_at)
+    return instance.date
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=MessTransaction)
+@receiver(post_save, sender=CreditTransaction)
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=MessTransaction)
+@receiver(post_delete, sender=CreditTransaction)
+def mark_for_sales_journal(sender, instance, created=False, **kwargs):
+    # New rows are dated on a day the next run compares in full anyway
+    if created:
+        return
+    source = next(name for name, (model, *_) in SOURCES.items() if model is sender)
+    # Updating the mark waits for a run holding it, so the change is
+    # marked again after that run rather than dropped with its mark
+    SalesJournalChange.objects.bulk_create(
+        [SalesJournalChange(source=source, object_id=instance.pk, date=row_date(instance))],
+        update_conflicts=True,
+        unique_fields=["source", "object_id"],
+        update_fields=["date"],
+    )
@@ -30,15 +30,121 @@ class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
         fields = '__all__'
+        # create() assigns it from the voucher sequence
+        extra_kwargs = {'voucher_no': {'required': False}}
 
 
+# Flat read shapes (?shape=flat): related names are inlined from the
+# select_related joins instead of nesting a serializer per relation
+
+class FlatMainGroupSerializer(serializers.ModelSerializer):
+    nature_group_name = serializers.CharField(source='nature_group.name', read_only=True)
+
+    class Meta:
+        model = MainGroup
+        fields = ['id', 'name', 'nature_group_id', 'nature_group_name']
+
+
+class FlatLedgerSerializer(serializers.ModelSerializer):
+    group_name = serializers.CharField(source='group.name', read_only=True)
+    nature_group_id = serializers.IntegerField(source='group.nature_group_id', read_only=True)
+    nature_group_name = serializers.CharField(source='group.nature_group.name', read_only=True)
+
+    class Meta:
+        model = Ledger
+        fields = [
+            'id', 'name', 'mobile_no', 'opening_balance', 'date', 'debit_credit',
+            'group_id', 'group_name', 'nature_group_id', 'nature_group_name',
+        ]
+
+
+class FlatTransactionSerializer(serializers.ModelSerializer):
+    ledger_name = serializers.CharField(source='ledger.name', read_only=True)
+    ledger_group_name = serializers.CharField(source='ledger.group.name', read_only=True)
+    ledger_nature_group_name = serializers.CharField(source='ledger.group.nature_group.name', read_only=True)
+    particulars_name = serializers.CharField(source='particulars.name', read_only=True)
+    particulars_group_name = serializers.CharField(source='particulars.group.name', read_only=True)
+
+    class Meta:
+        model = Transaction
+        fields = [
+            'id', 'date', 'voucher_no', 'ref_no', 'remarks', 'debit_credit',
+            'debit_amount', 'credit_amount', 'balance_amount',
+            'ledger_id', 'ledger_name', 'ledger_group_name', 'ledger_nature_group_name',
+            'particulars_id', 'particulars_name', 'particulars_group_name',
+        ]
+
+
+class JournalLegSerializer(serializers.Serializer):
+    ledger_id = serializers.IntegerField()
+    particulars_id = serializers.IntegerField(required=False)
+    debit_amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, default=0)
+    credit_amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, default=0)
+    balance_amount = serializers.DecimalField(max_digits=10, decimal_places=2, default=0)
+    remarks = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    def validate(self, attrs):
+        if bool(attrs['debit_amount']) == bool(attrs['credit_amount']):
+            raise serializers.ValidationError("Each leg needs either a debit or a credit amount.")
+        return attrs
+
+
+class JournalBatchSerializer(serializers.ListSerializer):
+
+    def validate(self, attrs):
+        # Check every referenced ledger with one query for the whole batch
+        ledger_ids = {
+            ledger_id
+            for voucher in attrs
+            for leg in voucher['legs']
+            for ledger_id in (leg['ledger_id'], leg.get('particulars_id'))
+            if ledger_id
+        }
+        missing = ledger_ids - set(Ledger.objects.filter(pk__in=ledger_ids).values_list('pk', flat=True))
+        if missing:
+            raise serializers.ValidationError(f"Unknown ledgers: {sorted(missing)}")
+        return attrs
+
+
+class JournalVoucherSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    ref_no = serializers.CharField(max_length=15, required=False, allow_blank=True, allow_null=True)
+    remarks = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    legs = JournalLegSerializer(many=True)
+
+    class Meta:
+        list_serializer_class = JournalBatchSerializer
+
+    def validate_legs(self, legs):
+        if len(legs) < 2:
+            raise serializers.ValidationError("A voucher needs at least two legs.")
+        debit = sum(leg['debit_amount'] for leg in legs)
+        credit = sum(leg['credit_amount'] for leg in legs)
+        if debit != credit:
+            raise serializers.ValidationError(f"Debits ({debit}) and credits ({credit}) must balance.")
+        return legs
+
 
 class IncomeStatementSerializer(serializers.ModelSerializer):
     class Meta:
         model = IncomeStatement
         fields = '__all__'
 
+class FlatIncomeStatementSerializer(serializers.ModelSerializer):
+    ledger_name = serializers.CharField(source='ledger.name', read_only=True)
+
+    class Meta:
+        model = IncomeStatement
+        fields = ['id', 'ledger_id', 'ledger_name', 'income_type', 'amount']
+
 class BalanceSheetSerializer(serializers.ModelSerializer):
     class Meta:
         model = BalanceSheet
         fields = '__all__'
+
+class FlatBalanceSheetSerializer(serializers.ModelSerializer):
+    ledger_name = serializers.CharField(source='ledger.name', read_only=True)
+
+    class Meta:
+        model = BalanceSheet
+        fields = ['id', 'ledger_id', 'ledger_name', 'balance_type', 'amount']
@@ -1,3 +1,305 @@
+from datetime import date, datetime
+from decimal import Decimal
+from unittest import mock
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.db.models import F, Sum
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from restaurant_app.models import CreditTransaction, Order, User
+from transactions_app.balances import balance_as_of, rebuild_balances
+from transactions_app.models import (
+    Ledger,
+    LedgerDailyBalance,
+    MainGroup,
+    NatureGroup,
+    PostingWatermark,
+    SalesJournalChange,
+    Transaction,
+    VoucherSequence,
+)
+from transactions_app.sales_journal import post_sales_journal
 
-# Create your tests here.
+
+class LedgerTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username="staff", email="staff@example.com", role="staff", passcode="111111"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        group = MainGroup.objects.create(
+            name="Current Assets", nature_group=NatureGroup.objects.create(name="Assets")
+        )
+        self.cash, self.bank, self.sales = [
+            Ledger.objects.create(name=name, group=group) for name in ("Cash", "Bank", "Sales")
+        ]
+
+    def post_voucher(self, debit_ledger, credit_ledger, amount, day="2026-10-01"):
+        return self.client.post(
+            "/api/transactions/",
+            {
+                "transaction1": {
+                    "ledger_id": debit_ledger.pk, "particulars_id": credit_ledger.pk, "date": day,
+                    "debit_credit": "debit", "debit_amount": amount,
+                },
+                "transaction2": {
+                    "ledger_id": credit_ledger.pk, "particulars_id": debit_ledger.pk, "date": day,
+                    "debit_credit": "credit", "credit_amount": amount,
+                },
+            },
+            format="json",
+        )
+
+
+class VoucherNumberTests(LedgerTestCase):
+    def test_rejected_voucher_uses_no_number(self):
+        response = self.post_voucher(self.cash, self.sales, "10.00")
+        self.assertEqual(response.status_code, 201, response.data)
+        first = response.data["voucher_no"]
+
+        bad = self.client.post(
+            "/api/transactions/",
+            {
+                "transaction1": {"ledger_id": self.cash.pk, "particulars_id": self.sales.pk, "date": "2026-10-01", "debit_credit": "debit"},
+                "transaction2": {"ledger_id": 999999, "particulars_id": self.cash.pk, "date": "2026-10-01", "debit_credit": "credit"},
+            },
+            format="json",
+        )
+        self.assertEqual(bad.status_code, 400)
+
+        response = self.post_voucher(self.cash, self.sales, "5.00")
+        self.assertEqual(response.data["voucher_no"], first + 1)
+        self.assertEqual(
+            set(Transaction.objects.values_list("voucher_no", flat=True)), {first, first + 1}
+        )
+
+    def test_number_is_reserved_outside_the_posting(self):
+        first = self.post_voucher(self.cash, self.sales, "10.00").data["voucher_no"]
+        # The counter commits on its own, so a posting that fails after it
+        # skips its number instead of holding the counter row while it runs
+        with mock.patch("transactions_app.balances.apply_delta", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.post_voucher(self.cash, self.sales, "5.00")
+        self.assertEqual(VoucherSequence.objects.get().last_value, first + 1)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+        response = self.post_voucher(self.cash, self.sales, "5.00")
+        self.assertEqual(response.data["voucher_no"], first + 2)
+
+
+class LedgerDailyBalanceTests(LedgerTestCase):
+    def snapshots(self):
+        return set(
+            LedgerDailyBalance.objects.values_list(
+                "ledger", "date", "debit_amount", "credit_amount", "cumulative_balance"
+            )
+        )
+
+    def test_back_dated_postings_shift_later_days(self):
+        self.post_voucher(self.cash, self.sales, "100.00", day="2026-10-05")
+        self.post_voucher(self.bank, self.sales, "40.00", day="2026-10-03")
+        # Back-dated onto a day with no row yet, before days that have one
+        self.post_voucher(self.cash, self.sales, "25.00", day="2026-10-01")
+        self.post_voucher(self.sales, self.cash, "10.00", day="2026-10-04")
+
+        self.assertEqual(balance_as_of(self.cash, date(2026, 10, 1)), Decimal("25.00"))
+        self.assertEqual(balance_as_of(self.cash, date(2026, 10, 4)), Decimal("15.00"))
+        self.assertEqual(balance_as_of(self.cash, date(2026, 10, 31)), Decimal("115.00"))
+        self.assertEqual(balance_as_of(self.sales, date(2026, 10, 31)), Decimal("-155.00"))
+
+        maintained = self.snapshots()
+        rebuild_balances()
+        self.assertEqual(maintained, self.snapshots())
+
+    def test_edits_and_deletes_move_the_amounts(self):
+        self.post_voucher(self.cash, self.sales, "100.00", day="2026-10-05")
+        posting = Transaction.objects.get(ledger=self.cash)
+        posting.date = date(2026, 10, 2)
+        posting.debit_amount = Decimal("80.00")
+        posting.save()
+        Transaction.objects.get(ledger=self.sales).delete()
+
+        self.assertEqual(balance_as_of(self.cash, date(2026, 10, 2)), Decimal("80.00"))
+        self.assertEqual(balance_as_of(self.sales, date(2026, 10, 5)), Decimal("0.00"))
+        maintained = self.snapshots()
+        rebuild_balances()
+        self.assertEqual(
+            {row for row in maintained if row[2] or row[3]}, self.snapshots()
+        )
+
+    def test_deleting_a_ledger_with_postings(self):
+        self.post_voucher(self.cash, self.sales, "100.00", day="2026-10-05")
+        self.post_voucher(self.bank, self.sales, "40.00", day="2026-10-03")
+        self.post_voucher(self.cash, self.bank, "10.00", day="2026-10-04")
+
+        response = self.client.delete(f"/api/ledgers/{self.cash.pk}/")
+        self.assertIn(response.status_code, (200, 204))
+        self.assertFalse(LedgerDailyBalance.objects.filter(ledger_id=self.cash.pk).exists())
+        # The other legs of the cash vouchers were deleted with it
+        self.assertEqual(balance_as_of(self.sales, date(2026, 10, 31)), Decimal("-40.00"))
+        self.assertEqual(balance_as_of(self.bank, date(2026, 10, 31)), Decimal("40.00"))
+        maintained = self.snapshots()
+        rebuild_balances()
+        self.assertEqual({row for row in maintained if row[2] or row[3]}, self.snapshots())
+
+        self.sales.group.delete()
+        self.assertFalse(LedgerDailyBalance.objects.exists())
+
+
+class LedgerReportTests(LedgerTestCase):
+    def setUp(self):
+        super().setUp()
+        Ledger.objects.filter(pk=self.cash.pk).update(
+            opening_balance=Decimal("50.00"), debit_credit="DEBIT"
+        )
+        self.cash.refresh_from_db()
+        # Before the report range: only part of the opening balance
+        self.post_voucher(self.cash, self.sales, "20.00", day="2026-09-30")
+        for day, amount in [("2026-10-01", "10.00"), ("2026-10-01", "5.00"), ("2026-10-02", "7.50"),
+                            ("2026-10-03", "12.00"), ("2026-10-04", "3.25")]:
+            self.post_voucher(self.cash, self.sales, amount, day=day)
+        self.post_voucher(self.bank, self.cash, "8.00", day="2026-10-03")
+
+    def report(self, url=None, **params):
+        if url:
+            response = self.client.get(url)
+        else:
+            response = self.client.get("/api/transactions/ledger_report/", params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_running_balance_carries_across_cursor_pages(self):
+        data = self.report(ledger=self.cash.pk, from_date="2026-10-01", page_size=2)
+        self.assertEqual(data["opening_balance"], Decimal("70.00"))
+        self.assertIsNone(data["previous"])
+
+        pages = [data["results"]]
+        while data["next"]:
+            data = self.report(data["next"])
+            pages.append(data["results"])
+        rows = [row for page in pages for row in page]
+        self.assertEqual([len(page) for page in pages], [2, 2, 2])
+
+        expected = Decimal("70.00")
+        for row in rows:
+            expected += row["debit_amount"] - row["credit_amount"]
+            self.assertEqual(row["balance"], expected)
+        self.assertEqual(expected, balance_as_of(self.cash, date(2026, 10, 31)))
+        self.assertEqual(
+            [row["particulars_name"] for row in rows], ["Sales"] * 4 + ["Bank", "Sales"]
+        )
+        self.assertEqual(rows[4]["credit_amount"], Decimal("8.00"))
+
+        # Walking back gives the same pages and balances
+        previous = self.report(data["previous"])
+        self.assertEqual(previous["results"], pages[1])
+        self.assertEqual(self.report(previous["previous"])["results"], pages[0])
+
+    def test_tampered_cursor_is_rejected(self):
+        data = self.report(ledger=self.cash.pk, page_size=2)
+        response = self.client.get(data["next"].replace("cursor=", "cursor=x"))
+        self.assertEqual(response.status_code, 404)
+
+
+class SalesJournalTests(LedgerTestCase):
+    day = date(2026, 10, 10)
+
+    def setUp(self):
+        super().setUp()
+        group = self.cash.group
+        self.debtors = Ledger.objects.create(name="Sundry Debtors", group=group)
+        Ledger.objects.create(name="Mess Sales", group=group)
+
+    def order(self, amount, payment_method="cash", status="delivered", **fields):
+        order = Order.objects.create(
+            user=self.user, total_amount=Decimal(amount), payment_method=payment_method,
+            status=status, **fields,
+        )
+        created_at = timezone.make_aware(datetime.combine(self.day, datetime.min.time().replace(hour=13)))
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        order.created_at = created_at
+        return order
+
+    def balance(self, ledger):
+        totals = Transaction.objects.filter(ledger=ledger).aggregate(
+            balance=Sum(F("debit_amount") - F("credit_amount"))
+        )
+        return totals["balance"] or 0
+
+    def test_each_order_is_posted_once(self):
+        self.order("100.00")
+        self.order("40.00", "bank")
+        self.order("30.00", "cash-bank", cash_amount=Decimal("10.00"), bank_amount=Decimal("20.00"))
+        self.order("25.00", "credit")
+        self.order("999.00", status="pending")
+
+        self.assertEqual(post_sales_journal(self.day), (3, 4))
+        self.assertEqual(self.balance(self.cash), Decimal("110.00"))
+        self.assertEqual(self.balance(self.bank), Decimal("60.00"))
+        self.assertEqual(self.balance(self.debtors), Decimal("25.00"))
+        self.assertEqual(self.balance(self.sales), Decimal("-195.00"))
+        self.assertEqual(set(Transaction.objects.values_list("date", flat=True)), {self.day})
+
+        posted = Transaction.objects.count()
+        self.assertEqual(post_sales_journal(self.day), (0, 0))
+        call_command("post_sales_journal", "--through", "2026-10-11")
+        self.assertEqual(Transaction.objects.count(), posted)
+        self.assertEqual(PostingWatermark.objects.get().posted_through, date(2026, 10, 11))
+
+    def test_changes_after_posting_are_posted_as_differences(self):
+        late = self.order("50.00", status="pending")
+        edited = self.order("100.00")
+        cancelled = self.order("30.00", "bank")
+        deleted = self.order("20.00")
+        post_sales_journal(self.day)
+
+        # Delivered after its day was posted, edited, cancelled and deleted
+        late.status = "delivered"
+        late.save()
+        edited.total_amount = Decimal("80.00")
+        edited.save()
+        cancelled.status = "cancelled"
+        cancelled.save()
+        deleted.delete()
+        post_sales_journal(date(2026, 10, 11))
+
+        self.assertEqual(self.balance(self.cash), Decimal("130.00"))
+        self.assertEqual(self.balance(self.bank), Decimal("0.00"))
+        self.assertEqual(self.balance(self.sales), Decimal("-130.00"))
+        self.assertEqual(post_sales_journal(date(2026, 10, 11)), (0, 0))
+
+    def test_receipts_are_posted_by_channel(self):
+        post_sales_journal(self.day)
+        receipt = CreditTransaction.objects.create(
+            received_amount=Decimal("70.00"), payment_method="cash-bank",
+            cash_amount=Decimal("30.00"), bank_amount=Decimal("40.00"), status="completed",
+        )
+        post_sales_journal(receipt.date)
+        self.assertEqual(self.balance(self.cash), Decimal("30.00"))
+        self.assertEqual(self.balance(self.bank), Decimal("40.00"))
+        self.assertEqual(self.balance(self.debtors), Decimal("-70.00"))
+
+    def test_later_runs_compare_only_recent_and_changed_rows(self):
+        edited = self.order("100.00")
+        deleted = self.order("20.00")
+        quietly_edited = self.order("10.00")
+        post_sales_journal(self.day)
+        post_sales_journal(date(2026, 10, 12))
+
+        edited.total_amount = Decimal("80.00")
+        edited.save()
+        deleted.delete()
+        # queryset.update() sends no signal, so only a full run sees it
+        Order.objects.filter(pk=quietly_edited.pk).update(total_amount=Decimal("15.00"))
+        self.assertEqual(SalesJournalChange.objects.count(), 2)
+
+        self.assertEqual(post_sales_journal(date(2026, 10, 13)), (1, 2))
+        self.assertEqual(self.balance(self.cash), Decimal("90.00"))
+        self.assertFalse(SalesJournalChange.objects.exists())
+        self.assertEqual(post_sales_journal(date(2026, 10, 13)), (0, 0))
+
+        call_command("post_sales_journal", "--through", "2026-10-13", "--full")
+        self.assertEqual(self.balance(self.cash), Decimal("95.00"))
+        self.assertEqual(self.balance(self.sales), Decimal("-95.00"))
@@ -12,31 +12,91 @@ from .serializers import (
      MainGroupSerializer, 
      LedgerSerializer, 
      TransactionSerializer,
+     JournalVoucherSerializer,
      IncomeStatementSerializer, 
      BalanceSheetSerializer,
+     FlatMainGroupSerializer,
+     FlatLedgerSerializer,
+     FlatTransactionSerializer,
+     FlatIncomeStatementSerializer,
+     FlatBalanceSheetSerializer,
      )
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from django.utils import timezone
 from django.utils.dateparse import parse_date
+from restaurant_app.pagination import PageNumberOrKeysetPagination
+from .journal import allocate_voucher_numbers, post_vouchers
+from .reports import ledger_report
+from .balances import signed_opening_balance, with_balances_as_of
+
+class FlatShapeMixin:
+    """
+    Reads return ``flat_serializer_class`` when asked for ``?shape=flat``;
+    querysets select every related row the serializers touch, so a page
+    costs the same number of queries whatever its size.
+    """
+
+    flat_serializer_class = None
+
+    def get_serializer_class(self):
+        if (
+            self.flat_serializer_class is not None
+            and self.request.method in ('GET', 'HEAD')
+            and self.request.query_params.get('shape') == 'flat'
+        ):
+            return self.flat_serializer_class
+        return super().get_serializer_class()
+
 
 class NatureGroupViewSet(viewsets.ModelViewSet):
     queryset = NatureGroup.objects.all()
     serializer_class = NatureGroupSerializer
 
-class MainGroupViewSet(viewsets.ModelViewSet):
-    queryset = MainGroup.objects.all()
+class MainGroupViewSet(FlatShapeMixin, viewsets.ModelViewSet):
+    queryset = MainGroup.objects.select_related('nature_group')
     serializer_class = MainGroupSerializer
+    flat_serializer_class = FlatMainGroupSerializer
 
-class LedgerViewSet(viewsets.ModelViewSet):
-    queryset = Ledger.objects.all()
+class LedgerViewSet(FlatShapeMixin, viewsets.ModelViewSet):
+    queryset = Ledger.objects.select_related('group__nature_group')
     serializer_class = LedgerSerializer
+    flat_serializer_class = FlatLedgerSerializer
 
-
-class TransactionViewSet(viewsets.ModelViewSet):
-    queryset = Transaction.objects.all()
+    @action(detail=False, methods=['get'])
+    def balances(self, request):
+        # Every ledger's closing balance as of ?date= (default today), read
+        # from the daily balance snapshots
+        as_of = request.query_params.get('date', None)
+        as_of = parse_date(as_of) if as_of else timezone.localdate()
+        if as_of is None:
+            return Response({"error": "date must be in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
+
+        ledgers = with_balances_as_of(self.get_queryset(), as_of)
+        return Response({
+            "date": as_of,
+            "results": [
+                {
+                    "id": ledger.id,
+                    "name": ledger.name,
+                    "group": ledger.group.name,
+                    "nature_group": ledger.group.nature_group.name,
+                    "balance": signed_opening_balance(ledger) + (ledger.cumulative_balance or 0),
+                }
+                for ledger in ledgers
+            ],
+        })
+
+
+class TransactionViewSet(FlatShapeMixin, viewsets.ModelViewSet):
+    queryset = Transaction.objects.select_related(
+        'ledger__group__nature_group', 'particulars__group__nature_group'
+    )
     serializer_class = TransactionSerializer
+    flat_serializer_class = FlatTransactionSerializer
+    pagination_class = PageNumberOrKeysetPagination
+    keyset_ordering = "-date"
 
-    @transaction.atomic
     def create(self, request, *args, **kwargs):
         transaction1_data = request.data.get('transaction1')
         transaction2_data = request.data.get('transaction2')
@@ -44,64 +104,60 @@ class TransactionViewSet(viewsets.ModelViewSet):
         if not transaction1_data or not transaction2_data:
             return Response({"error": "Both transaction1 and transaction2 are required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Generate the next voucher number
-        last_transaction = Transaction.objects.order_by('-voucher_no').first()
-        next_voucher_no = (last_transaction.voucher_no + 1) if last_transaction else 1
-
-        # Assign the generated voucher number to both transactions
-        transaction1_data['voucher_no'] = next_voucher_no
-        transaction2_data['voucher_no'] = next_voucher_no
-
         serializer1 = self.get_serializer(data=transaction1_data)
         serializer1.is_valid(raise_exception=True)
-        self.perform_create(serializer1)
-
         serializer2 = self.get_serializer(data=transaction2_data)
         serializer2.is_valid(raise_exception=True)
-        self.perform_create(serializer2)
+
+        # Numbered only once both legs are valid, so rejected requests leave
+        # no gaps. Reserved before the transaction, as post_vouchers does, so
+        # the counter row is not held while the legs and balances are
+        # written; a database failure below skips the number.
+        next_voucher_no = allocate_voucher_numbers(1)[0]
+        with transaction.atomic():
+            serializer1.save(voucher_no=next_voucher_no)
+            serializer2.save(voucher_no=next_voucher_no)
 
         return Response(serializer1.data, status=status.HTTP_201_CREATED) 
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        # Accepts a list of balanced multi-leg vouchers, posted all or nothing
+        serializer = JournalVoucherSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        posted = post_vouchers(serializer.validated_data)
+        return Response(
+            [
+                {"voucher_no": voucher_no, "transaction_ids": [leg.id for leg in legs]}
+                for voucher_no, legs in posted
+            ],
+            status=status.HTTP_201_CREATED,
+        )
+
     @action(detail=False, methods=['get'])
     def ledger_report(self, request):
+        # Flat statement rows with a running balance, paged with ?cursor=
         ledger_id = request.query_params.get('ledger', None)
         from_date = request.query_params.get('from_date', None)
         to_date = request.query_params.get('to_date', None)
 
         # Ensure ledger_id is provided
-        if not ledger_id:
-            return Response([])
+        if not ledger_id or not ledger_id.isdigit():
+            return Response({"error": "ledger is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Filter transactions by ledger
-        queryset = self.queryset.filter(ledger__id=ledger_id)
+        # Parse the from_date and to_date strings into date objects
+        from_date = parse_date(from_date) if from_date else None
+        to_date = parse_date(to_date) if to_date else None
 
-        # If no transactions match the ledger, return an empty list
-        if not queryset.exists():
-            return Response([])
+        return Response(ledger_report(request, int(ledger_id), from_date, to_date))
 
-        # Parse the from_date and to_date strings into date objects
-        if from_date:
-            from_date = parse_date(from_date)
-        if to_date:
-            to_date = parse_date(to_date)
-
-        # Filter further by date range if provided
-        if from_date and to_date:
-            queryset = queryset.filter(date__range=(from_date, to_date))
-        elif from_date:
-            queryset = queryset.filter(date__gte=from_date)
-        elif to_date:
-            queryset = queryset.filter(date__lte=to_date)
-
-        # Serialize the filtered queryset
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
-
-
-class IncomeStatementViewSet(viewsets.ModelViewSet):
-    queryset = IncomeStatement.objects.all()
+
+class IncomeStatementViewSet(FlatShapeMixin, viewsets.ModelViewSet):
+    queryset = IncomeStatement.objects.select_related('ledger')
     serializer_class = IncomeStatementSerializer
+    flat_serializer_class = FlatIncomeStatementSerializer
 
-class BalanceSheetViewSet(viewsets.ModelViewSet):
-    queryset = BalanceSheet.objects.all()
+class BalanceSheetViewSet(FlatShapeMixin, viewsets.ModelViewSet):
+    queryset = BalanceSheet.objects.select_related('ledger')
     serializer_class = BalanceSheetSerializer
+    flat_serializer_class = FlatBalanceSheetSerializer